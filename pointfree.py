@@ -69,8 +69,6 @@ helpers provided by this module.
 
 """
 
-from __future__ import print_function
-
 __author__  = "Mark Shroyer"
 __email__   = "code@markshroyer.com"
 __version__ = "1.1.1"
@@ -86,16 +84,183 @@ __all__ = [
     'pfprint',
     'pfprint_all',
     'pfignore_all',
+    'pfstaged',
+    'pfmap_adaptive',
+    'AdaptiveStats',
+    'pfsum',
+    'pfcount',
+    'pfmin',
+    'pfmax',
+    'pfminmax',
+    'pfmean',
+    'pfaggregate',
+    'Aggregator',
+    'CountAggregator',
+    'SumAggregator',
+    'MinAggregator',
+    'MaxAggregator',
+    'MinMaxAggregator',
+    'MeanAggregator',
+    'ListAggregator',
+    'FoldAggregator',
+    'StatsAggregator',
+    'TopKAggregator',
+    'DistinctCountAggregator',
+    'QuantilesAggregator',
+    'SampleAggregator',
+    'FrequentAggregator',
+    'pfmemo',
+    'MemoCache',
+    'pfdiskmemo',
+    'DiskMemoCache',
+    'IncrementalPipeline',
+    'PipelineDAG',
+    'pfbroadcast',
+    'pfmerge',
+    'pfsort',
+    'pfgroupby',
+    'pfjoin',
+    'pfchunk',
+    'pfwindow',
+    'pfpairwise',
+    'pftumbling',
+    'pfsliding',
+    'pfscan',
+    'pfstats',
+    'pfrunning_stats',
+    'Stats',
+    'pftop',
+    'pfbottom',
+    'pfcount_distinct',
+    'pfquantiles',
+    'pfsample',
+    'pffrequent',
+    'pfunique',
+    'pfwrite_lines',
+    'pfread_lines',
+    'pfread_sharded',
+    'pfrecords',
+    'pfsplit_bytes',
+    'pffields',
+    'pfstrip_bytes',
+    'pfdecode',
+    'pfdecompress',
+    'pfcompress',
+    'pfsplit_lines',
     ]
 
-import sys, inspect, types, itertools, functools
+import sys, os, time, math, copy, inspect, types, itertools, functools, collections
+import bisect, hashlib, heapq, operator, pickle, queue, random, struct, tempfile
+import threading, weakref
+import collections.abc
+
+from inspect import getfullargspec
+
+# Separates positional from keyword arguments in memo keys.
+_kwd_mark = object()
+
+# The signature of each partial descriptor's function once bound, as a
+# (type of bound function, signature) pair, keyed by the descriptor.  Kept
+# outside the instances, which are never mutated.
+_bound_sigs = weakref.WeakKeyDictionary()
+
+class _memoized(object):
+    """Wraps a function so that its results are looked up in, and stored
+    to, a cache.  Used as the wrapped function of a partial instance, which
+    always calls it with the fully resolved argument set.
+
+    The wrapped function and cache are kept in ``__wrapped__`` and
+    ``memo``, as partial copies the ``__dict__`` of whatever it wraps.
+
+    Given a factory making new caches, each instance a method is bound to
+    gets a cache of its own, made on first use and dropped along with the
+    instance; its keys leave out the instance, so that the cache doesn't
+    keep it alive.  Instances which can't be weakly referenced, like those
+    of classes with ``__slots__``, share the cache given here instead."""
+
+    def __init__(self, func, memo, factory=None, skip=0):
+        functools.update_wrapper(self, func)
+        self.memo = memo
+        self._factory = factory
+        self._skip = skip
+        self._instances = {}
 
-# No getfullargspec in Python 2, since there are no keyword-only arguments.
-if hasattr(inspect, 'getfullargspec'):
-    from inspect import getfullargspec
-else:
-    def getfullargspec(f):
-        return inspect.getargspec(f) + ([], None, {})
+    def __get__(self, inst, owner=None):
+        if inst is None:
+            return self
+        return types.MethodType(self._for_instance(inst), inst)
+
+    def _for_instance(self, inst):
+        if self._factory is None:
+            return self
+        key = id(inst)
+        memoized = self._instances.get(key)
+        if memoized is None:
+            try:
+                weakref.finalize(inst, self._instances.pop, key, None)
+            except TypeError:
+                return self
+            memoized = self._instances.setdefault(
+                key, _memoized(self.__wrapped__, self._factory(), skip=1))
+        return memoized
+
+    def __call__(self, *pargs, **kargs):
+        key = _memo_key(pargs[self._skip:], kargs)
+        try:
+            found, value = self.memo.get(key)
+        except TypeError:
+            # Unhashable arguments can't be cached.
+            return self.__wrapped__(*pargs, **kargs)
+
+        if not found:
+            value = self.__wrapped__(*pargs, **kargs)
+            self.memo.put(key, value)
+        return value
+
+    def call_many(self, inst, items):
+        """Applies the partial instance inst, which wraps this object, to
+        each of the given items, yielding the results one at a time, with
+        one batched cache lookup for the whole list and one batched store
+        of the results computed -- which happens even if a call raises or
+        the caller stops early."""
+
+        calls = [inst._resolve_args((item,), {}) for item in items]
+        try:
+            if any(fpargs is None for new_argv, fpargs, fkargs in calls):
+                raise TypeError("not a function of one argument")
+            keys = [_memo_key(fpargs[self._skip:], fkargs)
+                    for new_argv, fpargs, fkargs in calls]
+            for key in keys:
+                hash(key)
+            found = self.memo.get_many(keys)
+        except TypeError:
+            # Unhashable or unpicklable arguments can't be cached.
+            for item in items:
+                yield inst(item)
+            return
+
+        computed = {}
+        try:
+            for key, (new_argv, fpargs, fkargs) in zip(keys, calls):
+                if key in found:
+                    yield found[key]
+                elif key in computed:
+                    yield computed[key]
+                else:
+                    value = computed[key] = self.__wrapped__(*fpargs, **fkargs)
+                    yield value
+        finally:
+            if computed:
+                self.memo.put_many(list(computed.items()))
+
+def _memo_key(pargs, kargs):
+    key = tuple(pargs)
+    if kargs:
+        key += (_kwd_mark,) + tuple(sorted(kargs.items()))
+    return key
+
+def _unwrap_memo(func):
+    return func.__wrapped__ if isinstance(func, _memoized) else func
 
 class partial(object):
     """Wraps a regular Python function or method into a callable object
@@ -330,27 +495,35 @@ class partial(object):
 
     """
 
+    # Instances are never mutated once __init__ returns: calls compute new
+    # argument dicts and return fresh copies, and the signature attributes
+    # (pargl, kargl, def_argv, var_pargs, var_kargs) are shared read-only
+    # between an instance and all of its copies.  This keeps instances safe
+    # to share between threads without locking, including on free-threaded
+    # builds of CPython.  (The bound signatures cached by __get__ live in
+    # the module's _bound_sigs, not in the instances.)
+
     def __init__(self, func, *pargs, **kargs):
         self.func = func
-        self.argv = {}
-        self.extra_argv = []
+        argv = {}
+        extra_argv = []
         self.__call_error = None
 
         if isinstance(func, partial):
             self.func = func.func
             functools.update_wrapper(self, self.func)
             inst = func
-            self.argv = inst.argv
-            self.extra_argv = inst.extra_argv
+            argv = inst.argv
+            extra_argv = inst.extra_argv
             self.__sig_from_partial(inst)
 
         elif isinstance(func, functools.partial):
             self.func = func.func
             functools.update_wrapper(self, self.func)
             self.__sig_from_func(self.func)
-            partial_args = func.args or ()
-            partial_keywords = func.keywords or {}
-            self.__update_argv(*partial_args, **partial_keywords)
+            argv, extra_argv = self.__new_argv(argv, extra_argv,
+                                               func.args or (),
+                                               func.keywords or {})
 
         elif isinstance(func, classmethod) or isinstance(func, staticmethod):
             self.__call_error = "'%s' object is not callable" % type(func).__name__
@@ -359,7 +532,7 @@ class partial(object):
             functools.update_wrapper(self, func)
             self.__sig_from_func(func)
 
-        self.__update_argv(*pargs, **kargs)
+        self.argv, self.extra_argv = self.__new_argv(argv, extra_argv, pargs, kargs)
 
     def __sig_from_func(self, func):
         """Extract function signature, default arguments, keyword-only
@@ -371,37 +544,41 @@ class partial(object):
 
         if isinstance(func, types.MethodType):
             # A bound instance or class method.
-            argspec = getfullargspec(func.__func__)
-            self.pargl = argspec[0][1:]
+            argspec = getfullargspec(_unwrap_memo(func.__func__))
+            self.pargl = tuple(argspec[0][1:])
         else:
             # A regular function, an unbound instance method, or a
             # bound static method.
-            argspec = getfullargspec(func)
-            self.pargl = argspec[0][:]
+            argspec = getfullargspec(_unwrap_memo(func))
+            self.pargl = tuple(argspec[0])
 
         if argspec[3] is not None:
             def_offset = len(self.pargl) - len(argspec[3])
-            self.def_argv = dict((self.pargl[def_offset+i],argspec[3][i]) \
-                                     for i in range(len(argspec[3])))
+            def_argv = dict((self.pargl[def_offset+i],argspec[3][i]) \
+                                for i in range(len(argspec[3])))
         else:
-            self.def_argv = {}
+            def_argv = {}
 
         self.var_pargs = argspec[1] is not None
         self.var_kargs = argspec[2] is not None
-        self.kargl     = argspec[4]
+        self.kargl     = tuple(argspec[4])
 
         # We need keyword-only arguments' default values too.
         if argspec[5] is not None:
-            self.def_argv.update(argspec[5])
+            def_argv.update(argspec[5])
+        self.def_argv = def_argv
 
     def __sig_from_partial(self, inst):
-        """Extract function signature from an existing partial instance."""
+        """Share the function signature of an existing partial instance."""
+
+        self.__set_sig(inst.__get_sig())
+
+    def __get_sig(self):
+        return (self.pargl, self.kargl, self.def_argv,
+                self.var_pargs, self.var_kargs)
 
-        self.pargl     = list(inst.pargl)
-        self.kargl     = list(inst.kargl)
-        self.def_argv  = inst.def_argv.copy()
-        self.var_pargs = inst.var_pargs
-        self.var_kargs = inst.var_kargs
+    def __set_sig(self, sig):
+        self.pargl, self.kargl, self.def_argv, self.var_pargs, self.var_kargs = sig
 
     @classmethod
     def make_copy(klass, inst, func=None, argv=None, extra_argv=None, copy_sig=True):
@@ -409,6 +586,10 @@ class partial(object):
         an existing instance, optionally overriding the original's wrapped
         function and/or saved arguments.
 
+        The copy is made without calling ``__init__``, so the wrapped
+        function's signature is not inspected again unless ``copy_sig`` is
+        false.
+
         :param inst: The partial instance we're copying
         :param func: Override the original's wrapped function
         :param argv: Override saved argument values
@@ -418,24 +599,44 @@ class partial(object):
 
         """
 
-        dest            = klass(func or inst.func)
-        dest.argv       = (argv or inst.argv).copy()
+        dest = klass.__new__(klass)
+        dest.__dict__.update(inst.__dict__)
+        dest.func       = func or inst.func
+        dest.argv       = argv if argv else inst.argv
         dest.extra_argv = list(extra_argv if extra_argv else inst.extra_argv)
 
-        if copy_sig:
-            dest.__sig_from_partial(inst)
+        if not copy_sig:
+            functools.update_wrapper(dest, dest.func)
+            dest.__call_error = None
+            dest.__sig_from_func(dest.func)
 
         return dest
 
     def __get__(self, inst, owner=None):
-        return self.make_copy(self, func=self.func.__get__(inst, owner), copy_sig=False)
+        func = self.func.__get__(inst, owner)
+
+        # Binding happens on every attribute lookup of a decorated method,
+        # so reuse the bound signature computed the first time around.  A
+        # race here merely computes the same immutable value twice.
+        bound_sig = _bound_sigs.get(self)
+        if bound_sig is None or bound_sig[0] is not type(func):
+            dest = self.make_copy(self, func=func, copy_sig=False)
+            _bound_sigs[self] = (type(func), dest.__get_sig())
+            return dest
+
+        dest = self.make_copy(self, func=func)
+        functools.update_wrapper(dest, func)
+        dest.__call_error = None
+        dest.__set_sig(bound_sig[1])
+        return dest
 
-    def __new_argv(self, *new_pargs, **new_kargs):
+    def __new_argv(self, argv, extra_argv, new_pargs, new_kargs):
         """Calculate new argv and extra_argv values resulting from adding
-        the specified positional and keyword arguments."""
+        the specified positional and keyword arguments to the given saved
+        ones, which are left unmodified."""
 
-        new_argv = self.argv.copy()
-        new_extra_argv = list(self.extra_argv)
+        new_argv = argv.copy()
+        new_extra_argv = list(extra_argv)
 
         for v in new_pargs:
             arg_name = None
@@ -449,7 +650,7 @@ class partial(object):
             elif self.var_pargs:
                 new_extra_argv.append(v)
             else:
-                num_prev_pargs = len([name for name in self.pargl if name in self.argv])
+                num_prev_pargs = len([name for name in self.pargl if name in argv])
                 raise TypeError("%s() takes exactly %d positional arguments (%d given)" \
                                     % (self.__name__,
                                        len(self.pargl),
@@ -463,33 +664,42 @@ class partial(object):
 
         return (new_argv, new_extra_argv)
 
-    def __update_argv(self, *pargs, **kargs):
-        self.argv, self.extra_argv = self.__new_argv(*pargs, **kargs)
+    def _resolve_args(self, new_pargs, new_kargs):
+        """Combines the given arguments with the saved ones.  Returns a
+        ``(new_argv, fpargs, fkargs)`` tuple, where ``fpargs`` and
+        ``fkargs`` are the positional and keyword arguments with which to
+        call the wrapped function, or None if the combined arguments are
+        not yet sufficient to call it."""
 
-    def __call__(self, *new_pargs, **new_kargs):
         if self.__call_error:
             raise TypeError(self.__call_error)
 
-        new_argv, extra_argv = self.__new_argv(*new_pargs, **new_kargs)
+        new_argv, extra_argv = self.__new_argv(self.argv, self.extra_argv,
+                                               new_pargs, new_kargs)
 
         applic_argv = self.def_argv.copy()
         applic_argv.update(new_argv)
 
-        applic_ready = True
         for name in self.pargl:
             if not name in applic_argv:
-                applic_ready = False
-                break
+                return (new_argv, None, None)
 
-        if applic_ready:
-            for name in self.kargl:
-                if not name in applic_argv:
-                    applic_ready = False
-                    break
+        for name in self.kargl:
+            if not name in applic_argv:
+                return (new_argv, None, None)
 
-        if applic_ready:
-            fpargs = [new_argv[n] for n in self.pargl if n in new_argv] + extra_argv
-            fkargs = dict((n,v) for n,v in new_argv.items() if not n in self.pargl)
+        # Every positional parameter is passed, filling gaps left by
+        # unspecified arguments with their defaults, so that later values
+        # cannot shift into the wrong slots.  Keyword-only defaults are
+        # passed explicitly as well, so the function always receives the
+        # fully resolved argument set.
+        fpargs = [applic_argv[n] for n in self.pargl] + extra_argv
+        fkargs = dict((n,v) for n,v in applic_argv.items() if not n in self.pargl)
+        return (new_argv, fpargs, fkargs)
+
+    def __call__(self, *new_pargs, **new_kargs):
+        new_argv, fpargs, fkargs = self._resolve_args(new_pargs, new_kargs)
+        if fpargs is not None:
             return self.func(*fpargs, **fkargs)
         else:
             return self.make_copy(self, argv=new_argv)
@@ -566,21 +776,59 @@ class pointfree(partial):
 # Shorthand pointfree notation
 pf = pointfree
 
+def _get_executor(executor, workers):
+    """Returns a (executor, owned) pair for the executor argument accepted
+    by the parallel helpers: either the string 'thread' or 'process', in
+    which case a new pool of the given size is created and owned by the
+    caller, or an existing :py:class:`concurrent.futures.Executor`."""
+
+    import concurrent.futures
+
+    if executor == 'thread':
+        return (concurrent.futures.ThreadPoolExecutor(workers), True)
+    elif executor == 'process':
+        return (concurrent.futures.ProcessPoolExecutor(workers), True)
+    elif isinstance(executor, concurrent.futures.Executor):
+        return (executor, False)
+    else:
+        raise ValueError("executor must be 'thread', 'process' or an "
+                         "Executor instance, not %r" % (executor,))
+
+def _map_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
 @pointfree
-def pfmap(func, iterable):
+def pfmap(func, iterable, workers=None, chunksize=64):
     """A pointfree map function: Returns an iterator over the results of
     applying a function of one argument to the items of a given iterable.
     The function is provided "lazily" to the given iterable; each function
     application is performed on the fly as it is requested.
 
+    If the function was wrapped by :py:func:`~pointfree.pfmemo` or
+    :py:func:`~pointfree.pfdiskmemo`, its cache is consulted and updated
+    ``chunksize`` items at a time, so the input is read up to that many
+    items ahead; results are still yielded, and errors raised, one item at
+    a time.
+
+    If ``workers`` is given, the function is instead applied by a pool of
+    that many threads, to chunks of ``chunksize`` items at a time, with at
+    most two chunks per thread read ahead of the consumer.  Results are
+    still yielded in order.  On free-threaded builds of CPython (see
+    :py:func:`sys._is_gil_enabled`) this gives real CPU parallelism for
+    pure Python functions; elsewhere it only helps functions which release
+    the GIL, such as I/O.
+
     :param func: A function of one argument to apply to each item
     :param iterable: An iterator yielding input for the function
+    :param workers: Optional number of threads to apply the function in
+    :param chunksize: Number of items handed to a thread, or looked up in a
+        memo cache, at once
     :rtype: Iterator of function application results
 
     Example::
 
         >>> f = pfmap(lambda x: x+1) \\
-        ...     >> pfmap(lambda x: x*2) \\
+        ...     >> pfmap(lambda x: x*2, workers=4) \\
         ...     >> pfcollect
 
         >>> f(range(5))
@@ -588,20 +836,67 @@ def pfmap(func, iterable):
 
     """
 
-    for item in iterable:
-        yield func(item)
+    if not workers:
+        memoized = getattr(func, 'func', None)
+        if isinstance(func, partial) and isinstance(memoized, _memoized) \
+                and hasattr(memoized.memo, 'get_many'):
+            # Look up and store memoized results a chunk at a time.
+            for chunk in _chunked(iterable, chunksize):
+                for result in memoized.call_many(func, chunk):
+                    yield result
+            return
+
+        for item in iterable:
+            yield func(item)
+        return
+
+    pool = _get_executor('thread', workers)[0]
+    iterator = iter(iterable)
+    pending = collections.deque()
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(itertools.islice(iterator, chunksize))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_map_chunk, func, chunk))
+            if not pending:
+                break
+            for result in pending.popleft().result():
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
 
 @pointfree
-def pfreduce(func, iterable, initial=None):
+def pfreduce(func, iterable, initial=None, associative=False,
+             commutative=False, workers=None, executor='thread',
+             chunksize=1024):
     """A pointfree reduce / left fold function: Applies a function of two
     arguments cumulatively to the items supplied by the given iterable, so
     as to reduce the iterable to a single value.  If an initial value is
     supplied, it is placed before the items from the iterable in the
     calculation, and serves as the default when the iterable is empty.
 
+    The fold itself is performed by :py:func:`functools.reduce`.  If the
+    function is declared ``associative`` and a number of ``workers`` is
+    given, the iterable is instead split into chunks of ``chunksize`` items
+    which are reduced in parallel, and the partial results are then
+    combined pairwise in a tree.  The result is the same as the sequential
+    fold for any associative function; if the function is also declared
+    ``commutative``, chunk results are combined in whatever order they
+    complete.  Parallel reduction uses threads unless ``executor`` is
+    ``'process'`` or an existing :py:class:`concurrent.futures.Executor`.
+
     :param func: A function of two arguments
     :param iterable: An iterable yielding input for the function
     :param initial: An optional initial input for the function
+    :param associative: Whether func is associative
+    :param commutative: Whether func is also commutative
+    :param workers: Number of workers for a parallel reduction
+    :param executor: ``'thread'``, ``'process'`` or an Executor instance
+    :param chunksize: Number of items reduced by a worker at a time
     :rtype: Single value
 
     Example::
@@ -612,21 +907,94 @@ def pfreduce(func, iterable, initial=None):
         >>> sum_of_squares([3, 4, 5, 6])
         86
 
+        >>> parallel_sum = pfreduce(add, associative=True, workers=4, chunksize=10)
+        >>> parallel_sum(range(1000))
+        499500
+
     """
 
+    if associative and workers:
+        value = _tree_reduce(func, iterable, commutative, workers,
+                             executor, chunksize)
+        if value is _empty:
+            return initial
+        elif initial is not None:
+            return func(initial, value)
+        else:
+            return value
+
+    if initial is not None:
+        return functools.reduce(func, iterable, initial)
+
     iterator = iter(iterable)
     try:
         first_item = next(iterator)
-        if initial:
-            value = func(initial, first_item)
-        else:
-            value = first_item
     except StopIteration:
         return initial
+    return functools.reduce(func, iterator, first_item)
 
-    for item in iterator:
-        value = func(value, item)
-    return value
+class _Empty(object):
+    """The type of _empty, which stays the same object when copied or
+    pickled, so that it can mark a missing value in aggregators used as
+    prototypes."""
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return '_empty'
+
+    def __repr__(self):
+        return '_empty'
+
+# Marker for the reduction of an empty iterable.
+_empty = _Empty()
+
+def _tree_reduce(func, iterable, commutative, workers, executor, chunksize):
+    """Reduce chunks of the iterable in parallel, then combine the chunk
+    results pairwise, level by level.  Returns _empty for an empty
+    iterable."""
+
+    import concurrent.futures
+
+    pool, owned = _get_executor(executor, workers)
+    try:
+        iterator = iter(iterable)
+        partials = []
+        pending = collections.deque()
+
+        while True:
+            chunk = list(itertools.islice(iterator, chunksize))
+            if chunk:
+                pending.append(pool.submit(functools.reduce, func, chunk))
+            if pending and (not chunk or len(pending) >= 2 * workers):
+                # Bound the number of chunks held in memory at once.
+                if commutative:
+                    done, not_done = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        partials.append(future.result())
+                    pending = collections.deque(f for f in pending if f in not_done)
+                else:
+                    partials.append(pending.popleft().result())
+            if not chunk and not pending:
+                break
+
+        if not partials:
+            return _empty
+
+        while len(partials) > 1:
+            futures = [pool.submit(func, partials[i], partials[i+1])
+                       for i in range(0, len(partials) - 1, 2)]
+            leftover = partials[-1:] if len(partials) % 2 else []
+            partials = [future.result() for future in futures] + leftover
+        return partials[0]
+    finally:
+        if owned:
+            pool.shutdown(wait=True)
 
 @pointfree
 def pffilter(pred, iterable):
@@ -702,12 +1070,20 @@ def pfprint(item, end='\n', file=None):
     print(item, end=end, file=file)
 
 @pointfree
-def pfprint_all(iterable, end='\n', file=None):
+def pfprint_all(iterable, end='\n', file=None, buffer_size=0):
     """Prints each item from an iterable.
 
+    If a ``buffer_size`` is given, the printed text is collected and
+    written to the file in blocks of at least that many characters, which
+    is much faster for large numbers of items; but output printed by other
+    means meanwhile, including by the stages feeding this one, will appear
+    out of order.  Whatever has been buffered is written out when the
+    iterable is exhausted or raises an exception.
+
     :param iterable: An iterable yielding values to print
     :param end: String to append to the end of printed output
     :param file: File to which output is printed
+    :param buffer_size: Number of characters to buffer before writing
     :rtype: None
 
     Example::
@@ -726,8 +1102,30 @@ def pfprint_all(iterable, end='\n', file=None):
 
     """
 
-    for item in iterable:
-        pfprint(item, end=end, file=file)
+    # As in pfprint, sys.stdout has to be looked up at call time
+    if file is None:
+        file = sys.stdout
+
+    if not buffer_size:
+        for item in iterable:
+            print(item, end=end, file=file)
+        return
+
+    buffered = []
+    size = 0
+    try:
+        for item in iterable:
+            text = str(item) + end
+            buffered.append(text)
+            size += len(text)
+            if size >= buffer_size:
+                # Emptied first, so that a failed write isn't repeated
+                # on the way out.
+                text, buffered, size = ''.join(buffered), [], 0
+                file.write(text)
+    finally:
+        if buffered:
+            file.write(''.join(buffered))
 
 @pointfree
 def pfignore_all(iterator):
@@ -764,3 +1162,4278 @@ def pfignore_all(iterator):
 
     for item in iterator:
         pass
+
+def _process_context():
+    """Returns the multiprocessing context used to start worker processes:
+    ``fork`` where the platform supports it, so that workers inherit the
+    functions they run instead of receiving them pickled -- lambdas and
+    pointfree compositions of the helpers can't be pickled -- and the
+    platform's default otherwise."""
+
+    import multiprocessing
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+class _SharedRing(object):
+    """A single-producer, single-consumer ring buffer of length-prefixed
+    messages, backed by a :py:mod:`multiprocessing.shared_memory` block so
+    that it can connect two processes without a pipe.
+
+    The first 16 bytes of the block hold the total number of bytes ever
+    written and read; the remainder is the ring itself.  Only the producer
+    advances the write counter and only the consumer advances the read
+    counter, so the condition variable is needed just for waiting, and
+    message bytes are copied outside of it.
+
+    """
+
+    _header = struct.Struct('QQ')
+    _length = struct.Struct('Q')
+
+    def __init__(self, capacity, context):
+        from multiprocessing import shared_memory
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=self._header.size + capacity)
+        self._header.pack_into(self.shm.buf, 0, 0, 0)
+        self.cond = context.Condition()
+        self.aborted = False
+
+    def __getstate__(self):
+        return (self.capacity, self.shm.name, self.cond)
+
+    def __setstate__(self, state):
+        from multiprocessing import shared_memory
+        self.capacity, name, self.cond = state
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.aborted = False
+
+    def _counters(self):
+        return self._header.unpack_from(self.shm.buf, 0)
+
+    def _copy_in(self, pos, data):
+        offset = self._header.size
+        start = pos % self.capacity
+        first = min(len(data), self.capacity - start)
+        buf = self.shm.buf
+        buf[offset+start:offset+start+first] = data[:first]
+        if first < len(data):
+            buf[offset:offset+len(data)-first] = data[first:]
+
+    def _copy_out(self, pos, n):
+        offset = self._header.size
+        start = pos % self.capacity
+        first = min(n, self.capacity - start)
+        buf = self.shm.buf
+        data = bytes(buf[offset+start:offset+start+first])
+        if first < n:
+            data += bytes(buf[offset:offset+n-first])
+        return data
+
+    def put(self, data):
+        needed = self._length.size + len(data)
+        if needed > self.capacity:
+            raise ValueError("message of %d bytes does not fit in a ring "
+                             "buffer of %d bytes" % (len(data), self.capacity))
+
+        with self.cond:
+            while True:
+                if self.aborted:
+                    raise EOFError("ring buffer consumer has gone away")
+                written, read = self._counters()
+                if self.capacity - (written - read) >= needed:
+                    break
+                self.cond.wait(0.1)
+
+        self._copy_in(written, self._length.pack(len(data)))
+        self._copy_in(written + self._length.size, data)
+
+        with self.cond:
+            self._header.pack_into(self.shm.buf, 0, written + needed,
+                                   self._counters()[1])
+            self.cond.notify_all()
+
+    def get(self, check=None):
+        """Reads the next message, waiting for one to arrive.  While
+        waiting, check is called periodically; if it returns an exception,
+        and the ring is still empty, that exception is raised."""
+
+        with self.cond:
+            while True:
+                # Checked before the counters, so that a message written
+                # just before the producer exited is still read.
+                error = check() if check else None
+                written, read = self._counters()
+                if written != read:
+                    break
+                if error is not None:
+                    raise error
+                self.cond.wait(0.1)
+
+        n, = self._length.unpack(self._copy_out(read, self._length.size))
+        data = self._copy_out(read + self._length.size, n)
+
+        with self.cond:
+            self._header.pack_into(self.shm.buf, 0, self._counters()[0],
+                                   read + self._length.size + n)
+            self.cond.notify_all()
+        return data
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+# Message tags for the batches passed between pfstaged segments.
+_BATCH, _END, _ERROR = range(3)
+
+def _ring_put_batches(ring, iterable, batch_size):
+    """Pickle items from iterable into the ring one batch at a time."""
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            break
+        ring.put(pickle.dumps((_BATCH, batch), pickle.HIGHEST_PROTOCOL))
+
+def _ring_get_items(ring, check=None):
+    """Yield the items of each batch read from the ring until the end of
+    stream marker, re-raising any error forwarded by the producer."""
+
+    while True:
+        tag, payload = pickle.loads(ring.get(check))
+        if tag == _END:
+            return
+        elif tag == _ERROR:
+            raise payload
+        for item in payload:
+            yield item
+
+def _ring_send(ring, iterable, batch_size):
+    """Send a whole stream through the ring, followed by an end of stream
+    or error marker."""
+
+    try:
+        _ring_put_batches(ring, iterable, batch_size)
+    except EOFError:
+        return
+    except Exception as e:
+        try:
+            message = pickle.dumps((_ERROR, e), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            message = pickle.dumps((_ERROR, RuntimeError(repr(e))),
+                                   pickle.HIGHEST_PROTOCOL)
+        ring.put(message)
+    else:
+        ring.put(pickle.dumps((_END, None), pickle.HIGHEST_PROTOCOL))
+
+def _ring_feed(ring, iterable, batch_size):
+    """Sends the input of a pfstaged pipeline into its first ring, from a
+    thread of the calling process, until the ring is aborted.  The thread
+    closes its own mapping of the ring, so that it can be abandoned while
+    blocked in the input iterable."""
+
+    def items():
+        for item in iterable:
+            if ring.aborted:
+                raise EOFError("ring buffer consumer has gone away")
+            yield item
+
+    try:
+        _ring_send(ring, items(), batch_size)
+    except EOFError:
+        pass
+    finally:
+        ring.close()
+
+def _apply_segment(segment, iterable):
+    """Applies a segment on first iteration, so that an error raised by an
+    eager segment is forwarded downstream like any other."""
+
+    for item in segment(iterable):
+        yield item
+
+def _staged_worker(segment, in_ring, out_ring, batch_size):
+    try:
+        _ring_send(out_ring, _apply_segment(segment, _ring_get_items(in_ring)),
+                   batch_size)
+    finally:
+        in_ring.close()
+        out_ring.close()
+
+@pointfree
+def pfstaged(segments, iterable, batch_size=256, buffer_size=1<<22):
+    """Runs a pipeline split into segments, each in its own worker process,
+    like the stages of a Unix shell pipeline.  Each segment is a function
+    mapping an iterable to an iterable -- typically a composition of
+    helpers such as :py:func:`~pointfree.pfmap` -- and the boundaries
+    between segments are where the work is divided among processes.
+
+    Adjacent segments are connected by ring buffers in shared memory
+    carrying pickled batches of ``batch_size`` items, so serialization
+    costs are paid per batch rather than per item.  Items are yielded in
+    order as they emerge from the last segment.  An exception raised in a
+    segment is forwarded downstream and re-raised by this function, and a
+    worker process that dies without finishing its stream raises
+    :py:exc:`RuntimeError`.  If iteration stops early, no more input is
+    read, though a read already blocked in the input iterable is left to
+    finish in a background thread.
+
+    Worker processes are started with the ``fork`` start method where it is
+    available, so segments may be lambdas or compositions of helpers.
+    Elsewhere, the segments must be picklable.  The items passing between
+    segments must always be picklable.
+
+    :param segments: A sequence of functions from iterable to iterable
+    :param iterable: An iterable yielding input for the first segment
+    :param batch_size: Number of items pickled together in each message
+    :param buffer_size: Size in bytes of each ring buffer; every pickled
+        batch must fit in it
+    :rtype: Iterator of results from the last segment
+
+    Example::
+
+        >>> f = pfstaged([pfmap(lambda n: n + 1),
+        ...               pfmap(lambda n: n * 2) >> pffilter(lambda n: n > 4)]) \\
+        ...     >> pfcollect
+
+        >>> f(range(5))
+        [6, 8, 10]
+
+    """
+
+    context = _process_context()
+    rings = [_SharedRing(buffer_size, context) for i in range(len(segments) + 1)]
+    processes = [context.Process(target=_staged_worker,
+                                 args=(segment, rings[i], rings[i+1], batch_size))
+                 for i, segment in enumerate(segments)]
+    feeder = threading.Thread(target=_ring_feed,
+                              args=(rings[0], iterable, batch_size))
+    feeder.daemon = True
+
+    def check():
+        # A worker that dies leaves its consumers waiting on an empty ring.
+        for i, process in enumerate(processes):
+            if process.exitcode not in (None, 0):
+                return RuntimeError("pfstaged segment %d exited with code %d"
+                                    % (i, process.exitcode))
+        if processes and processes[-1].exitcode is not None:
+            return RuntimeError("pfstaged segment %d exited before the end "
+                                "of its stream" % (len(processes) - 1))
+
+    try:
+        for process in processes:
+            process.daemon = True
+            process.start()
+        feeder.start()
+
+        for item in _ring_get_items(rings[-1], check):
+            yield item
+
+        for process in processes:
+            process.join()
+        feeder.join()
+    finally:
+        rings[0].aborted = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        # The feeder may be blocked in the input iterable, which nothing
+        # can interrupt; it's a daemon thread, so give up on it.
+        if feeder.ident is None:
+            rings[0].close()
+        elif feeder.is_alive():
+            feeder.join(0.5)
+        rings[0].shm.unlink()
+        for ring in rings[1:]:
+            ring.close(unlink=True)
+
+def _timed_map_chunk(func, chunk):
+    start = time.time()
+    results = [func(item) for item in chunk]
+    return (results, time.time() - start)
+
+class AdaptiveStats(object):
+    """Run-time measurements and tuning decisions of a
+    :py:func:`~pointfree.pfmap_adaptive` stage.
+
+    :ivar items: Number of items processed so far
+    :ivar chunks: Number of chunks processed so far
+    :ivar item_latency: Smoothed per-item processing time, in seconds
+    :ivar throughput: Items per second over the most recent window
+    :ivar queue_depth: Finished chunks waiting to be collected when the
+        most recent chunk was collected; zero means the consumer had to
+        wait on the workers
+    :ivar workers: Current number of chunks allowed in flight
+    :ivar chunksize: Current number of items per chunk
+    :ivar splits: Number of extra chunks made by splitting the last chunk
+        of the input among idle workers
+    :ivar decisions: The most recent tuning decisions, as ``(items,
+        workers, chunksize, reason)`` tuples
+
+    """
+
+    def __init__(self, history=100):
+        self.items = 0
+        self.chunks = 0
+        self.item_latency = None
+        self.throughput = None
+        self.queue_depth = 0
+        self.workers = 0
+        self.chunksize = 0
+        self.splits = 0
+        self.decisions = collections.deque(maxlen=history)
+
+    def record(self, workers, chunksize, reason):
+        if (workers, chunksize) != (self.workers, self.chunksize):
+            self.decisions.append((self.items, workers, chunksize, reason))
+        self.workers = workers
+        self.chunksize = chunksize
+
+    def __repr__(self):
+        return "AdaptiveStats(items=%d, chunks=%d, workers=%d, chunksize=%d)" \
+            % (self.items, self.chunks, self.workers, self.chunksize)
+
+@pointfree
+def pfmap_adaptive(func, iterable, executor='thread', min_workers=1,
+                   max_workers=None, min_chunksize=1, max_chunksize=4096,
+                   target_chunk_time=0.02, stats=None):
+    """A parallel version of :py:func:`~pointfree.pfmap` which tunes its
+    own chunk size and degree of parallelism at run time, for stages whose
+    per-item cost is not known in advance.
+
+    Items are read from the iterable in chunks, and each chunk is mapped in
+    a worker of the given executor.  From the time each chunk takes, the
+    stage maintains a smoothed per-item latency and resizes subsequent
+    chunks so that each takes about ``target_chunk_time`` seconds.  The
+    number of chunks in flight (the effective worker count) is hill-climbed
+    between ``min_workers`` and ``max_workers`` on the observed throughput:
+    it grows while doing so helps, and shrinks when it stops helping.  It
+    only grows while there is input left to hand out and the consumer
+    mostly had to wait for the chunks it collected; once finished chunks
+    queue up waiting to be collected, the consumer is the bottleneck and
+    more workers wouldn't help.
+
+    Skewed work is handled in three ways: workers pull chunks from the
+    executor's shared queue, so an idle worker takes the next available
+    chunk rather than waiting on a fixed assignment; a chunk that runs far
+    longer than the target halves the size of the chunks that follow it
+    straight away, without waiting for the smoothed latency to catch up;
+    and once the input is exhausted, the last chunk is split among the
+    idle workers.  A chunk already running is never split.
+
+    Results are yielded in input order.
+
+    :param func: A function of one argument to apply to each item
+    :param iterable: An iterable yielding input for the function
+    :param executor: ``'thread'``, ``'process'``, or an existing
+        :py:class:`concurrent.futures.Executor` to run chunks on
+    :param min_workers: Lower bound on chunks in flight
+    :param max_workers: Upper bound on chunks in flight (default: number
+        of CPUs)
+    :param min_chunksize: Lower bound on items per chunk
+    :param max_chunksize: Upper bound on items per chunk
+    :param target_chunk_time: Desired processing time per chunk, in seconds
+    :param stats: An optional :py:class:`~pointfree.AdaptiveStats` to
+        record measurements and decisions in
+    :rtype: Iterator of function application results
+
+    Example::
+
+        >>> stats = AdaptiveStats()
+        >>> f = pfmap_adaptive(lambda x: x * 2, stats=stats) >> pfcollect
+        >>> f(range(10))
+        [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+        >>> stats.items
+        10
+
+    """
+
+    max_workers = max(min_workers, max_workers or os.cpu_count() or 1)
+    if stats is None:
+        stats = AdaptiveStats()
+    pool, owned = _get_executor(executor, max_workers)
+
+    workers = min_workers
+    chunksize = min_chunksize
+    stats.record(workers, chunksize, 'initial')
+
+    iterator = iter(iterable)
+    exhausted = False
+    backlog = collections.deque()
+    pending = collections.deque()
+
+    # Hill climbing state: the throughput measured at the previous worker
+    # count, and the direction of the last change.
+    window_start, window_items = time.time(), 0
+    window_chunks, window_waits = 0, 0
+    last_throughput, direction = None, 1
+
+    try:
+        while True:
+            while len(pending) < workers:
+                if not backlog and not exhausted:
+                    chunk = list(itertools.islice(iterator, chunksize))
+                    if chunk:
+                        backlog.append(chunk)
+                    if len(chunk) < chunksize:
+                        exhausted = True
+                if not backlog:
+                    break
+
+                chunk = backlog.popleft()
+                idle = workers - len(pending)
+                if exhausted and not backlog and idle > 1 and len(chunk) > 1:
+                    # Tail of the input: spread the last chunk over the
+                    # idle workers instead of leaving them waiting.
+                    size = -(-len(chunk) // idle)
+                    pieces = [chunk[i:i+size] for i in range(0, len(chunk), size)]
+                    chunk = pieces[0]
+                    backlog.extend(pieces[1:])
+                    stats.splits += len(pieces) - 1
+                pending.append(pool.submit(_timed_map_chunk, func, chunk))
+
+            if not pending:
+                break
+
+            stats.queue_depth = sum(1 for f in pending if f.done())
+            results, elapsed = pending.popleft().result()
+            stats.chunks += 1
+            stats.items += len(results)
+            window_items += len(results)
+            window_chunks += 1
+            if not stats.queue_depth:
+                window_waits += 1
+
+            latency = elapsed / max(len(results), 1)
+            if stats.item_latency is None:
+                stats.item_latency = latency
+            else:
+                stats.item_latency = 0.7 * stats.item_latency + 0.3 * latency
+
+            reason = 'latency'
+            if elapsed > 4 * target_chunk_time and len(results) > 1:
+                # A skewed chunk: shrink hard right away rather than waiting
+                # for the moving average to catch up.
+                new_chunksize = len(results) // 2
+                reason = 'skew'
+            elif stats.item_latency > 0:
+                new_chunksize = int(target_chunk_time / stats.item_latency)
+            else:
+                new_chunksize = max_chunksize
+            chunksize = max(min_chunksize, min(max_chunksize, new_chunksize))
+
+            now = time.time()
+            if now - window_start >= 4 * target_chunk_time and window_items:
+                stats.throughput = window_items / (now - window_start)
+                if last_throughput is not None \
+                        and stats.throughput < 0.95 * last_throughput:
+                    direction = -direction
+                # Another worker only helps while there's work to hand it
+                # and the consumer is waiting on the workers, rather than
+                # finished chunks waiting on the consumer.
+                idle = exhausted and not backlog
+                waiting = 2 * window_waits > window_chunks
+                if (direction < 0 or (waiting and not idle)) \
+                        and min_workers <= workers + direction <= max_workers:
+                    workers += direction
+                    reason = 'throughput'
+                last_throughput = stats.throughput
+                window_start, window_items = now, 0
+                window_chunks, window_waits = 0, 0
+
+            stats.record(workers, chunksize, reason)
+
+            for result in results:
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        if owned:
+            pool.shutdown(wait=True)
+
+def _chunked(iterable, size):
+    """Yields successive lists of up to size items from the iterable."""
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+@pointfree
+def pfsum(iterable, start=0, precise=False):
+    """Sums the items of an iterable using the builtin :py:func:`sum`, or
+    :py:func:`math.fsum` if ``precise`` is true, without a Python-level
+    function call per item.
+
+    :param iterable: An iterable yielding numbers
+    :param start: Value added to the sum
+    :param precise: Use :py:func:`math.fsum` to avoid loss of precision
+        when summing floats
+    :rtype: The sum
+
+    Example::
+
+        >>> (pfmap(lambda n: n**2) >> pfsum)([3, 4, 5, 6])
+        86
+        >>> pfsum([0.1] * 10, precise=True)
+        1.0
+
+    """
+
+    if precise:
+        return math.fsum(itertools.chain((start,), iterable))
+    else:
+        return sum(iterable, start)
+
+@pointfree
+def pfcount(iterable):
+    """Counts the items of an iterable, consuming it without storing its
+    items.
+
+    :param iterable: An iterable
+    :rtype: Number of items
+
+    Example::
+
+        >>> (pffilter(lambda n: n % 3 == 0) >> pfcount)(range(10))
+        4
+
+    """
+
+    # zip() stops before advancing the counter when the iterable runs dry,
+    # and the zero-length deque discards its input in C.
+    counter = itertools.count()
+    collections.deque(zip(iterable, counter), maxlen=0)
+    return next(counter)
+
+def _key_kargs(key):
+    return {'key': key} if key is not None else {}
+
+@pointfree
+def pfmin(iterable, key=None, default=None):
+    """Returns the smallest item of an iterable, or ``default`` if it is
+    empty.
+
+    :param iterable: An iterable
+    :param key: Optional function of one argument to compare items by
+    :param default: Value returned for an empty iterable
+    :rtype: The smallest item
+
+    Example::
+
+        >>> pfmin(key=len)(["foo", "ba", "bazz"])
+        'ba'
+
+    """
+
+    return min(iterable, default=default, **_key_kargs(key))
+
+@pointfree
+def pfmax(iterable, key=None, default=None):
+    """Returns the largest item of an iterable, or ``default`` if it is
+    empty.
+
+    :param iterable: An iterable
+    :param key: Optional function of one argument to compare items by
+    :param default: Value returned for an empty iterable
+    :rtype: The largest item
+
+    Example::
+
+        >>> pfmax(key=len)(["foo", "ba", "bazz"])
+        'bazz'
+
+    """
+
+    return max(iterable, default=default, **_key_kargs(key))
+
+@pointfree
+def pfminmax(iterable, key=None):
+    """Returns both the smallest and largest items of an iterable, in a
+    single pass over it.
+
+    :param iterable: An iterable
+    :param key: Optional function of one argument to compare items by
+    :rtype: A ``(min, max)`` tuple, or ``(None, None)`` if the iterable is
+        empty
+
+    Example::
+
+        >>> pfminmax([3, 1, 4, 1, 5, 9, 2, 6])
+        (1, 9)
+
+    """
+
+    aggregator = MinMaxAggregator(key=key)
+    for chunk in _chunked(iterable, _AGGREGATE_CHUNK):
+        aggregator.update(chunk)
+    return aggregator.result()
+
+@pointfree
+def pfmean(iterable):
+    """Returns the arithmetic mean of the items of an iterable, counting
+    and summing them in a single pass.
+
+    :param iterable: An iterable yielding numbers
+    :rtype: The mean, or None if the iterable is empty
+
+    Example::
+
+        >>> pfmean([1, 2, 3, 4])
+        2.5
+
+    """
+
+    counter = itertools.count()
+    total = sum(map(operator.itemgetter(0), zip(iterable, counter)))
+    n = next(counter)
+    return total / float(n) if n else None
+
+# Number of items read at a time by aggregates which handle each chunk of
+# their input with builtins.
+_AGGREGATE_CHUNK = 1024
+
+class Aggregator(object):
+    """Base class for streaming aggregates, used by
+    :py:func:`~pointfree.pfaggregate` and the other helpers which accept
+    an aggregate.
+
+    An aggregator consumes its input in chunks (lists of items) through
+    :py:meth:`update`, so that each chunk can be handled by builtins in C
+    instead of a Python-level call per item.  Aggregators computed over
+    separate partitions of a stream can be combined with :py:meth:`merge`.
+
+    """
+
+    def update(self, items):
+        """Adds a list of items to the aggregate."""
+
+        raise NotImplementedError
+
+    #: Whether :py:meth:`remove` is supported.
+    removable = False
+
+    def remove(self, items):
+        """Retracts a list of items previously added to the aggregate.
+        Only supported by aggregators whose ``removable`` attribute is
+        true."""
+
+        raise NotImplementedError
+
+    def merge(self, other):
+        """Adds the state of another aggregator of the same type to this
+        one, as though this one had seen the other's items too."""
+
+        raise NotImplementedError
+
+    def result(self):
+        """Returns the aggregate value of the items seen so far."""
+
+        raise NotImplementedError
+
+class CountAggregator(Aggregator):
+    """Counts items."""
+
+    removable = True
+
+    def __init__(self):
+        self.count = 0
+
+    def update(self, items):
+        self.count += len(items)
+
+    def remove(self, items):
+        self.count -= len(items)
+
+    def merge(self, other):
+        self.count += other.count
+
+    def result(self):
+        return self.count
+
+class SumAggregator(Aggregator):
+    """Sums items, with :py:func:`math.fsum` if ``precise`` is true (in
+    which case the running total is rounded once per chunk)."""
+
+    removable = True
+
+    def __init__(self, start=0, precise=False):
+        self.start = self.total = start
+        self.precise = precise
+
+    def update(self, items):
+        if self.precise:
+            self.total = math.fsum(itertools.chain((self.total,), items))
+        else:
+            self.total = sum(items, self.total)
+
+    def remove(self, items):
+        if self.precise:
+            self.total = math.fsum(itertools.chain((self.total,), (-x for x in items)))
+        else:
+            self.total -= sum(items)
+
+    def merge(self, other):
+        # The other total includes its own start, which this one already
+        # counts.
+        if other.start:
+            self.update([other.total, -other.start])
+        else:
+            self.update([other.total])
+
+    def result(self):
+        return self.total
+
+class _ExtremeAggregator(Aggregator):
+    """Shared implementation of the min and max aggregators."""
+
+    _choose = None
+
+    def __init__(self, key=None):
+        self.key = key
+        self.value = self.value_key = None
+        self.empty = True
+
+    def update(self, items):
+        if not items:
+            return
+        choose = self._choose
+        if self.key is None:
+            candidate = choose(items)
+            if self.empty or choose(self.value, candidate) is not self.value:
+                self.value = self.value_key = candidate
+        else:
+            candidate = choose(items, key=self.key)
+            candidate_key = self.key(candidate)
+            if self.empty or choose(self.value_key, candidate_key) is not self.value_key:
+                self.value, self.value_key = candidate, candidate_key
+        self.empty = False
+
+    def merge(self, other):
+        if not other.empty:
+            self.update([other.value])
+
+    def result(self):
+        return self.value
+
+class MinAggregator(_ExtremeAggregator):
+    """Finds the smallest item, optionally compared by a key function."""
+
+    _choose = staticmethod(min)
+
+class MaxAggregator(_ExtremeAggregator):
+    """Finds the largest item, optionally compared by a key function."""
+
+    _choose = staticmethod(max)
+
+class MinMaxAggregator(Aggregator):
+    """Finds both the smallest and largest items as a ``(min, max)``
+    tuple."""
+
+    def __init__(self, key=None):
+        self.min = MinAggregator(key)
+        self.max = MaxAggregator(key)
+
+    def update(self, items):
+        self.min.update(items)
+        self.max.update(items)
+
+    def merge(self, other):
+        self.min.merge(other.min)
+        self.max.merge(other.max)
+
+    def result(self):
+        return (self.min.result(), self.max.result())
+
+class MeanAggregator(Aggregator):
+    """Computes the arithmetic mean of the items, or None if there are
+    none."""
+
+    removable = True
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def update(self, items):
+        self.count += len(items)
+        self.total = sum(items, self.total)
+
+    def remove(self, items):
+        self.count -= len(items)
+        self.total -= sum(items)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+
+    def result(self):
+        return self.total / float(self.count) if self.count else None
+
+class ListAggregator(Aggregator):
+    """Collects the items into a list."""
+
+    def __init__(self):
+        self.items = []
+
+    def update(self, items):
+        self.items.extend(items)
+
+    def merge(self, other):
+        self.items.extend(other.items)
+
+    def result(self):
+        return self.items
+
+class FoldAggregator(Aggregator):
+    """Folds the items with a function of two arguments, like
+    :py:func:`~pointfree.pfreduce`.  The result is None if there were no
+    items and no ``initial`` value.  Merging folds the other aggregator's
+    result into this one's, which is only correct if func is associative
+    (and initial, if any, is an identity for it).
+
+    :param func: Function of the accumulated value and an item
+    :param initial: Optional initial accumulated value
+
+    """
+
+    def __init__(self, func, initial=_empty):
+        self.func = func
+        self.value = initial
+
+    def update(self, items):
+        if not items:
+            return
+        if self.value is _empty:
+            self.value = functools.reduce(self.func, items)
+        else:
+            self.value = functools.reduce(self.func, items, self.value)
+
+    def merge(self, other):
+        if other.value is not _empty:
+            self.update([other.value])
+
+    def result(self):
+        return None if self.value is _empty else self.value
+
+#: Summary statistics computed by :py:class:`~pointfree.StatsAggregator`.
+Stats = collections.namedtuple('Stats', 'count mean variance min max')
+
+class StatsAggregator(Aggregator):
+    """Computes the count, mean, variance, minimum and maximum of the items
+    in a single pass, as a :py:class:`~pointfree.Stats` tuple.  The
+    variance is computed in a numerically stable way: the mean and sum of
+    squared deviations of each chunk are computed separately and combined
+    with the running values with the pairwise formulas of Chan et al.,
+    which also serve to merge aggregators.  The mean and variance are None
+    while there are too few items to compute them.
+
+    :param ddof: Delta degrees of freedom: the variance is the sum of
+        squared deviations divided by ``count - ddof``, so 0 (the default)
+        gives the population variance and 1 the sample variance
+
+    """
+
+    def __init__(self, ddof=0):
+        self.ddof = ddof
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = self.max = None
+
+    def _combine(self, count, mean, m2, low, high):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def update(self, items):
+        if not items:
+            return
+        count = len(items)
+        mean = sum(items) / float(count)
+        m2 = sum([(x - mean) * (x - mean) for x in items])
+        self._combine(count, mean, m2, min(items), max(items))
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def result(self):
+        return _stats_result(self.count, self.mean, self.m2, self.min, self.max,
+                             self.ddof)
+
+def _stats_result(count, mean, m2, low, high, ddof):
+    return Stats(count, mean if count else None,
+                 m2 / (count - ddof) if count > ddof else None, low, high)
+
+class TopKAggregator(Aggregator):
+    """Keeps the k largest items (or, if ``largest`` is false, the k
+    smallest), optionally compared by a key function, in O(k) memory.  The
+    result is a list in order from the largest (or smallest) down; items
+    comparing equal keep the order in which they were added.
+
+    :param k: The number of items to keep
+    :param key: Function of one argument to compare items by
+    :param largest: Whether to keep the largest items or the smallest
+
+    """
+
+    def __init__(self, k, key=None, largest=True):
+        self.k = k
+        self.key = key
+        self.largest = largest
+        self.items = []
+
+    def update(self, items):
+        select = heapq.nlargest if self.largest else heapq.nsmallest
+        self.items = select(self.k, itertools.chain(self.items, items), key=self.key)
+
+    def merge(self, other):
+        self.update(other.items)
+
+    def result(self):
+        return self.items
+
+def _sketch_hash(item, digest_size=8):
+    """Returns a hash of an item, of digest_size bytes, which unlike hash()
+    is the same in every process: computed from the canonical encoding of
+    the item, so that equal numbers, strings, bytes, and containers of
+    them hash alike."""
+
+    data = _canonical_bytes(item)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=digest_size).digest(), 'big')
+
+class DistinctCountAggregator(Aggregator):
+    """Estimates the number of distinct items with a HyperLogLog sketch of
+    ``2 ** precision`` one-byte registers.  The relative standard error of
+    the estimate is about ``1.04 / sqrt(2 ** precision)``: 0.81% at the
+    default precision of 14, using 16 KiB; small counts are estimated by
+    linear counting, which is nearly exact.  Items are hashed by a
+    canonical encoding, so equal numbers, strings, bytes, and tuples,
+    lists, sets and dicts of them (such as 1 and 1.0) count as one item;
+    other items are hashed by their pickle.  Merging aggregators of the
+    same precision gives the sketch of the union of their items.
+
+    :param precision: Number of bits of each hash used to pick a register,
+        from 4 to 18
+
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def update(self, items):
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for item in items:
+            h = _sketch_hash(item)
+            rank = shift - (h & mask).bit_length() + 1
+            if rank > registers[h >> shift]:
+                registers[h >> shift] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precisions")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def result(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+class _RandomAggregator(Aggregator):
+    """Shared implementation of the aggregators making random choices: a
+    copy of one seeded with None, such as a copy of a prototype, gets a
+    random state of its own rather than repeating the original's
+    choices."""
+
+    def __deepcopy__(self, memo):
+        dest = self.__class__.__new__(self.__class__)
+        memo[id(self)] = dest
+        dest.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        if dest.seed is None:
+            dest.random = random.Random()
+        return dest
+
+class QuantilesAggregator(_RandomAggregator):
+    """Estimates quantiles of the items with a KLL sketch, which keeps a
+    hierarchy of compactors: when one fills up, its items are sorted and
+    every other one is promoted to the next level, with twice the weight.
+    With the default ``k`` of 200 the rank of each estimated quantile is
+    within about 1.65% of the item count of the true rank, with 99%
+    confidence, in memory proportional to k (plus a logarithmic number of
+    levels).  The items must be mutually comparable.  Merging aggregators
+    gives the sketch of the union of their items.
+
+    The result is a function of a quantile (a fraction from 0 to 1)
+    returning its estimated value, or None if there were no items.
+
+    :param k: Accuracy parameter: the capacity of the top compactor
+    :param seed: Optional seed for the random choices of the compactors
+
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self.levels = [[]]
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3) ** depth)))
+
+    def _compress(self):
+        while True:
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    break
+            else:
+                return
+            if h + 1 == len(self.levels):
+                self.levels.append([])
+            level.sort()
+            kept = [level.pop()] if len(level) % 2 else []
+            self.levels[h + 1].extend(level[self.random.randint(0, 1)::2])
+            self.levels[h] = kept
+
+    def update(self, items):
+        self.count += len(items)
+        self.levels[0].extend(items)
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.count += other.count
+        self._compress()
+
+    def result(self):
+        weighted = sorted(((item, 1 << h)
+                           for h, level in enumerate(self.levels) for item in level),
+                          key=operator.itemgetter(0))
+        cumulative = list(itertools.accumulate(weight for item, weight in weighted))
+
+        def quantile(q):
+            if not weighted:
+                return None
+            i = bisect.bisect_left(cumulative, q * cumulative[-1])
+            return weighted[min(i, len(weighted) - 1)][0]
+        return quantile
+
+class SampleAggregator(_RandomAggregator):
+    """Keeps a uniform random sample of k items (all of them, if there are
+    no more than k) by reservoir sampling, with Li's Algorithm L: the
+    number of items to skip before the next one enters the sample is drawn
+    directly, so n items take O(k log(n / k)) random draws rather than one
+    each.  Merging aggregators gives a uniform sample of the union of their
+    items.  The result is a list in no particular order.
+
+    :param k: The size of the sample
+    :param seed: Optional seed for the random choices
+
+    """
+
+    def __init__(self, k, seed=None):
+        self.k = k
+        self.count = 0
+        self.sample = []
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.weight = self.next = None
+
+    def _skip(self, index):
+        """Sets the index of the next item to enter the sample, counting
+        from the given index, once the sample is full."""
+
+        u = 1.0 - self.random.random()
+        self.next = index + int(math.log(u) / math.log(1.0 - self.weight))
+
+    def _draw_weight(self):
+        return math.exp(math.log(1.0 - self.random.random()) / self.k)
+
+    def update(self, items):
+        base = self.count
+        self.count += len(items)
+        if not self.k:
+            return
+        if len(self.sample) < self.k:
+            room = self.k - len(self.sample)
+            self.sample.extend(items[:room])
+            if len(self.sample) < self.k:
+                return
+            self.weight = self._draw_weight()
+            self._skip(base + room)
+        while self.next < self.count:
+            self.sample[self.random.randrange(self.k)] = items[self.next - base]
+            self.weight *= self._draw_weight()
+            self._skip(self.next + 1)
+
+    def merge(self, other):
+        # Draw without replacement from the union of the two populations,
+        # each item from either side in proportion to its remaining size;
+        # each sample stands in for its side's population.
+        ours, theirs = list(self.sample), list(other.sample)
+        n1, n2 = self.count, other.count
+        sample = []
+        for i in range(min(self.k, n1 + n2)):
+            if self.random.random() * (n1 + n2) < n1:
+                side = ours
+                n1 -= 1
+            else:
+                side = theirs
+                n2 -= 1
+            j = self.random.randrange(len(side))
+            side[j], side[-1] = side[-1], side[j]
+            sample.append(side.pop())
+        self.sample = sample
+        self.count += other.count
+        if self.k and len(sample) == self.k:
+            # The weight is distributed as the k-th smallest of count
+            # uniform variables.
+            self.weight = self.random.betavariate(self.k, self.count - self.k + 1)
+            self._skip(self.count)
+
+    def result(self):
+        return self.sample
+
+class FrequentAggregator(Aggregator):
+    """Finds the most frequent items with the Space-Saving algorithm,
+    keeping at most k counters.  Each chunk of items is counted with a
+    :py:class:`collections.Counter` and merged into the counters: items
+    new to the counters take over the smallest ones, starting from their
+    counts, which bound how often an item can have occurred unseen.  A
+    reported count may overestimate the item's true count by at most the
+    total number of items divided by k (and by at most the item's
+    ``errors`` entry), and every item occurring more often than that is
+    reported.  Merging aggregators preserves these bounds for the union of
+    their items.
+
+    The result is a list of ``(item, count)`` pairs, most frequent first.
+    Items must be hashable.
+
+    :param k: The number of counters
+
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+
+    def _floor(self):
+        """The most any item without a counter can have occurred."""
+
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def _combine(self, counts, errors, other_floor, total):
+        """Merges in another summary, keeping the k largest counts.  An item
+        missing from either summary can have occurred at most as many times
+        as that summary's floor, which is added to its count and error."""
+
+        floor = self._floor()
+        merged = {}
+        merged_errors = {}
+        for item, count in self.counts.items():
+            merged[item] = count + counts.get(item, other_floor)
+            merged_errors[item] = self.errors[item] + errors.get(item, other_floor)
+        for item, count in counts.items():
+            if item not in merged:
+                merged[item] = count + floor
+                merged_errors[item] = errors.get(item, 0) + floor
+        kept = heapq.nlargest(self.k, merged, key=merged.get)
+        self.counts = dict((item, merged[item]) for item in kept)
+        self.errors = dict((item, merged_errors[item]) for item in kept)
+        self.total += total
+
+    def update(self, items):
+        # A chunk's exact counts make a summary with no errors
+        self._combine(collections.Counter(items), {}, 0, len(items))
+
+    def merge(self, other):
+        self._combine(other.counts, other.errors, other._floor(), other.total)
+
+    def result(self):
+        return sorted(self.counts.items(), key=operator.itemgetter(1), reverse=True)
+
+# Aggregators which can be named by string.
+_aggregators = {
+    'count':  CountAggregator,
+    'sum':    SumAggregator,
+    'min':    MinAggregator,
+    'max':    MaxAggregator,
+    'minmax': MinMaxAggregator,
+    'mean':   MeanAggregator,
+    'list':   ListAggregator,
+    'stats':  StatsAggregator,
+    }
+
+def _make_aggregator(spec):
+    """Returns a fresh aggregator from an aggregate specification: the name
+    of a built-in aggregate, an :py:class:`Aggregator` instance to be used
+    as a prototype (and copied), or a callable returning an aggregator,
+    such as an :py:class:`Aggregator` subclass."""
+
+    if isinstance(spec, str):
+        try:
+            return _aggregators[spec]()
+        except KeyError:
+            raise ValueError("unknown aggregate '%s'" % spec)
+    elif isinstance(spec, Aggregator):
+        return copy.deepcopy(spec)
+    else:
+        return spec()
+
+def _aggregate(aggregator, iterable):
+    """Feeds the items of an iterable to an aggregator in chunks, returning
+    its result."""
+
+    for chunk in _chunked(iterable, _AGGREGATE_CHUNK):
+        aggregator.update(chunk)
+    return aggregator.result()
+
+@pointfree
+def pfaggregate(iterable, **aggregates):
+    """Computes several aggregates over an iterable in a single pass,
+    without storing the iterable's items.
+
+    Each keyword argument names an output and specifies its aggregate:
+    either one of the names ``'count'``, ``'sum'``, ``'min'``, ``'max'``,
+    ``'minmax'``, ``'mean'``, ``'list'`` and ``'stats'``; an :py:class:`~pointfree.Aggregator`
+    instance, which is copied and used as a prototype; or a callable
+    returning a new aggregator.  Items are fed to the aggregators in
+    chunks, so each aggregate is computed by builtins rather than a Python
+    call per item.
+
+    :param iterable: An iterable
+    :param aggregates: Aggregates to compute, by output name
+    :rtype: Dictionary of aggregate results by output name
+
+    Example::
+
+        >>> stats = pfmap(len) >> pfaggregate(n='count', total='sum', longest='max')
+        >>> result = stats(["foo", "ba", "bazz"])
+        >>> sorted(result.items())
+        [('longest', 4), ('n', 3), ('total', 9)]
+
+    """
+
+    aggregators = dict((name, _make_aggregator(spec))
+                       for name, spec in aggregates.items())
+    for chunk in _chunked(iterable, _AGGREGATE_CHUNK):
+        for aggregator in aggregators.values():
+            aggregator.update(chunk)
+    return dict((name, aggregator.result())
+                for name, aggregator in aggregators.items())
+
+class MemoCache(object):
+    """A thread-safe, bounded cache of function results used by
+    :py:func:`~pointfree.pfmemo`, evicting the least recently used entry
+    when full and optionally expiring entries after a time to live.
+
+    :param maxsize: Maximum number of entries, or None for no limit
+    :param ttl: Optional lifetime of each entry, in seconds
+
+    :ivar hits: Number of lookups answered from the cache
+    :ivar misses: Number of lookups which had to call the function
+    :ivar evictions: Number of entries dropped to stay within maxsize
+    :ivar expirations: Number of entries dropped because their ttl passed
+
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "MemoCache(hits=%d, misses=%d, evictions=%d, size=%d)" \
+            % (self.hits, self.misses, self.evictions, len(self))
+
+    def get(self, key):
+        """Returns a ``(found, value)`` pair for the given key."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or time.time() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return (True, value)
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return (False, None)
+
+    def put(self, key, value):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys):
+        """Returns a dictionary of the values found for the given keys."""
+
+        found = {}
+        for key in keys:
+            hit, value = self.get(key)
+            if hit:
+                found[key] = value
+        return found
+
+    def put_many(self, items):
+        """Stores a list of ``(key, value)`` pairs."""
+
+        for key, value in items:
+            self.put(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def pfmemo(maxsize=128, ttl=None, cache=None):
+    """Returns a decorator which wraps a pure function in
+    :py:class:`~pointfree.pointfree`, memoizing its results.
+
+    Results are keyed on the complete set of arguments which the wrapper
+    resolves before calling the function, including default values, so
+    the different ways of partially applying the same arguments all share
+    one cache entry.  The cache is available as the wrapper's ``memo``
+    attribute, a :py:class:`~pointfree.MemoCache` which counts hits,
+    misses and evictions.  Calls with unhashable arguments bypass the
+    cache.
+
+    Decorating a method gives each instance its own cache, of up to
+    ``maxsize`` results, available as the bound method's ``memo``.  The
+    caches hold no reference to the instances, and are dropped along with
+    them.  Instances which can't be weakly referenced share the method's
+    ``memo`` instead, keyed on the instance, which it keeps alive; so does
+    a ``cache`` passed in, which is always shared.
+
+    :param maxsize: Maximum number of cached results, or None for no limit
+    :param ttl: Optional number of seconds after which results expire
+    :param cache: Optional cache to use instead of a new
+        :py:class:`~pointfree.MemoCache`; anything with the same ``get()``,
+        ``put()``, ``get_many()`` and ``put_many()`` methods will do
+    :rtype: Decorator returning a :py:class:`~pointfree.pointfree`
+
+    Example::
+
+        >>> @pfmemo(maxsize=100)
+        ... def area(width, height, scale=1):
+        ...     return width * height * scale
+
+        >>> area(2)(3), area(2, 3), area(height=3)(2), area(2, 3, scale=1)
+        (6, 6, 6, 6)
+        >>> area.memo.hits, area.memo.misses
+        (3, 1)
+
+    """
+
+    def decorator(func):
+        inst = pointfree(func)
+        if cache is not None:
+            memoized = _memoized(inst.func, cache)
+        else:
+            memoized = _memoized(inst.func, MemoCache(maxsize, ttl),
+                                 lambda: MemoCache(maxsize, ttl))
+        memo_inst = pointfree.make_copy(inst, func=memoized)
+        memo_inst.memo = memoized.memo
+        return memo_inst
+
+    return decorator
+
+def _encode_canonical(value, parts):
+    """Appends an encoding of a value to the list parts, as bytes.  Equal
+    numbers, strings and bytes, and tuples, lists, sets and dicts of them,
+    always encode alike -- unlike their pickles, which depend on the
+    identity of the objects within.  Other values are pickled."""
+
+    if value is None:
+        parts.append(b'N')
+    elif value is _kwd_mark:
+        parts.append(b'K')
+    elif isinstance(value, float) and not value.is_integer():
+        parts.append(b'f%r;' % value)
+    elif isinstance(value, (int, float)):
+        parts.append(b'i%d;' % value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8', 'surrogatepass')
+        parts.append(b's%d:' % len(data))
+        parts.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        parts.append(b'b%d:' % len(data))
+        parts.append(data)
+    elif isinstance(value, (tuple, list)):
+        parts.append(b'%s%d:' % (b't' if isinstance(value, tuple) else b'l', len(value)))
+        for item in value:
+            _encode_canonical(item, parts)
+    elif isinstance(value, (set, frozenset)):
+        parts.append(b'S%d:' % len(value))
+        parts.extend(sorted(_canonical_bytes(item) for item in value))
+    elif isinstance(value, dict):
+        parts.append(b'd%d:' % len(value))
+        parts.extend(sorted(_canonical_bytes(k) + _canonical_bytes(v)
+                            for k, v in value.items()))
+    else:
+        try:
+            data = pickle.dumps(value, 4)
+        except Exception as e:
+            raise TypeError("unpicklable value: %s" % e)
+        parts.append(b'p%d:' % len(data))
+        parts.append(data)
+
+def _canonical_bytes(value):
+    parts = []
+    _encode_canonical(value, parts)
+    return b''.join(parts)
+
+class DiskMemoCache(object):
+    """A persistent cache of function results in a local SQLite database,
+    for use with :py:func:`~pointfree.pfmemo` (usually by way of
+    :py:func:`~pointfree.pfdiskmemo`).  Several caches, e.g. for different
+    functions, can share one database file.
+
+    Keys are the SHA-256 digest of an encoding of the namespace and
+    arguments in which equal numbers, strings and bytes, and tuples, lists,
+    sets and dicts of them, always encode alike; other arguments are
+    pickled, so they must be picklable.  Values are stored pickled.  When the
+    database holds more than ``maxsize`` entries, the least recently used
+    ones are deleted until it is back to 90% of that size.  Lookups and
+    stores done through :py:meth:`get_many` and :py:meth:`put_many` take one
+    query or transaction per batch.
+
+    The cache may be shared between threads.  A forked child process opens
+    its own connection to the database.
+
+    :param path: Path of the SQLite database file
+    :param maxsize: Maximum number of entries in the database
+    :param namespace: Value distinguishing this cache's entries from those
+        of other caches in the same file
+
+    """
+
+    _batch = 500
+
+    def __init__(self, path, maxsize=100000, namespace=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._db = None
+
+    def __repr__(self):
+        return "DiskMemoCache(%r, hits=%d, misses=%d, evictions=%d)" \
+            % (self.path, self.hits, self.misses, self.evictions)
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            import sqlite3
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS memo "
+                                 "(key BLOB PRIMARY KEY, value BLOB, used REAL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS memo_used ON memo (used)")
+            self._count = self._db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+            self._pid = os.getpid()
+        return self._db
+
+    def _digest(self, key):
+        return hashlib.sha256(_canonical_bytes((self.namespace, key))).digest()
+
+    def get(self, key):
+        found = self.get_many([key])
+        if key in found:
+            return (True, found[key])
+        return (False, None)
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def get_many(self, keys):
+        """Returns a dictionary of the values found for the given keys."""
+
+        digests = dict((self._digest(key), key) for key in keys)
+        rows = []
+        with self._lock:
+            db = self._connection()
+            with db:
+                now = time.time()
+                for chunk in _chunked(list(digests), self._batch):
+                    marks = ",".join("?" * len(chunk))
+                    rows.extend(db.execute("SELECT key, value FROM memo WHERE key IN (%s)"
+                                           % marks, chunk).fetchall())
+                    db.execute("UPDATE memo SET used = ? WHERE key IN (%s)" % marks,
+                               [now] + chunk)
+
+            found = dict((digests[bytes(digest)], pickle.loads(value))
+                         for digest, value in rows)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Stores a list of ``(key, value)`` pairs."""
+
+        now = time.time()
+        rows = []
+        for key, value in items:
+            try:
+                rows.append((self._digest(key),
+                             pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now))
+            except Exception:
+                # Results that can't be pickled just aren't cached.
+                pass
+
+        with self._lock:
+            db = self._connection()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?)", rows)
+                self._count += len(rows)
+                if self._count > self.maxsize:
+                    self._count = db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+                if self._count > self.maxsize:
+                    excess = self._count - int(self.maxsize * 0.9)
+                    db.execute("DELETE FROM memo WHERE key IN "
+                               "(SELECT key FROM memo ORDER BY used LIMIT ?)",
+                               (excess,))
+                    self._count -= excess
+                    self.evictions += excess
+
+    def clear(self):
+        with self._lock:
+            db = self._connection()
+            with db:
+                db.execute("DELETE FROM memo")
+            self._count = 0
+
+def _code_identity(code):
+    """The bytecode, constants (including the code of nested functions)
+    and global and attribute names of a code object."""
+
+    return (code.co_code,
+            tuple(_code_identity(const) if isinstance(const, types.CodeType) else const
+                  for const in code.co_consts),
+            code.co_names)
+
+def _plain_value(value):
+    if value is None or isinstance(value, (int, float, complex, str, bytes)):
+        return True
+    return isinstance(value, (tuple, frozenset)) and all(map(_plain_value, value))
+
+def _identity_value(value):
+    """Identifies a default argument or closure variable: functions by their
+    code, and values other than numbers, strings, bytes and tuples of them
+    only by their type, since they may be mutable."""
+
+    if isinstance(value, types.FunctionType):
+        return ('function', value.__module__, value.__qualname__,
+                _code_identity(value.__code__))
+    elif _plain_value(value):
+        return value
+    return ('object', type(value).__module__, type(value).__qualname__)
+
+def _cell_value(cell):
+    try:
+        return _identity_value(cell.cell_contents)
+    except ValueError:
+        return ('empty',)
+
+def _function_identity(func, version):
+    """A value identifying a function across processes: its qualified
+    name, its code, its default argument and closure variable values (so
+    that editing the function invalidates its cached results) and a
+    user-supplied version."""
+
+    func = _unwrap_memo(getattr(func, 'func', func))
+    code = getattr(func, '__code__', None)
+    kwdefaults = getattr(func, '__kwdefaults__', None) or {}
+    return (getattr(func, '__module__', None),
+            getattr(func, '__qualname__', getattr(func, '__name__', None)),
+            _code_identity(code) if code is not None else None,
+            tuple(map(_identity_value, getattr(func, '__defaults__', None) or ())),
+            tuple((name, _identity_value(value)) for name, value in sorted(kwdefaults.items())),
+            tuple(map(_cell_value, getattr(func, '__closure__', None) or ())),
+            version)
+
+def pfdiskmemo(path, maxsize=100000, version=None):
+    """Returns a decorator like :py:func:`~pointfree.pfmemo`, but which
+    keeps results in a :py:class:`~pointfree.DiskMemoCache` at the given
+    path, so that they survive process restarts.
+
+    Entries are namespaced by the function's qualified name; its code,
+    including its constants and the global names it refers to; the values
+    of its default arguments and closure variables (functions by their
+    code, and values other than numbers, strings and tuples of them by
+    type alone); and the optional ``version``, which can be bumped to
+    invalidate results computed by an older version of the functions it
+    calls, or of the globals it uses.  Arguments and results must be
+    picklable.  Used with
+    :py:func:`~pointfree.pfmap`, lookups and stores are batched.
+
+    :param path: Path of the SQLite database file
+    :param maxsize: Maximum number of entries in the database
+    :param version: Optional version of the function's behavior
+    :rtype: Decorator returning a :py:class:`~pointfree.pointfree`
+
+    Example::
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "memo.db")
+
+        >>> @pfdiskmemo(path)
+        ... def slow_square(n):
+        ...     return n * n
+
+        >>> (pfmap(slow_square) >> pfcollect)([1, 2, 3, 2])
+        [1, 4, 9, 4]
+        >>> slow_square.memo.misses
+        4
+        >>> (pfmap(slow_square) >> pfsum)([1, 2, 3])
+        14
+        >>> slow_square.memo.hits
+        3
+
+    """
+
+    def decorator(func):
+        cache = DiskMemoCache(path, maxsize, _function_identity(func, version))
+        return pfmemo(cache=cache)(func)
+
+    return decorator
+
+class IncrementalPipeline(object):
+    """Maintains the results of a per-item pipeline, and optionally
+    aggregates over those results, for a dataset which changes a little
+    at a time, recomputing only what changed.
+
+    The pipeline must treat each record independently -- e.g. a
+    composition of :py:func:`~pointfree.pfmap` and
+    :py:func:`~pointfree.pffilter` stages -- since it is run on one record
+    at a time; it may produce any number of outputs per record.  Records
+    are identified by the given key function.  Aggregates are specified as
+    for :py:func:`~pointfree.pfaggregate`.  Aggregators which support
+    :py:meth:`~pointfree.Aggregator.remove` (count, sum and mean) are
+    updated by delta: the outputs of removed or changed records are
+    retracted and the outputs of new or changed records added.  Other
+    aggregates are recomputed from the current outputs when anything has
+    changed.
+
+    Changes can be applied as a new snapshot of the whole dataset with
+    :py:meth:`update`, which compares each record with its previous version
+    (cheap next to running the pipeline, but still proportional to the
+    dataset), or as deltas with :py:meth:`upsert` and :py:meth:`remove`,
+    which cost time proportional to the change set alone.
+
+    :param pipeline: Function from an iterable of records to an iterable of
+        outputs
+    :param key: Function returning the key of a record
+    :param aggregates: Optional dictionary of aggregates over the outputs,
+        by name
+
+    Example::
+
+        >>> inc = IncrementalPipeline(pfmap(lambda r: r[1] * 10)
+        ...                           >> pffilter(lambda n: n > 10),
+        ...                           key=lambda r: r[0],
+        ...                           aggregates={'total': 'sum', 'n': 'count'})
+        >>> inc.update([('a', 1), ('b', 2), ('c', 3)])
+        (3, 0, 0)
+        >>> inc.results()
+        [20, 30]
+        >>> inc.update([('a', 1), ('b', 5), ('d', 4)])
+        (1, 1, 1)
+        >>> inc.results(), sorted(inc.aggregates().items())
+        ([50, 40], [('n', 2), ('total', 90)])
+
+    """
+
+    def __init__(self, pipeline, key, aggregates=None):
+        self.pipeline = pipeline
+        self.key = key
+        self.specs = dict(aggregates or {})
+        self.aggregators = dict((name, _make_aggregator(spec))
+                                for name, spec in self.specs.items())
+        self.records = collections.OrderedDict()
+
+    def _apply(self, changed, removed):
+        """Recomputes the outputs of the changed records, drops the removed
+        keys, and brings the aggregates up to date.  Everything is computed
+        before anything is stored, so that an error raised by the pipeline
+        or an aggregator leaves the previous state intact."""
+
+        computed = collections.OrderedDict((k, (record, list(self.pipeline([record]))))
+                                           for k, record in changed)
+
+        retracted, added = [], []
+        for k in removed:
+            retracted.extend(self.records[k][1])
+        for k, (record, outputs) in computed.items():
+            if k in self.records:
+                retracted.extend(self.records[k][1])
+            added.extend(outputs)
+
+        aggregators = self.aggregators
+        if retracted or added:
+            aggregators = {}
+            for name, aggregator in self.aggregators.items():
+                if aggregator.removable:
+                    aggregator = copy.deepcopy(aggregator)
+                    aggregator.remove(retracted)
+                    aggregator.update(added)
+                else:
+                    aggregator = _make_aggregator(self.specs[name])
+                    results = self._outputs(computed, removed)
+                    for chunk in _chunked(results, _AGGREGATE_CHUNK):
+                        aggregator.update(chunk)
+                aggregators[name] = aggregator
+
+        for k in removed:
+            del self.records[k]
+        self.records.update(computed)
+        self.aggregators = aggregators
+
+    def _outputs(self, computed, removed):
+        """Yields the outputs the records would have with the given
+        computed records stored and the removed keys dropped."""
+
+        computed = computed.copy()
+        removed = set(removed)
+        for k, (record, outputs) in self.records.items():
+            if k in removed:
+                continue
+            for output in computed.pop(k, (record, outputs))[1]:
+                yield output
+        for record, outputs in computed.values():
+            for output in outputs:
+                yield output
+
+    def _latest(self, records):
+        """Maps each key among the given records to the last record with
+        that key."""
+
+        latest = collections.OrderedDict()
+        for record in records:
+            latest[self.key(record)] = record
+        return latest
+
+    def update(self, records):
+        """Replaces the dataset with a new snapshot, in which the last of
+        several records with the same key wins.  Returns the numbers of
+        keys ``(added, changed, removed)``."""
+
+        latest = self._latest(records)
+        changed = []
+        added = 0
+        for k, record in latest.items():
+            previous = self.records.get(k)
+            if previous is None:
+                added += 1
+                changed.append((k, record))
+            elif previous[0] != record:
+                changed.append((k, record))
+        removed = [k for k in self.records if k not in latest]
+        self._apply(changed, removed)
+        return (added, len(changed) - added, len(removed))
+
+    def upsert(self, records):
+        """Adds new records, or replaces existing records with the same
+        keys; the last of several records with the same key wins."""
+
+        self._apply(list(self._latest(records).items()), [])
+
+    def remove(self, keys):
+        """Removes the records with the given keys."""
+
+        keys = collections.OrderedDict.fromkeys(keys)
+        self._apply([], [k for k in keys if k in self.records])
+
+    def results(self):
+        """Returns the list of current pipeline outputs, in the order their
+        records were first added."""
+
+        return [output for record, outputs in self.records.values()
+                for output in outputs]
+
+    def aggregates(self):
+        """Returns a dictionary of the current aggregate results."""
+
+        return dict((name, aggregator.result())
+                    for name, aggregator in self.aggregators.items())
+
+# Markers sent to the consumers of a _fanout().
+_fanout_end = object()
+_fanout_error = object()
+
+class _FanoutAborted(Exception):
+    pass
+
+def _fanout_items(q):
+    while True:
+        chunk = q.get()
+        if chunk is _fanout_end:
+            return
+        elif chunk is _fanout_error:
+            raise _FanoutAborted()
+        for item in chunk:
+            yield item
+
+def _fanout(iterable, consumers, chunksize=256, depth=2, drain=False):
+    """Feeds the items of one iterable to several consumers -- functions
+    from an iterable to a result -- in a single pass, and returns the list
+    of their results.
+
+    Each consumer runs in its own thread, reading from a queue holding at
+    most ``depth`` chunks of ``chunksize`` items, so the consumers advance
+    in lockstep and memory use is bounded no matter how their speeds
+    differ.  A consumer which returns without exhausting its input is
+    simply not fed any further; once none are left, the rest of the
+    iterable is only read if ``drain`` is true."""
+
+    return _fanout_chunks(_chunked(iterable, chunksize), consumers, depth, drain)
+
+def _fanout_chunks(chunks, consumers, depth=2, drain=False):
+    """Like _fanout(), but for an iterable already divided into chunks."""
+
+    queues = [queue.Queue(depth) for consumer in consumers]
+    results = [None] * len(consumers)
+    errors = []
+
+    def run(i, consumer):
+        try:
+            results[i] = consumer(_fanout_items(queues[i]))
+        except _FanoutAborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, consumer))
+               for i, consumer in enumerate(consumers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    def feed(message):
+        for q, thread in zip(queues, threads):
+            while thread.is_alive():
+                try:
+                    q.put(message, timeout=0.05)
+                    break
+                except queue.Full:
+                    pass
+
+    try:
+        for chunk in chunks:
+            if not any(thread.is_alive() for thread in threads):
+                if not drain:
+                    break
+                continue
+            feed(chunk)
+    except BaseException:
+        feed(_fanout_error)
+        raise
+    else:
+        feed(_fanout_end)
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+def _materialize(value):
+    """Collects a lazy iterator result into a list, so that it stays valid
+    after its input has moved on."""
+
+    if isinstance(value, collections.abc.Iterator):
+        return list(value)
+    return value
+
+def _materialize_result(func):
+    """Wraps a function so that it collects a lazy iterator result before
+    returning, while its input is still being fed to it."""
+
+    return lambda iterable: _materialize(func(iterable))
+
+def _stage_key(stage):
+    """Key under which identical pipeline stages are merged: the wrapped
+    function and saved arguments of a partial instance, or else the stage
+    object itself."""
+
+    if isinstance(stage, partial):
+        key = (stage.func, frozenset(stage.argv.items()), tuple(stage.extra_argv))
+        try:
+            hash(key)
+            return key
+        except TypeError:
+            pass
+    return stage
+
+def _short_repr(value, limit=40):
+    if callable(value) and hasattr(value, '__name__'):
+        text = value.__name__
+    else:
+        text = repr(value)
+    return text if len(text) <= limit else text[:limit-3] + '...'
+
+def _stage_label(stage):
+    name = _short_repr(stage)
+    if isinstance(stage, partial) and (stage.argv or stage.extra_argv):
+        args = [_short_repr(v) for v in stage.extra_argv]
+        args = ["%s=%s" % (k, _short_repr(v)) for k, v in sorted(stage.argv.items())] + args
+        name = "%s(%s)" % (name, ", ".join(args))
+    return name
+
+class _DagNode(object):
+    def __init__(self, stage):
+        self.stage = stage
+        self.children = collections.OrderedDict()
+        self.outputs = []
+        self.uses = 0
+
+class PipelineDAG(object):
+    """Builds several pipelines over the same input into a tree of stages,
+    merging the common prefixes they share so that each shared stage runs
+    only once per input.
+
+    Pipelines are added as named sequences of stages.  Two stages are
+    considered identical -- and merged, if they also follow identical
+    prefixes -- when they are :py:class:`~pointfree.partial` instances
+    wrapping the same function with the same saved arguments, or when they
+    are the same object.  Where pipelines diverge, the output of the last
+    shared stage is fed to each branch in lockstep, in a single pass with
+    bounded memory, each branch consuming it in its own thread.
+
+    Calling the DAG with an input runs every pipeline and returns a
+    dictionary of their results by name.  A pipeline whose last stage
+    returns an iterator has its result collected into a list.  Use
+    ``pf(dag.run)`` to compose the DAG with other pointfree functions.
+
+    Example::
+
+        >>> parse = pfmap(int)
+        >>> dag = PipelineDAG()
+        >>> dag.add('total', parse, pffilter(lambda n: n > 0), pfsum)
+        >>> dag.add('largest', parse, pffilter(lambda n: n > 0), pfmax)
+        >>> dag.add('count', parse, pfcount)
+
+        >>> result = dag(["3", "-1", "4", "1", "-5"])
+        >>> sorted(result.items())
+        [('count', 5), ('largest', 4), ('total', 8)]
+
+    The two ``pffilter`` stages are built from different lambdas, so only
+    ``parse`` is shared.  :py:meth:`plan` shows how the stages were merged::
+
+        >>> print(dag.plan())
+        pfmap(func=int)  [merged x3]
+          pffilter(pred=<lambda>)
+            pfsum  [-> total]
+          pffilter(pred=<lambda>)
+            pfmax  [-> largest]
+          pfcount  [-> count]
+
+    """
+
+    def __init__(self):
+        self.roots = collections.OrderedDict()
+        self.names = []
+
+    def add(self, name, *stages):
+        """Adds a named pipeline consisting of the given stages, the first
+        of which is applied to the DAG's input."""
+
+        if name in self.names:
+            raise ValueError("duplicate pipeline name '%s'" % name)
+        if not stages:
+            raise ValueError("pipeline '%s' has no stages" % name)
+
+        level = self.roots
+        for stage in stages:
+            key = _stage_key(stage)
+            node = level.get(key)
+            if node is None:
+                node = level[key] = _DagNode(stage)
+            node.uses += 1
+            level = node.children
+        node.outputs.append(name)
+        self.names.append(name)
+
+    def _run(self, node, iterable, results):
+        value = node.stage(iterable)
+        branches = list(node.children.values())
+
+        if node.outputs:
+            value = _materialize(value)
+            for name in node.outputs:
+                results[name] = value
+            for child in branches:
+                self._run(child, iter(value), results)
+        else:
+            self._run_branches(branches, value, results)
+
+    def _run_branches(self, branches, iterable, results):
+        if len(branches) == 1:
+            self._run(branches[0], iterable, results)
+        elif branches:
+            _fanout(iterable, [functools.partial(self._run, child, results=results)
+                               for child in branches])
+
+    def run(self, iterable):
+        """Runs all pipelines over the given input, returning a dictionary
+        of their results by name."""
+
+        results = {}
+        self._run_branches(list(self.roots.values()), iterable, results)
+        return results
+
+    __call__ = run
+
+    def plan(self):
+        """Returns a description of the merged stages as indented text.
+        Stages shared by several pipelines are marked with the number of
+        pipelines merged into them, and each pipeline's name is shown
+        against its last stage."""
+
+        lines = []
+
+        def describe(node, depth):
+            notes = []
+            if node.uses > 1:
+                notes.append("merged x%d" % node.uses)
+            if node.outputs:
+                notes.append("-> " + ", ".join(node.outputs))
+            line = "  " * depth + _stage_label(node.stage)
+            if notes:
+                line += "  [%s]" % "; ".join(notes)
+            lines.append(line)
+            for child in node.children.values():
+                describe(child, depth + 1)
+
+        for root in self.roots.values():
+            describe(root, 0)
+        return "\n".join(lines)
+
+def _broadcast(sinks, iterable, chunksize=256):
+    aggregators = {}
+    consumers = []
+    for i, sink in enumerate(sinks):
+        if isinstance(sink, (str, Aggregator)):
+            aggregators[i] = _make_aggregator(sink)
+        else:
+            consumers.append((i, sink))
+
+    def chunks():
+        for chunk in _chunked(iterable, chunksize):
+            for aggregator in aggregators.values():
+                aggregator.update(chunk)
+            yield chunk
+
+    results = [None] * len(sinks)
+    consumed = _fanout_chunks(chunks(), [_materialize_result(sink)
+                                         for i, sink in consumers],
+                              drain=bool(aggregators))
+    for (i, sink), result in zip(consumers, consumed):
+        results[i] = result
+    for i, aggregator in aggregators.items():
+        results[i] = aggregator.result()
+    return tuple(results)
+
+def pfbroadcast(*sinks, chunksize=256):
+    """Returns a pointfree function which sends each item of an iterable to
+    every one of several sinks, in a single pass over the iterable and
+    with constant memory, and returns a tuple of the sinks' results.
+
+    A sink may be any function from an iterable to a result, such as
+    :py:func:`~pointfree.pfsum` or :py:func:`~pointfree.pfcollect`; each
+    such sink consumes the stream in its own thread, fed through a queue
+    of at most two chunks of ``chunksize`` items, so all sinks advance in
+    lockstep however their speeds differ.  A sink may also be an aggregate
+    as accepted by :py:func:`~pointfree.pfaggregate` -- the name of a
+    built-in aggregate, or an :py:class:`~pointfree.Aggregator` prototype
+    -- which is updated directly in the calling thread, one chunk at a
+    time.  A sink returning an iterator has its result collected into a
+    list.
+
+    :param sinks: Functions from an iterable to a result, or aggregates
+    :param chunksize: Keyword only; number of items handed to sinks at once
+    :rtype: :py:class:`~pointfree.pointfree` function from an iterable to a
+        tuple of results
+
+    Example::
+
+        >>> fn = pfmap(lambda n: n * 2) >> pfbroadcast(pfsum, pfcollect(n=3), 'max')
+        >>> fn(range(10))
+        (90, [0, 2, 4], 18)
+
+    """
+
+    return pointfree(_broadcast, sinks, chunksize=chunksize)
+
+def _spill(iterable, blocksize=1024, directory=None):
+    """Writes the items of an iterable to a temporary file as a sequence of
+    pickled lists, returning the file's path."""
+
+    fd, path = tempfile.mkstemp(prefix='pointfree-', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        for chunk in _chunked(iterable, blocksize):
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _unspill(path):
+    """Yields the items written to a file by _spill(), deleting the file
+    once it has been read (or the generator is closed)."""
+
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    return
+                for item in chunk:
+                    yield item
+    finally:
+        _remove_quietly(path)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _open_source(source):
+    """Sources of pfmerge() may be given as callables which open them."""
+
+    if callable(source) and not isinstance(source, collections.abc.Iterator):
+        return iter(source())
+    return iter(source)
+
+def _bisect_desc(keys, bound, lo, inclusive):
+    """bisect_left() or, if inclusive, bisect_right() for a list sorted in
+    descending order."""
+
+    hi = len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if bound < keys[mid] or (inclusive and not keys[mid] < bound):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _merge_batched(iterators, key, reverse, batch):
+    """Merges sorted iterators a block at a time.  Each round takes, from
+    every source's current block, the items up to the smallest (or, if
+    reverse, largest) last key among the blocks -- which no item yet to be
+    read can precede -- and orders them with one stable sort, which is far
+    cheaper than a heap operation per item."""
+
+    buffers = []
+    for iterator in iterators:
+        buffers.append([iterator, [], [], 0])
+
+    def refill(buf):
+        items = list(itertools.islice(buf[0], batch))
+        buf[1:] = [items, items if key is None else list(map(key, items)), 0]
+        return bool(items)
+
+    buffers = [buf for buf in buffers if refill(buf)]
+    while len(buffers) > 1:
+        last_keys = [buf[2][-1] for buf in buffers]
+        bound = max(last_keys) if reverse else min(last_keys)
+
+        # Items with keys equal to the bound are only taken up to the first
+        # source whose block they exhaust, since its next block could hold
+        # more such items, which must precede those of later sources.
+        taken = []
+        taken_keys = []
+        inclusive = True
+        for buf in buffers:
+            items, keys, pos = buf[1], buf[2], buf[3]
+            if reverse:
+                end = _bisect_desc(keys, bound, pos, inclusive)
+            elif inclusive:
+                end = bisect.bisect_right(keys, bound, pos)
+            else:
+                end = bisect.bisect_left(keys, bound, pos)
+            taken.extend(items[pos:end])
+            if key is not None:
+                taken_keys.extend(keys[pos:end])
+            buf[3] = end
+            if end == len(items):
+                inclusive = False
+
+        if key is None:
+            taken.sort(reverse=reverse)
+            for item in taken:
+                yield item
+        else:
+            # Sort positions by the keys already computed, rather than
+            # calling the key function again.
+            order = sorted(range(len(taken)), key=taken_keys.__getitem__,
+                           reverse=reverse)
+            for i in order:
+                yield taken[i]
+
+        buffers = [buf for buf in buffers if buf[3] < len(buf[1]) or refill(buf)]
+
+    for buf in buffers:
+        for item in buf[1][buf[3]:]:
+            yield item
+        for item in buf[0]:
+            yield item
+
+def _merge_sources(sources, key, reverse, batch):
+    iterators = [_open_source(source) for source in sources]
+    if batch:
+        return _merge_batched(iterators, key, reverse, batch)
+    else:
+        return heapq.merge(*iterators, key=key, reverse=reverse)
+
+def _merge_all(sources, key, reverse, batch, max_open, spilled=()):
+    """Merges the sources, first merging groups of them into spill files
+    while there are more than max_open.  Spill files in the list spilled
+    which are still around when the merge ends are removed."""
+
+    spilled = list(spilled)
+    try:
+        if max_open is not None:
+            while len(sources) > max_open:
+                groups = [sources[i:i+max_open]
+                          for i in range(0, len(sources), max_open)]
+                sources = []
+                for group in groups:
+                    path = _spill(_merge_sources(group, key, reverse, batch))
+                    spilled.append(path)
+                    sources.append(functools.partial(_unspill, path))
+
+        for item in _merge_sources(sources, key, reverse, batch):
+            yield item
+    finally:
+        for path in spilled:
+            _remove_quietly(path)
+
+@pointfree
+def pfmerge(*iterables, key=None, reverse=False, batch=None, max_open=None):
+    """Merges several sorted iterables into a single sorted iterator, like
+    :py:func:`heapq.merge`.  The merge is stable: items with equal keys
+    are yielded in the order of the iterables they came from, and in their
+    original order within each iterable.  Nothing is read from the
+    iterables until the result is iterated.
+
+    An iterable may also be given as a function of no arguments which
+    returns one, such as a function opening a file; it is called only
+    when the merge starts.  With ``max_open``, at most that many sources
+    are merged at once: larger sets of sources are merged in groups whose
+    results are spilled to temporary files, which are in turn merged, so
+    thousands of inputs can be merged without opening them all at the same
+    time.
+
+    With ``batch``, each source is read ``batch`` items at a time, and
+    items are ordered a round of blocks at a time by a single stable sort,
+    instead of by a heap operation per item; with many sources and large
+    batches this can be faster.
+
+    :param iterables: Sorted iterables, or functions returning them
+    :param key: Keyword only; function of one argument to compare items by
+    :param reverse: Keyword only; whether the iterables are sorted in
+        descending order
+    :param batch: Keyword only; number of items read from a source at once
+    :param max_open: Keyword only; maximum number of sources open at once
+    :rtype: Iterator over the merged items
+
+    Example::
+
+        >>> fn = pfmap(lambda word: word.upper()) >> pfcollect
+        >>> fn(pfmerge(["fig", "apple"], ["date"], ["banana", "cherry"], key=len))
+        ['FIG', 'DATE', 'APPLE', 'BANANA', 'CHERRY']
+
+    """
+
+    if max_open is not None and max_open < 2:
+        raise ValueError("max_open must be at least 2")
+    return _merge_all(list(iterables), key, reverse, batch, max_open)
+
+_SIZE_SAMPLE = 32
+_SORT_MAX_OPEN = 128
+
+def _items_within(sample, memory_limit):
+    """Estimates how many items like those in the list sample take up
+    memory_limit bytes, going by their pickled size."""
+
+    size = len(pickle.dumps(sample, pickle.HIGHEST_PROTOCOL))
+    return max(len(sample), memory_limit * len(sample) // max(size, 1))
+
+def _sorted_runs(iterable, key, reverse, memory_limit):
+    """Yields sorted lists of items from the iterable, each of which is
+    estimated to take up to memory_limit bytes."""
+
+    iterator = iter(iterable)
+    while True:
+        run = list(itertools.islice(iterator, _SIZE_SAMPLE))
+        if not run:
+            return
+        run_length = _items_within(run, memory_limit)
+        run.extend(itertools.islice(iterator, run_length - len(run)))
+        run.sort(key=key, reverse=reverse)
+        yield run
+        del run
+
+@pointfree
+def pfsort(iterable, key=None, reverse=False, memory_limit=None):
+    """Sorts the items of an iterable, like :py:func:`sorted`, but
+    returning an iterator over them.  The sort is stable.
+
+    With a ``memory_limit``, the iterable is sorted in runs of about that
+    many bytes each, which are written to temporary files and merged
+    lazily as the result is iterated (an external merge sort), so streams
+    larger than memory can be sorted.  The size of a run is estimated from
+    the pickled size of its first items; Python objects usually take
+    several times as much memory as their pickles, so leave headroom.
+    Items must be picklable if the input takes more than one run.
+
+    :param iterable: An iterable yielding values to sort
+    :param key: Function of one argument to compare items by
+    :param reverse: Whether to sort in descending order
+    :param memory_limit: Approximate number of bytes of items to sort in
+        memory at once
+    :rtype: Iterator over the sorted items
+
+    Example::
+
+        >>> fn = pfsort(key=len) >> pfcollect
+        >>> fn(["cherry", "fig", "apple", "date"])
+        ['fig', 'date', 'apple', 'cherry']
+
+    """
+
+    if memory_limit is None:
+        for item in sorted(iterable, key=key, reverse=reverse):
+            yield item
+        return
+
+    spilled = []
+    try:
+        runs = _sorted_runs(iterable, key, reverse, memory_limit)
+        first = next(runs, [])
+        second = next(runs, None)
+        if second is None:
+            # Everything fit in a single run, so nothing needs to be spilled
+            for item in first:
+                yield item
+            return
+
+        spilled.append(_spill(first))
+        spilled.append(_spill(second))
+        del first, second
+        for run in runs:
+            spilled.append(_spill(run))
+            del run
+        sources = [functools.partial(_unspill, path) for path in spilled]
+    except BaseException:
+        for path in spilled:
+            _remove_quietly(path)
+        raise
+
+    for item in _merge_all(sources, key, reverse, None, _SORT_MAX_OPEN, spilled):
+        yield item
+
+@pointfree
+def pfgroupby(iterable, key=None, memory_limit=None):
+    """Groups the items of an iterable by key, yielding ``(key, group)``
+    pairs in key order, where group is an iterator over the items with that
+    key in their original order.  Unlike :py:func:`itertools.groupby`, the
+    input need not be sorted: it is sorted first with :py:func:`pfsort`,
+    so with a ``memory_limit`` the whole dataset never has to fit in memory.
+    As with :py:func:`itertools.groupby`, a group must be consumed before
+    advancing to the next pair.
+
+    :param iterable: An iterable yielding values to group
+    :param key: Function of one argument computing an item's key; by
+        default items are grouped by their own value
+    :param memory_limit: Approximate number of bytes of items to sort in
+        memory at once
+    :rtype: Iterator over (key, group iterator) pairs
+
+    Example::
+
+        >>> fn = pfgroupby(key=len) \\
+        ...     >> pfmap(lambda group: (group[0], list(group[1]))) \\
+        ...     >> pfcollect
+        >>> fn(["cherry", "fig", "apple", "date", "kiwi"])
+        [(3, ['fig']), (4, ['date', 'kiwi']), (5, ['apple']), (6, ['cherry'])]
+
+    """
+
+    return itertools.groupby(pfsort(iterable, key=key, memory_limit=memory_limit),
+                             key)
+
+_JOIN_PARTITIONS = 64
+
+def _hash_index(items, key):
+    index = {}
+    for item in items:
+        k = key(item)
+        if k in index:
+            index[k].append(item)
+        else:
+            index[k] = [item]
+    return index
+
+def _probe(index, iterable, key, outer):
+    for item in iterable:
+        matches = index.get(key(item))
+        if matches:
+            for match in matches:
+                yield (item, match)
+        elif outer:
+            yield (item, None)
+
+def _partition(iterable, key, count, spilled):
+    """Splits the items of an iterable between count spill files by the
+    hashes of their keys, returning the paths of the files (which are also
+    appended to the list spilled)."""
+
+    paths = []
+    files = []
+    try:
+        for i in range(count):
+            fd, path = tempfile.mkstemp(prefix='pointfree-')
+            spilled.append(path)
+            paths.append(path)
+            files.append(os.fdopen(fd, 'wb'))
+
+        buffers = [[] for i in range(count)]
+        for item in iterable:
+            i = hash(key(item)) % count
+            buffers[i].append(item)
+            if len(buffers[i]) >= 1024:
+                pickle.dump(buffers[i], files[i], pickle.HIGHEST_PROTOCOL)
+                buffers[i] = []
+        for buffer, f in zip(buffers, files):
+            if buffer:
+                pickle.dump(buffer, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+def _join(right, iterable, left_key, right_key, outer, memory_limit):
+    right = iter(right)
+    if memory_limit is None:
+        for pair in _probe(_hash_index(right, right_key), iterable, left_key, outer):
+            yield pair
+        return
+
+    built = list(itertools.islice(right, _SIZE_SAMPLE))
+    capacity = _items_within(built, memory_limit) if built else 0
+    built.extend(itertools.islice(right, capacity - len(built) + 1))
+    if len(built) <= capacity:
+        for pair in _probe(_hash_index(built, right_key), iterable, left_key, outer):
+            yield pair
+        return
+
+    # The build side doesn't fit: partition both sides by key hash, then
+    # join each pair of partitions in memory.
+    spilled = []
+    try:
+        right_parts = _partition(itertools.chain(built, right), right_key,
+                                 _JOIN_PARTITIONS, spilled)
+        del built
+        left_parts = _partition(iterable, left_key, _JOIN_PARTITIONS, spilled)
+        for right_part, left_part in zip(right_parts, left_parts):
+            index = _hash_index(_unspill(right_part), right_key)
+            for pair in _probe(index, _unspill(left_part), left_key, outer):
+                yield pair
+    finally:
+        for path in spilled:
+            _remove_quietly(path)
+
+@pointfree
+def pfjoin(right, iterable, left_key, right_key=None, how='inner',
+           memory_limit=None):
+    """Joins the items of an iterable with those of a second iterable,
+    ``right``, by key, yielding a ``(left, right)`` pair for each pair of
+    items with equal keys.  A hash index of the right side is built when
+    iteration starts, and the left side is streamed through it lazily, in
+    order; so the right side should be the smaller one.  Items of the left
+    side with several matches yield a pair for each, in the right side's
+    order.
+
+    With ``how='left'``, items of the left side without any match are also
+    yielded, as ``(left, None)``.
+
+    If a ``memory_limit`` is given and the right side turns out to be
+    larger than that (going by the pickled size of its first items), both
+    sides are partitioned by key hash into temporary files, and each pair
+    of partitions is joined in turn (a grace hash join).  This works as
+    long as each of the 64 partitions of the right side fits in memory, but
+    reads the whole left side before yielding anything, and yields pairs
+    grouped by partition rather than in the left side's order.  Items must
+    be picklable in this mode.
+
+    :param right: An iterable yielding the values to look up
+    :param iterable: An iterable yielding the values to join
+    :param left_key: Function of one argument computing a left item's key
+    :param right_key: Function of one argument computing a right item's
+        key; defaults to left_key
+    :param how: 'inner' or 'left'
+    :param memory_limit: Approximate number of bytes the right side's
+        items may take in memory
+    :rtype: Iterator over (left, right) pairs
+
+    Example::
+
+        >>> prices = [("apple", 3), ("fig", 7)]
+        >>> fn = pfjoin(prices, left_key=lambda item: item[0], how='left') \\
+        ...     >> pfmap(lambda pair: (pair[0][0], pair[0][1], pair[1] and pair[1][1])) \\
+        ...     >> pfcollect
+        >>> fn([("fig", 2), ("kiwi", 1), ("apple", 5)])
+        [('fig', 2, 7), ('kiwi', 1, None), ('apple', 5, 3)]
+
+    """
+
+    if how not in ('inner', 'left'):
+        raise ValueError("how must be 'inner' or 'left', not %r" % (how,))
+    if right_key is None:
+        right_key = left_key
+    return _join(right, iterable, left_key, right_key, how == 'left', memory_limit)
+
+@pointfree
+def pfchunk(n, iterable, tuples=False):
+    """Splits an iterable into successive non-overlapping chunks of n items
+    each, except possibly the last, which holds whatever is left over.
+
+    :param n: The number of items in each chunk
+    :param iterable: An iterable yielding values to chunk
+    :param tuples: Whether to yield chunks as tuples rather than lists
+    :rtype: Iterator over lists (or tuples) of items
+
+    Example::
+
+        >>> fn = pfchunk(3) >> pfcollect
+        >>> fn(range(8))
+        [[0, 1, 2], [3, 4, 5], [6, 7]]
+
+    """
+
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    chunks = _chunked(iterable, n)
+    return map(tuple, chunks) if tuples else chunks
+
+class _Window(collections.abc.Sequence):
+    """A window yielded by pfwindow(): a read-only view of a slice of a
+    list which is only ever appended to, so that it stays valid as later
+    windows are yielded.  Compares equal to a tuple of the same items."""
+
+    __slots__ = ('_buffer', '_start', '_stop')
+
+    def __init__(self, buffer, start, stop):
+        self._buffer = buffer
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("window index out of range")
+        return self._buffer[self._start + index]
+
+    def __iter__(self):
+        return iter(self._buffer[self._start:self._stop])
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, _Window)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'window%r' % (tuple(self),)
+
+def _windows(n, iterable, step):
+    # Items are appended to a list holding up to 2n of them, and each
+    # window views its last n; once full, the list is replaced by a new
+    # one holding the last n - 1 items, leaving the old one to any windows
+    # still viewing it.  Copying n - 1 items every n + 1 makes it constant
+    # amortized time per item.
+    iterator = iter(iterable)
+    buffer = list(itertools.islice(iterator, n - 1))
+    skip = 0
+    for item in iterator:
+        if len(buffer) >= 2 * n:
+            buffer = buffer[len(buffer) - n + 1:]
+        buffer.append(item)
+        if skip:
+            skip -= 1
+            continue
+        yield _Window(buffer, len(buffer) - n, len(buffer))
+        skip = step - 1
+
+def _deque_windows(n, iterable, step):
+    window = collections.deque(maxlen=n)
+    iterator = iter(iterable)
+    window.extend(itertools.islice(iterator, n - 1))
+    skip = 0
+    for item in iterator:
+        window.append(item)
+        if skip:
+            skip -= 1
+            continue
+        yield window
+        skip = step - 1
+
+@pointfree
+def pfwindow(n, iterable, step=1, copy=True):
+    """Yields sliding windows of n consecutive items from an iterable, one
+    for every step items; a window is yielded once it is full, so an
+    iterable of fewer than n items yields none.  Each item costs constant
+    amortized time, however large n is.
+
+    By default each window is a read-only sequence which views a buffer
+    shared with the windows around it, rather than a copy of its items, so
+    yielding it costs constant time.  It stays valid after later windows
+    are yielded, and compares equal to a tuple of the same items; use
+    ``tuple(window)`` for a real tuple.  A window kept around keeps a
+    buffer of up to 2n items alive.  If copy is false, the window is
+    instead a :py:class:`collections.deque` of fixed length, the same one
+    every time, which changes as soon as the next window is requested, so
+    the consumer must not hold on to it.
+
+    :param n: The number of items in each window
+    :param iterable: An iterable yielding values
+    :param step: The number of items each window moves forward by
+    :param copy: Whether each window stays valid once the next one is
+        requested
+    :rtype: Iterator over sequences (or a deque) of n items
+
+    Example::
+
+        >>> fn = pfwindow(3) >> pfcollect
+        >>> fn(range(5))
+        [window(0, 1, 2), window(1, 2, 3), window(2, 3, 4)]
+        >>> fn(range(5))[0] == (0, 1, 2)
+        True
+
+        >>> fn = pfwindow(3, copy=False) >> pfmap(sum) >> pfcollect
+        >>> fn(range(5))
+        [3, 6, 9]
+
+    """
+
+    if n < 1 or step < 1:
+        raise ValueError("n and step must be at least 1")
+    if copy:
+        return _windows(n, iterable, step)
+    return _deque_windows(n, iterable, step)
+
+@pointfree
+def pfpairwise(iterable):
+    """Yields pairs of consecutive items from an iterable.
+
+    :param iterable: An iterable yielding values
+    :rtype: Iterator over (previous, next) pairs
+
+    Example::
+
+        >>> fn = pfpairwise >> pfmap(lambda pair: pair[1] - pair[0]) >> pfcollect
+        >>> fn([1, 4, 9, 16])
+        [3, 5, 7]
+
+    """
+
+    iterator = iter(iterable)
+    for previous in iterator:
+        for item in iterator:
+            yield (previous, item)
+            previous = item
+
+def _event_windows(size, slide, iterable, timestamp, lateness, aggregate):
+    """Assigns items to windows [k * slide, k * slide + size) by timestamp,
+    yielding (start, end, result) for each window with any items once the
+    watermark passes its end."""
+
+    windows = {}    # window number -> (aggregator, pending items)
+    open_windows = []    # heap of window numbers
+    watermark = None
+    for item in iterable:
+        t = timestamp(item)
+        if watermark is None or t - lateness > watermark:
+            watermark = t - lateness
+
+        first = int(math.floor((t - size) / float(slide))) + 1
+        last = int(math.floor(t / float(slide)))
+        for k in range(first, last + 1):
+            window = windows.get(k)
+            if window is None:
+                if k * slide + size <= watermark:
+                    continue    # Too late; the window has been emitted
+                window = windows[k] = (_make_aggregator(aggregate), [])
+                heapq.heappush(open_windows, k)
+            pending = window[1]
+            pending.append(item)
+            if len(pending) >= _AGGREGATE_CHUNK:
+                window[0].update(pending)
+                del pending[:]
+
+        while open_windows and open_windows[0] * slide + size <= watermark:
+            k = heapq.heappop(open_windows)
+            yield _close_window(k, size, slide, windows.pop(k))
+
+    while open_windows:
+        k = heapq.heappop(open_windows)
+        yield _close_window(k, size, slide, windows.pop(k))
+
+def _close_window(k, size, slide, window):
+    aggregator, pending = window
+    if pending:
+        aggregator.update(pending)
+    return (k * slide, k * slide + size, aggregator.result())
+
+def _check_windows(size, slide, lateness, aggregate):
+    if not size > 0 or not slide > 0:
+        raise ValueError("window size and slide must be positive")
+    if lateness < 0:
+        raise ValueError("lateness must not be negative")
+    _make_aggregator(aggregate)
+
+@pointfree
+def pftumbling(size, iterable, timestamp, lateness=0, aggregate='list'):
+    """Groups the items of a stream of events into consecutive,
+    non-overlapping windows of time, ``[0, size)``, ``[size, 2 * size)``
+    and so on, by the timestamp of each item, yielding a ``(start, end,
+    value)`` tuple for each window holding any items, where value is the
+    aggregate of the window's items.
+
+    Items may arrive out of order by up to ``lateness``: the watermark is
+    the latest timestamp seen so far less the lateness, and a window is
+    yielded as soon as the watermark reaches its end.  Items arriving
+    after their window has been yielded are dropped.  The rest of the
+    windows are yielded when the stream ends.  Only the windows which are
+    still open are kept in memory, each as an aggregator updated in chunks
+    as items arrive.
+
+    The aggregate is specified as for :py:func:`~pointfree.pfaggregate`;
+    by default the items in each window are collected in a list.  Use a
+    :py:class:`~pointfree.FoldAggregator` to fold each window with a
+    :py:func:`~pointfree.pfreduce`-style function.
+
+    :param size: The length of each window, in units of the timestamps
+    :param iterable: An iterable of events
+    :param timestamp: Function of one argument returning an event's
+        timestamp (a number)
+    :param lateness: How far behind the latest timestamp events may arrive
+    :param aggregate: The aggregate to compute for each window
+    :rtype: Iterator over (start, end, value) tuples
+
+    Example::
+
+        >>> events = [(1, "a"), (3, "b"), (12, "c"), (8, "d"), (25, "e")]
+        >>> fn = pftumbling(10, timestamp=lambda e: e[0], lateness=5, aggregate='count') \\
+        ...     >> pfcollect
+        >>> fn(events)
+        [(0, 10, 3), (10, 20, 1), (20, 30, 1)]
+
+    """
+
+    _check_windows(size, size, lateness, aggregate)
+    return _event_windows(size, size, iterable, timestamp, lateness, aggregate)
+
+@pointfree
+def pfsliding(size, slide, iterable, timestamp, lateness=0, aggregate='list'):
+    """Like :py:func:`~pointfree.pftumbling`, but with windows of time
+    ``[0, size)``, ``[slide, slide + size)``, ``[2 * slide, 2 * slide +
+    size)`` and so on (and likewise before zero), which overlap if slide is
+    less than size; each item is aggregated in every window it falls in.
+
+    :param size: The length of each window, in units of the timestamps
+    :param slide: The distance between the starts of consecutive windows
+    :param iterable: An iterable of events
+    :param timestamp: Function of one argument returning an event's
+        timestamp (a number)
+    :param lateness: How far behind the latest timestamp events may arrive
+    :param aggregate: The aggregate to compute for each window
+    :rtype: Iterator over (start, end, value) tuples
+
+    Example::
+
+        >>> fn = pfsliding(10, 5, timestamp=lambda t: t, aggregate='sum') >> pfcollect
+        >>> fn([1, 6, 7, 12])
+        [(-5, 5, 1), (0, 10, 14), (5, 15, 25), (10, 20, 12)]
+
+    """
+
+    _check_windows(size, slide, lateness, aggregate)
+    return _event_windows(size, slide, iterable, timestamp, lateness, aggregate)
+
+@pointfree
+def pfscan(func, iterable, initial=None):
+    """A running version of :py:func:`~pointfree.pfreduce`: yields each
+    intermediate value of the fold, by way of
+    :py:func:`itertools.accumulate`.  If an initial value is supplied, it
+    is yielded first and the items are folded into it.
+
+    :param func: A function of two arguments
+    :param iterable: An iterable yielding input for the function
+    :param initial: An optional initial input for the function
+    :rtype: Iterator over the accumulated values
+
+    Example::
+
+        >>> from operator import add
+        >>> running_total = pfscan(add) >> pfcollect
+        >>> running_total([1, 2, 3, 4])
+        [1, 3, 6, 10]
+
+        >>> fn = pfscan(lambda acc, word: acc + word[0], initial="") >> pfcollect
+        >>> fn(["foo", "bar"])
+        ['', 'f', 'fb']
+
+    """
+
+    if initial is not None:
+        iterable = itertools.chain((initial,), iterable)
+    return itertools.accumulate(iterable, func)
+
+@pointfree
+def pfstats(iterable, ddof=0):
+    """Computes summary statistics of the items of an iterable in a single
+    pass and constant memory, with a
+    :py:class:`~pointfree.StatsAggregator`.
+
+    :param iterable: An iterable yielding numbers
+    :param ddof: Delta degrees of freedom for the variance
+    :rtype: :py:class:`~pointfree.Stats` tuple of count, mean, variance,
+        min and max
+
+    Example::
+
+        >>> pfstats([2, 4, 4, 4, 5, 5, 7, 9])
+        Stats(count=8, mean=5.0, variance=4.0, min=2, max=9)
+
+    """
+
+    return _aggregate(StatsAggregator(ddof), iterable)
+
+@pointfree
+def pfrunning_stats(iterable, ddof=0):
+    """Yields the summary statistics of the items seen so far after each
+    item of an iterable, updated in constant time per item with Welford's
+    algorithm.
+
+    :param iterable: An iterable yielding numbers
+    :param ddof: Delta degrees of freedom for the variance
+    :rtype: Iterator over :py:class:`~pointfree.Stats` tuples
+
+    Example::
+
+        >>> fn = pfrunning_stats >> pfmap(lambda stats: stats.mean) >> pfcollect
+        >>> fn([1, 2, 6])
+        [1.0, 1.5, 3.0]
+
+    """
+
+    count = 0
+    mean = m2 = 0.0
+    low = high = None
+    for x in iterable:
+        count += 1
+        delta = x - mean
+        mean += delta / count
+        m2 += delta * (x - mean)
+        if low is None or x < low:
+            low = x
+        if high is None or x > high:
+            high = x
+        yield _stats_result(count, mean, m2, low, high, ddof)
+
+@pointfree
+def pftop(k, iterable, key=None):
+    """Returns the k largest items of an iterable, largest first, like
+    ``sorted(iterable, key=key, reverse=True)[:k]`` but in O(n log k) time
+    and O(k) memory, by way of :py:func:`heapq.nlargest`.  See
+    :py:class:`~pointfree.TopKAggregator` to compute the top k items of
+    separate partitions and combine them.
+
+    :param k: The number of items to return
+    :param iterable: An iterable yielding values
+    :param key: Function of one argument to compare items by
+    :rtype: List of up to k items
+
+    Example::
+
+        >>> scores = [("ann", 7), ("bob", 9), ("cy", 3), ("di", 8)]
+        >>> fn = pftop(2, key=lambda item: item[1])
+        >>> fn(scores)
+        [('bob', 9), ('di', 8)]
+
+    """
+
+    return heapq.nlargest(k, iterable, key=key)
+
+@pointfree
+def pfbottom(k, iterable, key=None):
+    """Returns the k smallest items of an iterable, smallest first, in
+    O(n log k) time and O(k) memory, by way of :py:func:`heapq.nsmallest`.
+
+    :param k: The number of items to return
+    :param iterable: An iterable yielding values
+    :param key: Function of one argument to compare items by
+    :rtype: List of up to k items
+
+    Example::
+
+        >>> fn = pfmap(len) >> pfbottom(2)
+        >>> fn(["apple", "fig", "banana", "kiwi"])
+        [3, 4]
+
+    """
+
+    return heapq.nsmallest(k, iterable, key=key)
+
+@pointfree
+def pfcount_distinct(iterable, precision=14):
+    """Estimates the number of distinct items in an iterable in fixed
+    memory, with a :py:class:`~pointfree.DistinctCountAggregator`
+    (HyperLogLog) sketch: with the default precision the estimate has a
+    relative standard error of 0.81%, using 16 KiB.
+
+    :param iterable: An iterable yielding hashable values
+    :param precision: Number of hash bits selecting a register, 4 to 18
+    :rtype: Estimated number of distinct items
+
+    Example::
+
+        >>> estimate = pfcount_distinct(n % 1000 for n in range(100000))
+        >>> abs(estimate - 1000) < 20
+        True
+
+    """
+
+    return _aggregate(DistinctCountAggregator(precision), iterable)
+
+@pointfree
+def pfquantiles(quantiles, iterable, k=200, seed=None):
+    """Estimates quantiles of the items of an iterable in fixed memory,
+    with a :py:class:`~pointfree.QuantilesAggregator` (KLL) sketch: with
+    the default k, the rank of each estimate is within about 1.65% of the
+    number of items of the true rank, with 99% confidence.
+
+    :param quantiles: A sequence of quantiles, each from 0 to 1
+    :param iterable: An iterable yielding comparable values
+    :param k: Accuracy parameter of the sketch
+    :param seed: Optional random seed
+    :rtype: List of the estimated value of each quantile
+
+    Example::
+
+        >>> estimates = pfquantiles([0.1, 0.5, 0.9], range(1000))
+        >>> [int(round(estimate, -2)) for estimate in estimates]
+        [100, 500, 900]
+
+    """
+
+    quantile = _aggregate(QuantilesAggregator(k, seed), iterable)
+    return [quantile(q) for q in quantiles]
+
+@pointfree
+def pfsample(k, iterable, seed=None):
+    """Selects a uniform random sample of k items from an iterable (or all
+    of them, if there are fewer) in O(k) memory, with a
+    :py:class:`~pointfree.SampleAggregator`.
+
+    :param k: The size of the sample
+    :param iterable: An iterable yielding values
+    :param seed: Optional random seed
+    :rtype: List of up to k items, in no particular order
+
+    Example::
+
+        >>> sample = pfsample(3, range(1000000))
+        >>> len(sample), len(set(sample))
+        (3, 3)
+
+    """
+
+    return _aggregate(SampleAggregator(k, seed), iterable)
+
+@pointfree
+def pffrequent(k, iterable):
+    """Finds the most frequent items of an iterable with k counters, using
+    a :py:class:`~pointfree.FrequentAggregator` (Space-Saving) summary.
+    Every item which makes up more than 1 / k of the items is reported,
+    and each reported count overestimates the true count by at most the
+    number of items divided by k.
+
+    :param k: The number of counters
+    :param iterable: An iterable yielding hashable values
+    :rtype: List of up to k (item, count) pairs, most frequent first
+
+    Example::
+
+        >>> pffrequent(2, "abracadabra")
+        [('a', 5), ('b', 2)]
+
+    """
+
+    return _aggregate(FrequentAggregator(k), iterable)
+
+class _BloomFilter(object):
+    """A Bloom filter sized for capacity keys at the given false positive
+    rate, with its bits in a bytearray and its hashes derived from one
+    128-bit hash per key by double hashing."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate)
+                                         / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        """Adds a key, returning whether it was (probably) present."""
+
+        h = _sketch_hash(key, 16)
+        h1, h2 = h >> 64, (h & 0xffffffffffffffff) | 1
+        bits, size = self.bits, self.size
+        present = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                present = False
+        return present
+
+def _unique(iterable, key, mode, capacity, error_rate):
+    if mode == 'exact':
+        seen = set()
+        for item in iterable:
+            k = item if key is None else key(item)
+            if k not in seen:
+                seen.add(k)
+                yield item
+    elif mode == 'lru':
+        seen = collections.OrderedDict()
+        for item in iterable:
+            k = item if key is None else key(item)
+            if k in seen:
+                seen.move_to_end(k)
+            else:
+                seen[k] = None
+                if len(seen) > capacity:
+                    seen.popitem(last=False)
+                yield item
+    else:
+        seen = _BloomFilter(capacity, error_rate)
+        for item in iterable:
+            if not seen.add(item if key is None else key(item)):
+                yield item
+
+@pointfree
+def pfunique(iterable, key=None, mode='exact', capacity=None, error_rate=0.01):
+    """Yields the items of an iterable, skipping any whose key has been
+    seen before.  How keys are remembered depends on the mode:
+
+    ``'exact'``
+        Keys are kept in a set, which grows with the number of distinct
+        keys.
+
+    ``'lru'``
+        Up to ``capacity`` keys are kept, forgetting the least recently
+        seen; duplicates are only dropped if they occur within that many
+        distinct keys of each other, which suits streams where duplicates
+        arrive close together.
+
+    ``'bloom'``
+        Keys are recorded in a Bloom filter sized for ``capacity`` keys,
+        using about ``-1.44 * log2(error_rate)`` bits per key (9.6 bits at
+        the default 1%).  Duplicates are always dropped, but each new key
+        is wrongly dropped as a duplicate with probability up to
+        ``error_rate`` -- more once the stream has more than ``capacity``
+        distinct keys.  Keys are hashed by an encoding in which equal
+        numbers, strings and bytes, and tuples, lists, sets and dicts of
+        them, always encode alike; other keys are hashed by their pickles,
+        so those which compare equal but pickle differently are treated
+        as distinct.
+
+    :param iterable: An iterable yielding values
+    :param key: Function of one argument computing an item's key; by
+        default items are their own keys
+    :param mode: ``'exact'``, ``'lru'`` or ``'bloom'``
+    :param capacity: The number of keys remembered, for the ``'lru'`` and
+        ``'bloom'`` modes
+    :param error_rate: The false positive rate of the ``'bloom'`` mode
+    :rtype: Iterator over the first item with each key
+
+    Example::
+
+        >>> fn = pfunique(key=str.lower) >> pfcollect
+        >>> fn(["a", "B", "A", "c", "b"])
+        ['a', 'B', 'c']
+
+        >>> fn = pfunique(mode='lru', capacity=2) >> pfcollect
+        >>> fn([1, 2, 1, 3, 4, 1])
+        [1, 2, 3, 4, 1]
+
+    """
+
+    if mode not in ('exact', 'lru', 'bloom'):
+        raise ValueError("mode must be 'exact', 'lru' or 'bloom', not %r" % (mode,))
+    if mode != 'exact' and not (capacity and capacity > 0):
+        raise ValueError("mode %r needs a positive capacity" % mode)
+    if mode == 'bloom' and not 0 < error_rate < 1:
+        raise ValueError("error_rate must be between 0 and 1")
+    return _unique(iterable, key, mode, capacity, error_rate)
+
+@pointfree
+def pfwrite_lines(file, iterable, end=None, chunksize=1024):
+    """Writes the items of an iterable, which must be strings (for a text
+    file) or bytes (for a binary file), to a file as lines.  Lines are
+    joined and written a chunk at a time, so that writing takes a few
+    calls per chunk instead of one per line.
+
+    :param file: A file object open for writing, in text or binary mode
+    :param iterable: An iterable yielding lines, without line endings
+    :param end: The line ending, by default a newline of the same type as
+        the lines
+    :param chunksize: Number of lines written at a time
+    :rtype: None
+
+    Example::
+
+        >>> import io
+        >>> out = io.BytesIO()
+        >>> fn = pfmap(lambda n: b"line %d" % n) >> pfwrite_lines(out)
+        >>> fn(range(3))
+        >>> out.getvalue()
+        b'line 0\\nline 1\\nline 2\\n'
+
+    """
+
+    for chunk in _chunked(iterable, chunksize):
+        if end is None:
+            end = b'\n' if isinstance(chunk[0], bytes) else '\n'
+        file.writelines((end.join(chunk), end))
+
+_READ_BLOCK = 1 << 20
+
+def _newline_blocks(f, use_mmap, start=0, end=None):
+    """Yields (buffer, start, end) triples spanning the bytes from start to
+    end of a binary file in blocks of about _READ_BLOCK bytes, each block
+    but the last ending just after a newline.  The buffer is a memory map
+    of the file if use_mmap is true (and the file isn't empty), or else a
+    bytes object read from it."""
+
+    size = os.fstat(f.fileno()).st_size
+    if end is None or end > size:
+        end = size
+    if start >= end:
+        return
+
+    if use_mmap:
+        import mmap
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = start
+            while pos < end:
+                cut = end
+                if pos + _READ_BLOCK < end:
+                    newline = mapped.find(b'\n', pos + _READ_BLOCK - 1, end)
+                    if newline >= 0:
+                        cut = newline + 1
+                yield (mapped, pos, cut)
+                pos = cut
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                pass    # Views of it are still in use; they keep it open
+        return
+
+    f.seek(start)
+    remaining = end - start
+    carry = b''
+    while remaining:
+        data = f.read(min(_READ_BLOCK, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        data = carry + data
+        cut = data.rfind(b'\n') + 1
+        if cut:
+            yield (data, 0, cut)
+        carry = data[cut:]
+    if carry:
+        yield (carry, 0, len(carry))
+
+def _split_block(chunk, newline, keepends):
+    """Splits a block of text or bytes into lines.  Unless keepends is
+    true, line endings are removed, including the carriage return of a
+    CRLF."""
+
+    lines = chunk.split(newline)
+    if chunk.endswith(newline):
+        lines.pop()
+        ended = len(lines)
+    else:
+        ended = len(lines) - 1
+    if keepends:
+        for i in range(ended):
+            lines[i] += newline
+    else:
+        cr = b'\r' if isinstance(newline, bytes) else '\r'
+        if cr in chunk:
+            lines = [line[:-1] if line.endswith(cr) else line for line in lines]
+    return lines
+
+def _split_views(buf, start, end, keepends):
+    """Splits part of a buffer into lines as memoryview slices of it."""
+
+    view = memoryview(buf)
+    lines = []
+    find = buf.find
+    pos = start
+    while pos < end:
+        newline = find(b'\n', pos, end)
+        cut = end if newline < 0 else newline + 1
+        line_end = cut
+        if not keepends:
+            if newline >= 0:
+                line_end -= 1
+            if line_end > pos and buf[line_end - 1] == 13:
+                line_end -= 1
+        lines.append(view[pos:line_end])
+        pos = cut
+    return lines
+
+def _line_lists(path, use_mmap, mode, keepends, encoding, errors, first, last):
+    with open(path, 'rb') as f:
+        for buf, start, end in _newline_blocks(f, use_mmap, first, last):
+            if mode == 'view':
+                yield _split_views(buf, start, end, keepends)
+                continue
+            chunk = buf[start:end]
+            if mode == 'text':
+                yield _split_block(chunk.decode(encoding, errors), '\n', keepends)
+            else:
+                yield _split_block(chunk, b'\n', keepends)
+
+def _rebatch(lists, size):
+    """Regroups the items of an iterable of lists into lists of size items
+    (but the last)."""
+
+    pending = []
+    for items in lists:
+        i = 0
+        if pending:
+            i = size - len(pending)
+            pending.extend(items[:i])
+            if len(pending) < size:
+                continue
+            yield pending
+        while i + size <= len(items):
+            yield items[i:i+size]
+            i += size
+        pending = items[i:]
+    if pending:
+        yield pending
+
+@pointfree
+def pfread_lines(path, mmap=True, mode='text', batch=None, keepends=False,
+                 encoding='utf-8', errors='strict', start=0, end=None):
+    """Reads the lines of a file, as a source for a pipeline.  The file is
+    memory-mapped (or, if ``mmap`` is false, read in large blocks), and
+    split into lines a block of about a megabyte at a time by
+    :py:meth:`bytes.split`, so that reading costs little per line.
+
+    Lines are separated by newlines; unless ``keepends`` is true, line
+    endings are removed, including the carriage return of a CRLF.  In
+    ``'text'`` mode, lines are decoded with the given encoding, which must
+    represent newlines as the single byte ``\\n`` (as UTF-8, ASCII and
+    the Latin encodings do).  In ``'bytes'`` mode they are bytes.  In
+    ``'view'`` mode they are :py:class:`memoryview` slices of the memory
+    map (or of the block read), which cost no copying of the line data --
+    worthwhile for long lines, though creating a view takes longer than
+    copying a short line; the map stays open as long as any of them are
+    referenced.
+
+    With a ``batch`` size, lists of up to that many lines are yielded
+    instead of single lines.  To read only part of the file, give the
+    offsets of the ``start`` and ``end`` of a range of bytes, which should
+    be at line boundaries.
+
+    :param path: The path of the file to read
+    :param mmap: Whether to memory-map the file
+    :param mode: ``'text'``, ``'bytes'`` or ``'view'``
+    :param batch: Optional number of lines to yield in each list
+    :param keepends: Whether to keep line endings
+    :param encoding: The encoding of the file in ``'text'`` mode
+    :param errors: How to handle decoding errors, as for
+        :py:meth:`bytes.decode`
+    :param start: Offset of the first byte to read
+    :param end: Offset after the last byte to read, or None to read to the
+        end of the file
+    :rtype: Iterator over lines, or lists of lines
+
+    Example::
+
+        >>> import os, tempfile
+        >>> fd, path = tempfile.mkstemp()
+        >>> with os.fdopen(fd, 'wb') as f:
+        ...     _ = f.write(b"apple 3\\nfig 7\\r\\nkiwi 1")
+
+        >>> fn = pfread_lines >> pfmap(lambda line: line.split()[0]) >> pfcollect
+        >>> fn(path)
+        ['apple', 'fig', 'kiwi']
+
+        >>> fn = pfread_lines(mode='bytes', batch=2) >> pfcollect
+        >>> fn(path)
+        [[b'apple 3', b'fig 7'], [b'kiwi 1']]
+
+        >>> os.remove(path)
+
+    """
+
+    if mode not in ('text', 'bytes', 'view'):
+        raise ValueError("mode must be 'text', 'bytes' or 'view', not %r" % (mode,))
+    lists = _line_lists(path, mmap, mode, keepends, encoding, errors, start, end)
+    if batch:
+        return _rebatch(lists, batch)
+    return itertools.chain.from_iterable(lists)
+
+def _shard_ranges(path, shards):
+    """Splits a file into up to shards byte ranges of about equal size,
+    each but the last ending just after a newline."""
+
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, shards):
+            guess = max(size * i // shards, boundaries[-1])
+            if guess >= size:
+                break
+            f.seek(max(guess - 1, 0))
+            f.readline()
+            boundaries.append(f.tell())
+    boundaries.append(size)
+    return [(a, b) for a, b in zip(boundaries, boundaries[1:]) if a < b]
+
+def _unless_stopped(stopped, iterable):
+    for item in iterable:
+        if stopped.is_set():
+            raise _FanoutAborted()
+        yield item
+
+def _shard_worker(pipeline, path, index, start, end, read_options, out, batch,
+                  serialize, spill_dir, stopped):
+    """Runs the pipeline over a range of lines of a file, sending (index,
+    kind, payload) messages to the out queue: 'items' with lists of the
+    result's items if it's an iterator -- or, with spill_dir, 'spilled'
+    with the path of a file they were spilled to -- or else 'result' with
+    the result; then 'done', or 'error' with an exception.
+
+    With serialize, payloads are sent pickled, so that failures to pickle
+    them are reported as errors.  With stopped, an event set when the
+    consumer goes away, the worker gives up once it is set."""
+
+    def send(kind, payload):
+        if serialize:
+            payload = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        while True:
+            try:
+                out.put((index, kind, payload), timeout=0.1)
+                return
+            except queue.Full:
+                if stopped is not None and stopped.is_set():
+                    raise _FanoutAborted()
+
+    try:
+        if stopped is None:
+            lines = pfread_lines(path, start=start, end=end, **read_options)
+        else:
+            batches = pfread_lines(path, start=start, end=end, batch=batch, **read_options)
+            lines = itertools.chain.from_iterable(_unless_stopped(stopped, batches))
+        result = pipeline(lines)
+        if isinstance(result, collections.abc.Iterator):
+            if spill_dir is not None:
+                send('spilled', _spill(result, batch, spill_dir))
+            else:
+                for chunk in _chunked(result, batch):
+                    send('items', chunk)
+        else:
+            send('result', result)
+        send('done', None)
+    except _FanoutAborted:
+        pass
+    except BaseException as e:
+        try:
+            send('error', e)
+        except _FanoutAborted:
+            pass
+        except Exception:
+            send('error', RuntimeError("%s: %s" % (type(e).__name__, e)))
+
+# Batches queued by each pfread_sharded worker ahead of the consumer
+_SHARD_QUEUE_DEPTH = 4
+
+def _sharded(path, pipeline, shards, ordered, executor, read_options, batch):
+    ranges = _shard_ranges(path, shards)
+    serialize = executor == 'process'
+    if serialize:
+        context = _process_context()
+        make_queue, Worker, stopped = context.Queue, context.Process, None
+    else:
+        make_queue, Worker, stopped = queue.Queue, threading.Thread, threading.Event()
+
+    # In order, each worker has its own queue, read in turn, and the output
+    # of all but the first shard is spilled to disk until its turn comes.
+    # Otherwise, the workers share one queue.
+    if ordered:
+        queues = [make_queue(_SHARD_QUEUE_DEPTH) for r in ranges]
+        spill_dir = tempfile.mkdtemp(prefix='pointfree-')
+    else:
+        queues = [make_queue(_SHARD_QUEUE_DEPTH * len(ranges))] * len(ranges)
+        spill_dir = None
+
+    workers = [Worker(target=_shard_worker,
+                      args=(pipeline, path, i, start, end, read_options, queues[i],
+                            batch, serialize, spill_dir if i > 0 else None, stopped))
+               for i, (start, end) in enumerate(ranges)]
+    finished = [False] * len(workers)
+    try:
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        current = 0
+        while not all(finished):
+            waiting = [current] if ordered else \
+                [i for i, done in enumerate(finished) if not done]
+            # Checked before waiting, so that any message a worker sent
+            # before it exited is received first.
+            dead = [i for i in waiting if not workers[i].is_alive()]
+            try:
+                index, kind, payload = queues[waiting[0]].get(timeout=0.1)
+            except queue.Empty:
+                if dead:
+                    raise RuntimeError("pfread_sharded worker for shard %d exited "
+                                       "before finishing (exit code %s)"
+                                       % (dead[0], getattr(workers[dead[0]], 'exitcode', None)))
+                continue
+
+            if serialize:
+                payload = pickle.loads(payload)
+            if kind == 'error':
+                raise payload
+            elif kind == 'done':
+                finished[index] = True
+                if ordered:
+                    current += 1
+            elif kind == 'items':
+                for item in payload:
+                    yield item
+            elif kind == 'spilled':
+                for item in _unspill(payload):
+                    yield item
+            else:
+                yield payload
+
+        for worker in workers:
+            worker.join()
+    finally:
+        # Threads give up within a batch of lines once stopped is set.
+        if stopped is not None:
+            stopped.set()
+        for worker in workers:
+            if serialize and worker.is_alive():
+                worker.terminate()
+            if worker.ident is not None:
+                worker.join()
+        if spill_dir is not None:
+            import shutil
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+@pointfree
+def pfread_sharded(path, pipeline, shards=None, ordered=True, executor='process',
+                   mode='text', encoding='utf-8', batch=1024):
+    """Reads the lines of a file in parallel: the file is split into
+    ``shards`` byte ranges of about equal size, aligned to line
+    boundaries, and each range is read by :py:func:`~pointfree.pfread_lines`
+    and run through the pipeline in its own worker process (or thread, if
+    ``executor`` is ``'thread'``).
+
+    If the pipeline returns an iterator, its items are sent back in
+    batches of ``batch`` items and yielded; otherwise the pipeline's result
+    for each shard is yielded, so a sink such as
+    :py:func:`~pointfree.pfsum` yields a partial result per shard, to be
+    combined downstream.  With ``ordered``, results are yielded in the
+    order of the file: the first shard's items are streamed as they are
+    produced, while those of later shards are spilled to temporary files
+    until their turn comes, so memory use stays bounded however far ahead
+    the later shards get.  Otherwise results are yielded as they arrive,
+    and workers wait while a few batches are queued.  An exception raised
+    by the pipeline is re-raised by this function, and a worker that dies
+    raises :py:exc:`RuntimeError`.
+
+    Worker processes are started with the ``fork`` start method where it
+    is available, so that they inherit the pipeline; elsewhere it must be
+    picklable.  The results must be picklable, except with threads in
+    unordered mode.
+
+    :param path: The path of the file to read
+    :param pipeline: A function of an iterator over lines
+    :param shards: Number of byte ranges, and workers; by default the
+        number of CPUs
+    :param ordered: Whether to yield results in the order of the file
+    :param executor: ``'process'`` or ``'thread'``
+    :param mode: ``'text'`` or ``'bytes'``, as for
+        :py:func:`~pointfree.pfread_lines`
+    :param encoding: The encoding of the file in ``'text'`` mode
+    :param batch: Number of items sent back from a worker at a time
+    :rtype: Iterator over results
+
+    Example::
+
+        >>> import os, tempfile
+        >>> fd, path = tempfile.mkstemp()
+        >>> with os.fdopen(fd, 'w') as f:
+        ...     _ = f.write("".join("%d\\n" % n for n in range(1000)))
+
+        >>> fn = pfread_sharded(pipeline=pfmap(int) >> pffilter(lambda n: n % 100 == 0), shards=3) \\
+        ...     >> pfcollect
+        >>> fn(path)
+        [0, 100, 200, 300, 400, 500, 600, 700, 800, 900]
+
+        >>> fn = pfread_sharded(pipeline=pfmap(int) >> pfsum, shards=3) >> pfsum
+        >>> fn(path)
+        499500
+
+        >>> os.remove(path)
+
+    """
+
+    if executor not in ('process', 'thread'):
+        raise ValueError("executor must be 'process' or 'thread', not %r" % (executor,))
+    if mode not in ('text', 'bytes'):
+        raise ValueError("mode must be 'text' or 'bytes', not %r" % (mode,))
+    if shards is None:
+        shards = os.cpu_count() or 1
+    read_options = {'mode': mode, 'encoding': encoding}
+    return _sharded(path, pipeline, shards, ordered, executor, read_options, batch)
+
+# Kinds of numpy types corresponding to struct format codes
+_struct_kinds = {
+    'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i', 'n': 'i',
+    'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'N': 'u',
+    '?': 'b', 'e': 'f', 'f': 'f', 'd': 'f', 'c': 'S', 's': 'S',
+    }
+
+def _struct_dtype(struct_format):
+    """Translates a struct format into a specification of the equivalent
+    numpy structured dtype, with fields named f0, f1 and so on."""
+
+    import re
+
+    if struct_format[:1] in ('@', '=', '<', '>', '!'):
+        order, codes = struct_format[0], struct_format[1:]
+    else:
+        order, codes = '@', struct_format
+    byteorder = {'<': '<', '>': '>', '!': '>'}.get(order, '=')
+    names, formats, offsets = [], [], []
+    prefix = order
+    for count, code in re.findall(r'\s*(\d*)\s*([a-zA-Z?])', codes):
+        count = int(count) if count else 1
+        if code == 'x':
+            prefix += '%dx' % count
+            continue
+        if code not in _struct_kinds:
+            raise ValueError("struct format code %r has no numpy equivalent" % code)
+        size = struct.calcsize(order + code)
+        if code == 's':
+            fields = [('S%d' % count, '%ds' % count)]
+        elif code == 'c':
+            fields = [('S1', code)] * count
+        else:
+            fields = [(byteorder + _struct_kinds[code] + str(size), code)] * count
+        for numpy_format, struct_code in fields:
+            # The field's offset, including any alignment padding before it
+            offsets.append(struct.calcsize(prefix + struct_code)
+                           - struct.calcsize(order + struct_code))
+            names.append('f%d' % len(names))
+            formats.append(numpy_format)
+            prefix += struct_code
+    return {'names': names, 'formats': formats, 'offsets': offsets,
+            'itemsize': struct.calcsize(struct_format)}
+
+def _array_column(values):
+    """Returns a column of values as an array.array if they are numbers, or
+    else as a list."""
+
+    import array
+
+    if values and isinstance(values[0], float):
+        return array.array('d', values)
+    elif values and isinstance(values[0], int) and not isinstance(values[0], bool):
+        try:
+            return array.array('q', values)
+        except OverflowError:
+            return array.array('Q', values)
+    return list(values)
+
+def _record_batches(record, view, count, batch, output):
+    for start in range(0, count, batch):
+        records = view[start * record.size:(start + batch) * record.size]
+        if output == 'array':
+            yield tuple(_array_column(column)
+                        for column in zip(*record.iter_unpack(records)))
+        else:
+            yield list(record.iter_unpack(records))
+
+def _closing_map(mapped, view, iterator):
+    """Yields the items of an iterator reading from view, a memoryview of
+    the memory map mapped, then releases the view and closes the map --
+    once the iterator is exhausted, or when this generator is closed."""
+
+    try:
+        for item in iterator:
+            yield item
+    finally:
+        iterator = None
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            pass    # Views of it are still in use; they keep it open
+
+@pointfree
+def pfrecords(path, struct_format, offset=0, limit=None, batch=None,
+              output='tuples'):
+    """Reads a file of fixed-size binary records, as a source for a
+    pipeline.  The file is memory-mapped and the records are unpacked with
+    :py:meth:`struct.Struct.iter_unpack` straight from a
+    :py:class:`memoryview` of the map, as tuples of field values.  Any
+    partial record at the end of the file is ignored.
+
+    Records are read from byte ``offset`` on (to skip a header, or to begin
+    a shard of the file), up to ``limit`` of them.  With a ``batch`` size,
+    lists of up to that many records are yielded instead of single ones;
+    with ``output='array'``, each batch is instead a tuple of columns, one
+    per field, each an :py:class:`array.array` of its values (or a list,
+    if they aren't numbers), which are copies.
+
+    With ``output='numpy'``, the records are yielded as numpy structured
+    arrays of up to ``batch`` records (or all of them in one array), with
+    fields named ``f0``, ``f1`` and so on; these are views of the memory
+    map, so no data is copied at all, and the map stays open for as long
+    as any of them is in use.  This requires numpy.  Otherwise the map is
+    closed once the iterator is exhausted or closed.
+
+    :param path: The path of the file to read
+    :param struct_format: The format of each record, as for
+        :py:mod:`struct`
+    :param offset: Offset of the first record in the file, in bytes
+    :param limit: Maximum number of records to read
+    :param batch: Optional number of records to yield together
+    :param output: ``'tuples'``, ``'array'`` or ``'numpy'``
+    :rtype: Iterator over records, or batches of records
+
+    Example::
+
+        >>> import os, struct, tempfile
+        >>> fd, path = tempfile.mkstemp()
+        >>> with os.fdopen(fd, 'wb') as f:
+        ...     _ = f.write(b"HEADER" + b"".join(struct.pack("<Hd", n, n / 4.0) for n in range(6)))
+
+        >>> fn = pfrecords(struct_format="<Hd", offset=6, limit=3) >> pfcollect
+        >>> fn(path)
+        [(0, 0.0), (1, 0.25), (2, 0.5)]
+
+        >>> fn = pfrecords(struct_format="<Hd", offset=6, batch=4, output='array') \\
+        ...     >> pfmap(lambda columns: sum(columns[1])) >> pfcollect
+        >>> fn(path)
+        [1.5, 2.25]
+
+        >>> os.remove(path)
+
+    """
+
+    if output not in ('tuples', 'array', 'numpy'):
+        raise ValueError("output must be 'tuples', 'array' or 'numpy', not %r"
+                         % (output,))
+    record = struct.Struct(struct_format)
+    count = max(0, (os.path.getsize(path) - offset) // record.size)
+    if limit is not None:
+        count = min(count, limit)
+    if not count:
+        return iter(())
+
+    import mmap
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if output == 'numpy':
+        import numpy
+        dtype = numpy.dtype(_struct_dtype(struct_format))
+        records = numpy.frombuffer(mapped, dtype=dtype, count=count, offset=offset)
+        batch = batch or count
+        return (records[i:i+batch] for i in range(0, count, batch))
+
+    view = memoryview(mapped)[offset:offset + count * record.size]
+    if batch or output == 'array':
+        records = _record_batches(record, view, count, batch or count, output)
+    else:
+        records = record.iter_unpack(view)
+    return _closing_map(mapped, view, records)
+
+_WHITESPACE = b' \t\n\r\x0b\x0c'
+
+def _field_pattern(sep):
+    """Compiles a pattern matching the separator sep, or runs of non-space
+    bytes if sep is None."""
+
+    import re
+
+    if sep is None:
+        return re.compile(b'[^' + re.escape(_WHITESPACE) + b']+')
+    if not sep:
+        raise ValueError("empty separator")
+    return re.compile(re.escape(sep))
+
+def _field_spans(line, pattern, whitespace, maxsplit):
+    """Returns the (start, end) spans of the fields of a bytes-like line,
+    split like bytes.split() with the separator matched by the pattern
+    from _field_pattern().  The re module searches any buffer in place,
+    so memoryviews are not copied."""
+
+    spans = []
+    if whitespace:
+        for match in pattern.finditer(line):
+            if len(spans) == maxsplit:
+                spans.append((match.start(), len(line)))
+                break
+            spans.append(match.span())
+        return spans
+
+    pos = 0
+    for match in pattern.finditer(line):
+        if len(spans) == maxsplit:
+            break
+        spans.append((pos, match.start()))
+        pos = match.end()
+    spans.append((pos, len(line)))
+    return spans
+
+def _split_bytes(iterable, sep, maxsplit):
+    pattern = _field_pattern(sep)
+    for line in iterable:
+        if isinstance(line, bytes):
+            yield line.split(sep, maxsplit)
+        else:
+            yield [line[start:end]
+                   for start, end in _field_spans(line, pattern, sep is None, maxsplit)]
+
+@pointfree
+def pfsplit_bytes(iterable, sep=None, maxsplit=-1):
+    """Splits each item of an iterable of bytes-like lines into a list of
+    fields, like :py:meth:`bytes.split`.  Fields of :py:class:`bytes`
+    lines are bytes, split in C; fields of other buffers, such as the
+    :py:class:`memoryview` lines read by :py:func:`~pointfree.pfread_lines`
+    in ``'view'`` mode, are memoryview slices of them, so no bytes are
+    copied.
+
+    :param iterable: An iterable yielding bytes-like lines
+    :param sep: The separator, or None to split on runs of whitespace
+    :param maxsplit: Maximum number of splits, or -1 for no limit
+    :rtype: Iterator over lists of fields
+
+    Example::
+
+        >>> fn = pfsplit_bytes(sep=b",") >> pfcollect
+        >>> fn([b"a,b", b"c,,d"])
+        [[b'a', b'b'], [b'c', b'', b'd']]
+
+    """
+
+    return _split_bytes(iterable, sep, maxsplit)
+
+def _fields(sep, indexes, iterable):
+    pattern = _field_pattern(sep)
+    single = isinstance(indexes, int)
+    if single:
+        indexes = (indexes,)
+    last = max(indexes)
+    pick = operator.itemgetter(*indexes)
+    for line in iterable:
+        if isinstance(line, bytes):
+            yield pick(line.split(sep, last + 1))
+            continue
+        spans = _field_spans(line, pattern, sep is None, last + 1)
+        if single:
+            start, end = spans[last]
+            yield line[start:end]
+        else:
+            yield tuple(line[start:end] for start, end in pick(spans))
+
+@pointfree
+def pffields(sep, indexes, iterable):
+    """Selects fields of each item of an iterable of bytes-like lines, by
+    index.  Only the line up to the last field wanted is split, and only
+    the fields wanted are extracted: as bytes from :py:class:`bytes`
+    lines, or as :py:class:`memoryview` slices from other buffers, which
+    copies nothing.  A line with too few fields raises an IndexError.
+
+    :param sep: The separator, or None to split on runs of whitespace
+    :param indexes: The index of a field, or a sequence of them
+    :param iterable: An iterable yielding bytes-like lines
+    :rtype: Iterator over fields, or tuples of fields if indexes is a
+        sequence
+
+    Example::
+
+        >>> fn = pffields(b" ", (0, 2)) >> pfcollect
+        >>> fn([b"GET /index.html 200 512", b"POST /form 302 0"])
+        [(b'GET', b'200'), (b'POST', b'302')]
+
+    """
+
+    if isinstance(indexes, int):
+        if indexes < 0:
+            raise ValueError("field indexes must not be negative")
+    elif not indexes or min(indexes) < 0:
+        raise ValueError("field indexes must be a non-empty sequence of "
+                         "non-negative integers")
+    return _fields(sep, indexes, iterable)
+
+def _strip_bytes(iterable, chars):
+    import re
+
+    strip = _WHITESPACE if chars is None else chars
+    leading = re.compile(b'[' + re.escape(strip) + b']*')
+    for line in iterable:
+        if isinstance(line, bytes):
+            yield line.strip(chars)
+            continue
+        start = leading.match(line).end()
+        end = len(line)
+        while end > start and line[end - 1] in strip:
+            end -= 1
+        yield line[start:end]
+
+@pointfree
+def pfstrip_bytes(iterable, chars=None):
+    """Strips leading and trailing bytes from each item of an iterable of
+    bytes-like lines or fields, like :py:meth:`bytes.strip`; other buffers
+    than :py:class:`bytes`, such as :py:class:`memoryview` slices, yield
+    slices of themselves.
+
+    :param iterable: An iterable yielding bytes-like values
+    :param chars: The bytes to strip, by default ASCII whitespace
+    :rtype: Iterator over stripped values
+
+    Example::
+
+        >>> fn = pfstrip_bytes >> pfcollect
+        >>> [bytes(value) for value in fn([b"  a b ", memoryview(b"\\tc\\n")])]
+        [b'a b', b'c']
+
+    """
+
+    return _strip_bytes(iterable, chars)
+
+@pointfree
+def pfdecode(iterable, encoding='utf-8', errors='strict'):
+    """Decodes each item of an iterable of bytes-like values into text;
+    items which are lists or tuples of such values, as yielded by
+    :py:func:`~pointfree.pfsplit_bytes` and
+    :py:func:`~pointfree.pffields`, have each of their values decoded.
+    Placing this stage after the byte-oriented ones means only the fields
+    which are kept get decoded.
+
+    :param iterable: An iterable yielding bytes-like values, or lists or
+        tuples of them
+    :param encoding: The encoding to decode with
+    :param errors: How to handle decoding errors, as for
+        :py:meth:`bytes.decode`
+    :rtype: Iterator over strings, or lists or tuples of strings
+
+    Example::
+
+        >>> fn = pffields(b",", (1, 2)) >> pfdecode >> pfcollect
+        >>> fn([b"7,cafe,open"])
+        [('cafe', 'open')]
+
+    """
+
+    for item in iterable:
+        if isinstance(item, list):
+            yield [str(value, encoding, errors) for value in item]
+        elif isinstance(item, tuple):
+            yield tuple(str(value, encoding, errors) for value in item)
+        else:
+            yield str(item, encoding, errors)
+
+_COMPRESSION_BLOCK = 1 << 20
+
+# Leading bytes of each compressed format, for format='auto'
+_compression_magic = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    ]
+
+_compression_formats = ('gzip', 'zlib', 'bz2', 'xz', 'lzma')
+
+def _decompressor(format):
+    import zlib
+
+    if format == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif format == 'zlib':
+        return zlib.decompressobj()
+    elif format == 'bz2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    else:
+        import lzma
+        return lzma.LZMADecompressor()
+
+def _compressor(format, level):
+    import zlib
+
+    if format == 'gzip':
+        return zlib.compressobj(9 if level is None else level, zlib.DEFLATED,
+                                16 + zlib.MAX_WBITS)
+    elif format == 'zlib':
+        return zlib.compressobj(-1 if level is None else level)
+    elif format == 'bz2':
+        import bz2
+        return bz2.BZ2Compressor(9 if level is None else level)
+    else:
+        import lzma
+        return lzma.LZMACompressor(preset=level)
+
+def _read_blocks(source, block_size):
+    """Yields blocks of bytes from a path, a binary file, a bytes-like
+    object, or an iterable of bytes-like objects."""
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if source:
+            yield source
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for block in _read_blocks(f, block_size):
+                yield block
+    elif hasattr(source, 'read'):
+        while True:
+            block = source.read(block_size)
+            if not block:
+                return
+            yield block
+    else:
+        for block in source:
+            yield block
+
+def _inflate(decompressor, data, limit):
+    """Yields the output of a decompressor for some data, in blocks of at
+    most limit bytes, until it needs more input or its stream ends."""
+
+    if hasattr(decompressor, 'unconsumed_tail'):    # zlib
+        while True:
+            out = decompressor.decompress(data, limit)
+            if out:
+                yield out
+            data = decompressor.unconsumed_tail
+            if not data or decompressor.eof:
+                return
+    else:
+        out = decompressor.decompress(data, limit)
+        if out:
+            yield out
+        while not decompressor.eof and not decompressor.needs_input:
+            out = decompressor.decompress(b'', limit)
+            if out:
+                yield out
+
+def _head_blocks(blocks, size):
+    """Yields the given blocks, joining the first ones until the first
+    block yielded is at least size bytes long, or the blocks run out."""
+
+    blocks = iter(blocks)
+    head = b''
+    for block in blocks:
+        head = head + block if head else block
+        if len(head) >= size:
+            break
+    if head:
+        yield head
+    for block in blocks:
+        yield block
+
+def _detect_format(data):
+    for magic, format in _compression_magic:
+        if data[:len(magic)] == magic:
+            return format
+    raise ValueError("unrecognized compression format")
+
+def _decompress(format, source, block_size):
+    blocks = _read_blocks(source, block_size)
+    if format == 'auto':
+        # The start of the data may arrive in pieces smaller than a magic
+        # number.  Later streams are taken to be in the same format.
+        blocks = _head_blocks(blocks, max(len(magic) for magic, f in _compression_magic))
+    decompressor = None
+    for data in blocks:
+        while data:
+            if decompressor is None:
+                if format == 'auto':
+                    format = _detect_format(data)
+                decompressor = _decompressor(format)
+            for out in _inflate(decompressor, data, block_size):
+                yield out
+            if decompressor.eof:
+                # Further data is another stream (as in a multi-member gzip
+                # file)
+                data = decompressor.unused_data
+                decompressor = None
+            else:
+                data = b''
+    if decompressor is not None:
+        if hasattr(decompressor, 'flush') and not decompressor.eof:
+            out = decompressor.flush()
+            if out:
+                yield out
+        if not decompressor.eof:
+            raise EOFError("compressed stream ended before the end-of-stream marker")
+
+def _prefetch(iterable, depth):
+    """Iterates over an iterable in a background thread, running up to
+    depth items ahead of the consumer."""
+
+    q = queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(message):
+        while not stopped.is_set():
+            try:
+                q.put(message, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:
+            put((False, e))
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            ok, item = q.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        stopped.set()
+        thread.join()
+
+@pointfree
+def pfdecompress(format, source, block_size=_COMPRESSION_BLOCK, prefetch=0):
+    """Decompresses a gzip, zlib, bz2 or xz stream, yielding blocks of
+    decompressed bytes as they are produced by the streaming decompressors
+    of the standard library, without joining them together.  The source
+    may be the path of a compressed file, a binary file object, or an
+    iterable of compressed blocks (such as the output of
+    :py:func:`~pointfree.pfcompress`); follow this stage with
+    :py:func:`~pointfree.pfsplit_lines` to process the data a line at a
+    time.  Concatenated streams, as in multi-member gzip files, are
+    decompressed one after another; with ``'auto'``, they must all be in
+    the format of the first.
+
+    Files are read ``block_size`` bytes at a time, and no decompressed
+    block is larger than that, however well the data compresses.  With
+    ``prefetch``, decompression runs in a background thread up to that many
+    blocks ahead, overlapping with the stages downstream; the
+    decompressors release the GIL while they work.
+
+    :param format: ``'gzip'``, ``'zlib'``, ``'bz2'``, ``'xz'`` (or
+        ``'lzma'``), or ``'auto'`` to recognize gzip, bz2 and xz data by
+        their first bytes
+    :param source: A path, binary file, bytes-like object or iterable of
+        compressed bytes
+    :param block_size: Size of the blocks read and yielded, in bytes
+    :param prefetch: Number of blocks to decompress ahead in a background
+        thread, or 0 for none
+    :rtype: Iterator over blocks of bytes
+
+    Example::
+
+        >>> import gzip
+        >>> data = gzip.compress(b"first line\\nsecond line\\n")
+        >>> fn = pfdecompress('auto') >> pfsplit_lines >> pfcollect
+        >>> fn([data])
+        [b'first line', b'second line']
+
+    """
+
+    if format not in _compression_formats + ('auto',):
+        raise ValueError("unsupported compression format %r" % (format,))
+    blocks = _decompress(format, source, block_size)
+    if prefetch:
+        return _prefetch(blocks, prefetch)
+    return blocks
+
+def _compress(format, iterable, level, block_size):
+    compressor = _compressor(format, level)
+    pending = []
+    size = 0
+    for data in iterable:
+        pending.append(data)
+        size += len(data)
+        if size >= block_size:
+            out = compressor.compress(pending[0] if len(pending) == 1
+                                      else b''.join(pending))
+            pending = []
+            size = 0
+            if out:
+                yield out
+    if pending:
+        out = compressor.compress(b''.join(pending))
+        if out:
+            yield out
+    out = compressor.flush()
+    if out:
+        yield out
+
+@pointfree
+def pfcompress(format, iterable, level=None, block_size=_COMPRESSION_BLOCK):
+    """Compresses an iterable of bytes-like blocks into a gzip, zlib, bz2 or
+    xz stream, yielding the compressed data in blocks as the compressor
+    produces it.  Small inputs are joined until there are at least
+    ``block_size`` bytes to hand to the compressor at once.
+
+    :param format: ``'gzip'``, ``'zlib'``, ``'bz2'`` or ``'xz'`` (or
+        ``'lzma'``)
+    :param iterable: An iterable yielding bytes-like objects
+    :param level: The compression level (the preset, for xz), or None for
+        the format's default
+    :param block_size: Number of bytes compressed at a time
+    :rtype: Iterator over blocks of compressed bytes
+
+    Example::
+
+        >>> import gzip
+        >>> fn = pfmap(lambda n: b"line %d\\n" % n) >> pfcompress('gzip') >> pfcollect
+        >>> gzip.decompress(b"".join(fn(range(3))))
+        b'line 0\\nline 1\\nline 2\\n'
+
+    """
+
+    if format not in _compression_formats:
+        raise ValueError("unsupported compression format %r" % (format,))
+    return _compress(format, iterable, level, block_size)
+
+@pointfree
+def pfsplit_lines(iterable, keepends=False):
+    """Splits an iterable of blocks of bytes (or text) into lines, however
+    the lines fall across the blocks.  Blocks may be any bytes-like
+    objects, such as bytearrays or memoryviews, in which case the lines
+    are bytes.  Unless ``keepends`` is true, line endings are removed,
+    including the carriage return of a CRLF.
+
+    :param iterable: An iterable yielding blocks of bytes-like objects or
+        strings
+    :param keepends: Whether to keep line endings
+    :rtype: Iterator over lines
+
+    Example::
+
+        >>> fn = pfsplit_lines >> pfcollect
+        >>> fn([b"ab\\nc", b"d\\r\\ne", b"f\\n"])
+        [b'ab', b'cd', b'ef']
+
+    """
+
+    carry = None
+    for block in iterable:
+        if isinstance(block, str):
+            newline, cr = '\n', '\r'
+        else:
+            if not isinstance(block, bytes):
+                block = bytes(block)
+            newline, cr = b'\n', b'\r'
+        lines = block.split(newline)
+        if carry:
+            lines[0] = carry + lines[0]
+        carry = lines.pop()
+        if keepends:
+            lines = [line + newline for line in lines]
+        elif lines:
+            if cr in block or lines[0].endswith(cr):
+                lines = [line[:-1] if line.endswith(cr) else line for line in lines]
+        for line in lines:
+            yield line
+    if carry:
+        if not keepends and carry[-1:] in (b'\r', '\r'):
+            carry = carry[:-1]
+        yield carry
@@ -45,6 +45,17 @@ class KwOnlyDefaultsCase(TestCase):
     def testDefaultApplication(self):
         self.assertEqual(kwonly_defaults_func(1,2), 6)
 
+    def testDefaultsPassedExplicitly(self):
+        # Unspecified keyword-only defaults are passed to the function as
+        # resolved when it was wrapped, like positional ones
+        def func(a, b, *, c=3):
+            return a + b + c
+        wrapped = partial(func)
+        func.__kwdefaults__ = {'c': 30}
+        self.assertEqual(wrapped(1, 2), 6)
+        self.assertEqual(wrapped(1)(2), 6)
+        self.assertEqual(wrapped(c=4)(1)(2), 7)
+
 class KwOnlyAndVarKargsCase(TestCase):
     def testNormalApplication(self):
         value, kwargs = kwonly_varkw_func(1,2,c=3,d=4,e=5)
@@ -1,4 +1,5 @@
-import os, sys, unittest, types, functools, operator
+import os, sys, math, unittest, types, functools, itertools, operator
+import pointfree as pointfree_module
 from pointfree import *
 
 # The unittest.TestCase in Python 2.6 and 3.0 doesn't have some of the
@@ -28,6 +29,10 @@ def padd(a, b, c):
 def padd_defaults(a, b, c=3):
     return a + 2*b + 3*c
 
+@partial
+def padd_two_defaults(a, b=2, c=3):
+    return a + 2*b + 3*c
+
 @partial
 def padd_var_args(a, b, *args):
     return a + 2*b + 3*sum(args)
@@ -110,6 +115,9 @@ class PartialFuncDefaultsCase(TestCase):
     def testKeywordOverride(self):
         self.assertEqual(padd_defaults(c=4)(1,2), 17)
 
+    def testKeywordAfterUnspecifiedDefault(self):
+        self.assertEqual(padd_two_defaults(c=5)(1), 1 + 2*2 + 3*5)
+
 class PartialFuncConcurrencyCase(TestCase):
     def testReusedPartialApplication(self):
         p = padd(1)
@@ -496,6 +504,41 @@ class HelperPfmapCase(TestCase):
         fn = pfmap(lambda x: x+1)
         self.assertEqual(list(fn(range(5))), [1, 2, 3, 4, 5])
 
+    def testPfmapThreads(self):
+        fn = pfmap(lambda x: x+1, workers=4, chunksize=3)
+        self.assertEqual(list(fn(range(100))), list(range(1, 101)))
+
+class PartialThreadSafetyCase(TestCase):
+    def testSharedPartialAcrossThreads(self):
+        import threading
+        p = padd(1)
+        results = []
+
+        def worker(n):
+            for i in range(200):
+                results.append(p(n)(i) == 1 + 2*n + 3*i)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(results))
+        self.assertEqual(len(results), 1600)
+        self.assertEqual(p.argv, {'a': 1})
+
+    def testBoundSignatureCache(self):
+        inst = PartialThing(2)
+        self.assertEqual(inst.instance_padd(1,2,3), 16)
+        self.assertEqual(inst.instance_padd(1)(2)(3), 16)
+        self.assertEqual(PartialThing.__dict__['instance_padd'](inst,1,2,3), 16)
+
+    def testBoundSignatureCacheLeavesInstance(self):
+        descriptor = PartialThing.__dict__['instance_padd']
+        before = dict(descriptor.__dict__)
+        PartialThing(2).instance_padd(1)
+        self.assertEqual(descriptor.__dict__, before)
+
 class HelperPfreduceCase(TestCase):
     def testPfreduce(self):
         fn = pfmap(lambda x: x+1) >> pfreduce(operator.add, initial=0)
@@ -510,6 +553,33 @@ class HelperPfreduceCase(TestCase):
         fn = pfreduce(operator.add)
         self.assertIsNone(fn([]))
 
+    def testPfreduceFalsyInitial(self):
+        self.assertEqual(pfreduce(operator.sub, initial=0)([1, 2]), -3)
+        self.assertEqual(pfreduce(operator.add, initial='')(['a', 'b']), 'ab')
+        self.assertEqual(pfreduce(operator.add, initial=[])([[1], [2]]), [1, 2])
+        self.assertEqual(pfreduce(operator.add, initial=0)([]), 0)
+
+    def testPfreduceParallel(self):
+        fn = pfreduce(operator.add, associative=True, workers=3, chunksize=7)
+        self.assertEqual(fn(range(1000)), sum(range(1000)))
+        self.assertIsNone(fn([]))
+
+    def testPfreduceParallelOrder(self):
+        # String concatenation is associative but not commutative.
+        fn = pfreduce(operator.add, associative=True, workers=4, chunksize=3)
+        self.assertEqual(fn(list('abcdefghijklmnopq')), 'abcdefghijklmnopq')
+        self.assertEqual(fn(list('bcd'), initial='a'), 'abcd')
+
+    def testPfreduceParallelCommutative(self):
+        fn = pfreduce(operator.mul, initial=2, associative=True,
+                      commutative=True, workers=2, chunksize=2)
+        self.assertEqual(fn(range(1, 8)), 2 * 5040)
+
+    def testPfreduceProcesses(self):
+        fn = pfreduce(operator.add, associative=True, workers=2,
+                      executor='process', chunksize=100)
+        self.assertEqual(fn(range(1000)), sum(range(1000)))
+
 class HelperPfcollectCase(TestCase):
     def testPfcollect(self):
         fn = pf(lambda: range(5)) >> pfcollect
@@ -527,7 +597,1738 @@ class HelperPfignoreCase(TestCase):
 
         (fn >> pfignore_all)(range(3))
         self.assertEqual(result, [0, 1, 2])
-        
+
+def fail_on_three(n):
+    if n == 3:
+        raise ValueError("three")
+    return n
+
+def exit_stage(iterable):
+    os._exit(3)
+
+class HelperPfstagedCase(TestCase):
+    def testPfstaged(self):
+        fn = pfstaged([pfmap(lambda x: x+1), pfmap(lambda x: x*2)], batch_size=7) \
+            >> pfcollect
+        self.assertEqual(fn(range(100)), [2*(x+1) for x in range(100)])
+
+    def testPfstagedEmpty(self):
+        fn = pfstaged([pfmap(lambda x: x+1)]) >> pfcollect
+        self.assertEqual(fn([]), [])
+
+    def testPfstagedSmallBuffer(self):
+        # Batches have to wrap around the end of a small ring buffer.
+        fn = pfstaged([pffilter(lambda x: x % 3), pfmap(str)],
+                      batch_size=5, buffer_size=200) >> pfcollect
+        self.assertEqual(fn(range(1000)), [str(x) for x in range(1000) if x % 3])
+
+    def testPfstagedError(self):
+        fn = pfstaged([pfmap(fail_on_three), pfmap(lambda x: x)]) >> pfcollect
+        self.assertRaises(ValueError, lambda: fn(range(10)))
+
+    def testPfstagedEagerError(self):
+        # A segment raising as soon as it is called, rather than while
+        # being iterated over
+        fn = pfstaged([pfmap(fail_on_three) >> pfcollect]) >> pfcollect
+        self.assertRaises(ValueError, lambda: fn(range(10)))
+
+    def testPfstagedDeadWorker(self):
+        fn = pfstaged([pfmap(lambda x: x), exit_stage]) >> pfcollect
+        self.assertRaises(RuntimeError, lambda: fn(range(10)))
+
+    def testPfstagedBlockedInput(self):
+        # Closing early mustn't wait on an input iterable that has blocked
+        import threading, time
+        release = threading.Event()
+        def source():
+            yield 1
+            release.wait(30)
+            yield 2
+        items = pfstaged([pfmap(lambda x: x+1)], source(), batch_size=1)
+        self.assertEqual(next(items), 2)
+        start = time.time()
+        items.close()
+        self.assertTrue(time.time() - start < 5)
+        release.set()
+
+
+class HelperPfmapAdaptiveCase(TestCase):
+    def testPfmapAdaptive(self):
+        fn = pfmap_adaptive(lambda x: x+1, max_workers=4) >> pfcollect
+        self.assertEqual(fn(range(1000)), list(range(1, 1001)))
+
+    def testPfmapAdaptiveStats(self):
+        stats = AdaptiveStats()
+        fn = pfmap_adaptive(lambda x: x, max_chunksize=64, stats=stats) >> pfcollect
+        self.assertEqual(fn(range(5000)), list(range(5000)))
+        self.assertEqual(stats.items, 5000)
+        self.assertTrue(1 <= stats.chunksize <= 64)
+        self.assertTrue(stats.decisions)
+
+    def testPfmapAdaptiveTailSplit(self):
+        stats = AdaptiveStats()
+        fn = pfmap_adaptive(lambda x: x, min_workers=4, max_workers=4,
+                            min_chunksize=100, stats=stats) >> pfcollect
+        self.assertEqual(fn(range(10)), list(range(10)))
+        self.assertTrue(stats.splits > 0)
+
+    def testPfmapAdaptiveSlowConsumer(self):
+        # Finished chunks waiting on a slow consumer mean more workers
+        # wouldn't help
+        import time
+        stats = AdaptiveStats()
+        fn = pfmap_adaptive(lambda x: x, max_workers=8, max_chunksize=8, stats=stats)
+        for item in fn(range(400)):
+            time.sleep(0.001)
+        self.assertTrue(max(workers for i, workers, c, r in stats.decisions) <= 2)
+
+    def testPfmapAdaptiveExecutor(self):
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            fn = pfmap_adaptive(lambda x: -x, executor=executor) >> pfcollect
+            self.assertEqual(fn(range(10)), [-x for x in range(10)])
+
+class HelperAggregateSinksCase(TestCase):
+    def testPfsum(self):
+        self.assertEqual((pfmap(lambda x: x+1) >> pfsum)(range(5)), 15)
+        self.assertEqual(pfsum(start=10)([]), 10)
+        self.assertEqual(pfsum([0.1] * 10, precise=True), 1.0)
+
+    def testPfcount(self):
+        self.assertEqual(pfcount(iter(range(12345))), 12345)
+        self.assertEqual(pfcount([]), 0)
+
+    def testPfminPfmax(self):
+        self.assertEqual(pfmin([3, 1, 2]), 1)
+        self.assertEqual(pfmax([3, 1, 2]), 3)
+        self.assertEqual(pfmax(key=lambda x: -x)([3, 1, 2]), 1)
+        self.assertIsNone(pfmin([]))
+        self.assertEqual(pfmax(default=0)([]), 0)
+
+    def testPfminmax(self):
+        self.assertEqual(pfminmax(iter(range(3000))), (0, 2999))
+        self.assertEqual(pfminmax(['bb', 'a', 'ccc'], key=len), ('a', 'ccc'))
+        self.assertEqual(pfminmax([]), (None, None))
+
+    def testPfmean(self):
+        self.assertEqual(pfmean(iter([1, 2, 3, 4])), 2.5)
+        self.assertIsNone(pfmean([]))
+
+class HelperPfaggregateCase(TestCase):
+    def testPfaggregate(self):
+        fn = pfaggregate(n='count', total='sum', hi='max', lo='min',
+                         both='minmax', avg='mean')
+        self.assertDictEqual(fn(iter(range(2500))),
+                             {'n': 2500, 'total': sum(range(2500)), 'hi': 2499,
+                              'lo': 0, 'both': (0, 2499), 'avg': 1249.5})
+
+    def testPfaggregateSpecs(self):
+        fn = pfaggregate(total=SumAggregator(start=100),
+                         longest=lambda: MaxAggregator(key=str))
+        self.assertDictEqual(fn([9, 10]), {'total': 119, 'longest': 9})
+        # The prototype aggregator must not have accumulated anything.
+        self.assertDictEqual(fn([]), {'total': 100, 'longest': None})
+
+    def testPfaggregateUnknown(self):
+        self.assertRaises(ValueError, lambda: pfaggregate([1], x='median'))
+
+    def testAggregatorMerge(self):
+        for name in ('count', 'sum', 'min', 'max', 'minmax', 'mean'):
+            left = pointfree_module._make_aggregator(name)
+            right = pointfree_module._make_aggregator(name)
+            whole = pointfree_module._make_aggregator(name)
+            left.update([5, 3, 8])
+            right.update([1, 9])
+            whole.update([5, 3, 8, 1, 9])
+            left.merge(right)
+            self.assertEqual(left.result(), whole.result())
+
+    def testSumMergeStart(self):
+        for precise in (False, True):
+            left = SumAggregator(start=10, precise=precise)
+            right = SumAggregator(start=10, precise=precise)
+            left.update([1, 2])
+            right.update([3])
+            left.merge(right)
+            self.assertEqual(left.result(), 16)
+
+### MEMOIZATION TESTS ####################################################
+
+class MemoThing(object):
+    def __init__(self, n):
+        self.n = n
+        self.calls = 0
+
+    @pfmemo()
+    def madd(self, a, b):
+        self.calls += 1
+        return self.n + a + b
+
+class PfmemoCase(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @pfmemo(maxsize=2)
+        def madd(a, b, c=3):
+            self.calls.append((a, b, c))
+            return a + 2*b + 3*c
+
+        self.madd = madd
+
+    def testSharedEntry(self):
+        self.assertEqual(self.madd(1)(2), 14)
+        self.assertEqual(self.madd(1, 2), 14)
+        self.assertEqual(self.madd(b=2)(1), 14)
+        self.assertEqual(self.madd(1, 2, 3), 14)
+        self.assertEqual(self.calls, [(1, 2, 3)])
+        self.assertEqual(self.madd.memo.hits, 3)
+        self.assertEqual(self.madd.memo.misses, 1)
+
+    def testEviction(self):
+        self.madd(1, 1)
+        self.madd(1, 2)
+        self.madd(1, 1)
+        self.madd(1, 3)
+        self.assertEqual(self.madd.memo.evictions, 1)
+        self.madd(1, 1)
+        self.madd(1, 2)
+        self.assertEqual(len(self.calls), 4)
+
+    def testTtl(self):
+        @pfmemo(ttl=0)
+        def ident(x):
+            self.calls.append(x)
+            return x
+
+        ident(1)
+        ident(1)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(ident.memo.expirations, 1)
+
+    def testUnhashable(self):
+        @pfmemo()
+        def first(items):
+            return items[0]
+
+        self.assertEqual(first([1, 2]), 1)
+        self.assertEqual(first.memo.hits + first.memo.misses, 0)
+
+    def testComposition(self):
+        fn = self.madd(1, c=0) >> pf(lambda x: x * 10)
+        self.assertEqual(fn(2), 50)
+        self.assertEqual(fn(2), 50)
+        self.assertEqual(len(self.calls), 1)
+
+    def testMethod(self):
+        x, y = MemoThing(1), MemoThing(2)
+        self.assertEqual(x.madd(1)(2), 4)
+        self.assertEqual(x.madd(1, 2), 4)
+        self.assertEqual(y.madd(1, 2), 5)
+        self.assertEqual((x.calls, y.calls), (1, 1))
+
+    def testMethodCachePerInstance(self):
+        import gc, weakref
+        x, y = MemoThing(1), MemoThing(2)
+        x.madd(1, 2), y.madd(1, 2), y.madd(1, 2)
+        self.assertEqual((len(x.madd.memo), x.madd.memo.hits), (1, 0))
+        self.assertEqual((len(y.madd.memo), y.madd.memo.hits), (1, 1))
+        ref = weakref.ref(x)
+        del x
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def testThreads(self):
+        import threading
+        fn = self.madd
+
+        def worker():
+            for i in range(500):
+                fn(i % 3, 1)
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fn.memo.hits + fn.memo.misses, 2000)
+        self.assertTrue(len(fn.memo) <= 2)
+
+    def testPfmapBatched(self):
+        fn = pfmap(self.madd(b=1, c=0), chunksize=4) >> pfcollect
+        self.assertEqual(fn([1, 2, 1, 2, 1]), [3, 4, 3, 4, 3])
+        self.assertEqual(self.calls, [(1, 1, 0), (2, 1, 0)])
+        self.assertEqual(self.madd.memo.hits, 1)
+
+    def testPfmapUnhashable(self):
+        @pfmemo()
+        def first(items):
+            return items[0]
+
+        self.assertEqual((pfmap(first) >> pfcollect)([[1, 2], [3]]), [1, 3])
+
+    def testPfmapLazyErrors(self):
+        @pfmemo()
+        def checked(n):
+            return fail_on_three(n)
+
+        results = []
+        try:
+            for result in pfmap(checked, range(10)):
+                results.append(result)
+        except ValueError:
+            pass
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(checked.memo.get_many([(0,), (2,)]), {(0,): 0, (2,): 2})
+
+class PfdiskmemoCase(TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'memo.db')
+        self.calls = []
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def makeSquare(self, **kargs):
+        @pfdiskmemo(self.path, **kargs)
+        def square(n):
+            self.calls.append(n)
+            return n * n
+        return square
+
+    def testPersistence(self):
+        self.assertEqual(self.makeSquare()(3), 9)
+        square = self.makeSquare()
+        self.assertEqual(square(3), 9)
+        self.assertEqual(self.calls, [3])
+        self.assertEqual(square.memo.hits, 1)
+
+    def testVersion(self):
+        self.makeSquare()(3)
+        self.makeSquare(version=2)(3)
+        self.assertEqual(self.calls, [3, 3])
+
+    def testPfmapBatched(self):
+        square = self.makeSquare()
+        fn = pfmap(square, chunksize=3) >> pfcollect
+        self.assertEqual(fn([1, 2, 1, 3, 2]), [1, 4, 1, 9, 4])
+        self.assertEqual(self.calls, [1, 2, 3])
+        self.assertEqual(fn(range(4)), [0, 1, 4, 9])
+        self.assertEqual(self.calls, [1, 2, 3, 0])
+
+    def testEviction(self):
+        square = self.makeSquare(maxsize=10)
+        (pfmap(square) >> pfignore_all)(range(25))
+        self.assertTrue(square.memo.evictions > 0)
+        import sqlite3
+        count = sqlite3.connect(self.path).execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+        self.assertTrue(count <= 10)
+
+    def testCodeChanges(self):
+        @pfdiskmemo(self.path)
+        def scaled(n):
+            return n * 2
+
+        self.assertEqual(scaled(5), 10)
+
+        @pfdiskmemo(self.path)
+        def scaled(n):
+            return n * 3
+
+        self.assertEqual(scaled(5), 15)
+
+        @pfdiskmemo(self.path)
+        def scaled(n):
+            return math.floor(n)
+
+        self.assertEqual(scaled(5), 5)
+
+        @pfdiskmemo(self.path)
+        def scaled(n):
+            return math.ceil(n * 2)
+
+        self.assertEqual(scaled(5), 10)
+
+        def make(factor, offset=0):
+            @pfdiskmemo(self.path)
+            def scaled(n, offset=offset):
+                return n * factor + offset
+            return scaled
+
+        self.assertEqual(make(4)(5), 20)
+        self.assertEqual(make(5)(5), 25)
+        self.assertEqual(make(5, 1)(5), 26)
+
+    def testEqualArguments(self):
+        @pfdiskmemo(self.path)
+        def pair(p):
+            self.calls.append(p)
+            return p[0] + p[1]
+
+        s = "ab" * 3
+        self.assertEqual(pair((s, s)), "ab" * 6)
+        self.assertEqual(pair(("".join(["ab"] * 3), "".join(["ab"] * 3))), "ab" * 6)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(pair.memo.hits, 1)
+
+    def testPfmapUnhashable(self):
+        @pfdiskmemo(self.path)
+        def total(items):
+            return sum(items)
+
+        self.assertEqual((pfmap(total) >> pfcollect)([[1, 2], [3]]), [3, 3])
+
+    def testUnpicklable(self):
+        @pfdiskmemo(self.path)
+        def call(f):
+            return f()
+
+        self.assertEqual(call(lambda: 5), 5)
+        self.assertEqual((pfmap(call) >> pfcollect)([lambda: 6]), [6])
+
+class IncrementalPipelineCase(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def expensive(record):
+            self.calls.append(record[0])
+            return record[1] * 2
+
+        self.inc = IncrementalPipeline(
+            pfmap(expensive) >> pffilter(lambda n: n != 0),
+            key=lambda r: r[0],
+            aggregates={'total': 'sum', 'n': 'count', 'hi': 'max', 'avg': 'mean'})
+
+    def testUpdate(self):
+        self.assertEqual(self.inc.update([(k, k) for k in range(10)]), (10, 0, 0))
+        self.assertEqual(len(self.calls), 10)
+        self.calls = []
+
+        self.assertEqual(self.inc.update([(k, k) for k in range(10) if k != 3]
+                                         + [(5, 50), (10, 0)]), (1, 1, 1))
+        self.assertEqual(sorted(self.calls), [5, 10])
+        self.assertEqual(self.inc.results(), [2, 4, 8, 100, 12, 14, 16, 18])
+        self.assertDictEqual(self.inc.aggregates(),
+                             {'total': 174, 'n': 8, 'hi': 100, 'avg': 21.75})
+
+    def testUnchanged(self):
+        self.inc.update([(1, 1), (2, 2)])
+        self.calls = []
+        self.assertEqual(self.inc.update([(1, 1), (2, 2)]), (0, 0, 0))
+        self.assertEqual(self.calls, [])
+
+    def testDeltas(self):
+        self.inc.upsert([(1, 1), (2, 2), (3, 3)])
+        self.inc.upsert([(2, 20)])
+        self.inc.remove([1, 99])
+        self.assertEqual(self.inc.results(), [40, 6])
+        self.assertDictEqual(self.inc.aggregates(),
+                             {'total': 46, 'n': 2, 'hi': 40, 'avg': 23.0})
+        self.inc.remove([2, 3])
+        self.assertDictEqual(self.inc.aggregates(),
+                             {'total': 0, 'n': 0, 'hi': None, 'avg': None})
+
+    def testDuplicateKeys(self):
+        self.assertEqual(self.inc.update([(1, 1), (2, 2), (1, 3), (1, 4)]), (2, 0, 0))
+        self.assertEqual(self.inc.results(), [8, 4])
+        self.assertEqual(sorted(self.calls), [1, 2])
+        self.calls = []
+
+        self.assertEqual(self.inc.update([(1, 4), (2, 5), (2, 6), (3, 1), (3, 1)]),
+                         (1, 1, 0))
+        self.assertEqual(sorted(self.calls), [2, 3])
+        self.inc.upsert([(4, 1), (4, 2)])
+        self.inc.remove([3, 3])
+        self.assertEqual(self.inc.results(), [8, 12, 4])
+        self.assertDictEqual(self.inc.aggregates(),
+                             {'total': 24, 'n': 3, 'hi': 12, 'avg': 8.0})
+
+    def testFailedBatch(self):
+        # A batch failing in the pipeline or an aggregator changes nothing
+        inc = IncrementalPipeline(pfmap(lambda r: fail_on_three(r[1])),
+                                  key=lambda r: r[0],
+                                  aggregates={'total': 'sum', 'hi': 'max'})
+        inc.update([(1, 1), (2, 2)])
+        self.assertRaises(ValueError, lambda: inc.upsert([(1, 10), (2, 3)]))
+        self.assertRaises(ValueError, lambda: inc.update([(1, 10), (4, 3)]))
+        self.assertRaises(TypeError, lambda: inc.upsert([(1, 'x')]))
+        self.assertEqual(inc.results(), [1, 2])
+        self.assertDictEqual(inc.aggregates(), {'total': 3, 'hi': 2})
+        inc.upsert([(1, 10)])
+        self.assertDictEqual(inc.aggregates(), {'total': 12, 'hi': 10})
+
+class PipelineDAGCase(TestCase):
+    def setUp(self):
+        self.parsed = []
+
+        def parse(s):
+            self.parsed.append(s)
+            return int(s)
+
+        self.parse = parse
+
+    def testSharedPrefix(self):
+        dag = PipelineDAG()
+        dag.add('total', pfmap(self.parse), pfmap(abs), pfsum)
+        dag.add('hi', pfmap(self.parse), pfmap(abs), pfmax)
+        dag.add('evens', pfmap(self.parse), pffilter(self.isEven), pfcollect)
+        data = [str(n) for n in range(-500, 500)]
+        self.assertDictEqual(dag(data), {
+            'total': sum(abs(n) for n in range(-500, 500)),
+            'hi': 500,
+            'evens': [n for n in range(-500, 500) if n % 2 == 0]})
+        self.assertEqual(self.parsed, data)
+
+    def isEven(self, n):
+        return n % 2 == 0
+
+    def testPlan(self):
+        dag = PipelineDAG()
+        dag.add('a', pfmap(self.parse), pfsum)
+        dag.add('b', pfmap(self.parse), pfsum)
+        dag.add('c', pfmap(self.parse), pfcollect(n=2))
+        self.assertEqual(dag.plan(),
+                         "pfmap(func=parse)  [merged x3]\n"
+                         "  pfsum  [merged x2; -> a, b]\n"
+                         "  pfcollect(n=2)  [-> c]")
+        self.assertDictEqual(dag(["1", "2", "3"]), {'a': 6, 'b': 6, 'c': [1, 2]})
+
+    def testStreamOutputs(self):
+        dag = PipelineDAG()
+        dag.add('doubled', pfmap(lambda n: n * 2))
+        dag.add('total', pfsum)
+        self.assertDictEqual(dag(range(4)), {'doubled': [0, 2, 4, 6], 'total': 6})
+
+    def testPrefixOutput(self):
+        dag = PipelineDAG()
+        dag.add('ints', pfmap(self.parse))
+        dag.add('total', pfmap(self.parse), pfsum)
+        self.assertDictEqual(dag(["1", "2"]), {'ints': [1, 2], 'total': 3})
+
+    def testError(self):
+        dag = PipelineDAG()
+        dag.add('a', pfmap(self.parse), pfsum)
+        dag.add('b', pfcount)
+        self.assertRaises(ValueError, lambda: dag(["1", "x"]))
+
+    def testDuplicateName(self):
+        dag = PipelineDAG()
+        dag.add('a', pfsum)
+        self.assertRaises(ValueError, lambda: dag.add('a', pfmax))
+
+    def testComposition(self):
+        dag = PipelineDAG()
+        dag.add('a', pfsum)
+        fn = pfmap(lambda n: n + 1) >> pf(dag.run)
+        self.assertDictEqual(fn(range(3)), {'a': 6})
+
+class HelperPfbroadcastCase(TestCase):
+    def testPfbroadcast(self):
+        fn = pfbroadcast(pfsum, pfcollect, pfcount, chunksize=7)
+        self.assertEqual(fn(iter(range(100))), (4950, list(range(100)), 100))
+
+    def testAggregateSinks(self):
+        fn = pfbroadcast('sum', MaxAggregator(key=lambda n: -n), pfmap(str))
+        self.assertEqual(fn(range(5)), (10, 0, ['0', '1', '2', '3', '4']))
+        fn = pfbroadcast('count', 'mean')
+        self.assertEqual(fn(range(5)), (5, 2.0))
+
+    def testEarlyExit(self):
+        seen = []
+
+        def source():
+            for n in range(100000):
+                seen.append(n)
+                yield n
+
+        fn = pfbroadcast(pfcollect(n=3), pfcollect(n=5), chunksize=10)
+        self.assertEqual(fn(source()), ([0, 1, 2], [0, 1, 2, 3, 4]))
+        self.assertTrue(len(seen) < 100)
+
+    def testBoundedMemory(self):
+        # A slow sink must hold back a fast one instead of letting chunks
+        # pile up between them.
+        import time
+        progress = []
+
+        @pointfree
+        def slow(iterable):
+            lead = 0
+            for n in iterable:
+                if n % 50 == 0:
+                    time.sleep(0.001)
+                lead = max(lead, len(progress) - n)
+            return lead
+
+        @pointfree
+        def fast(iterable):
+            for n in iterable:
+                progress.append(n)
+
+        fn = pfbroadcast(fast, slow, chunksize=10)
+        self.assertTrue(fn(range(1000))[1] <= 50)
+
+    def testError(self):
+        fn = pfbroadcast(pfsum, pfmap(fail_on_three) >> pfcollect)
+        self.assertRaises(ValueError, lambda: fn(range(10)))
+
+    def testBadKeyword(self):
+        self.assertRaises(TypeError, lambda: pfbroadcast(pfsum, size=3))
+
+    def testNoSinks(self):
+        self.assertEqual(pfbroadcast()(range(5)), ())
+        self.assertEqual(pfbroadcast(*[], chunksize=2)(range(5)), ())
+
+class HelperPfmergeCase(TestCase):
+    def sources(self, n, size, spread):
+        import random
+        rng = random.Random(n * size + spread)
+        return [sorted((rng.randrange(spread), i, j) for j in range(rng.randrange(size)))
+                for i in range(n)]
+
+    def expected(self, sources, reverse=False):
+        # Stable order: by key, then by source, then by position.
+        items = [item for source in sources for item in source]
+        return sorted(items, key=lambda t: t[0], reverse=reverse)
+
+    def testPfmerge(self):
+        sources = self.sources(5, 50, 10)
+        self.assertEqual(list(pfmerge(*sources)), sorted(sum(sources, [])))
+
+    def testStable(self):
+        sources = self.sources(6, 40, 5)
+        merged = pfmerge(*sources, key=lambda t: t[0])
+        self.assertEqual(list(merged), self.expected(sources))
+
+    def testBatched(self):
+        first = lambda t: t[0]
+        for batch in (1, 2, 3, 7, 100):
+            for spread in (1, 3, 1000):
+                sources = self.sources(7, 60, spread)
+                self.assertEqual(list(pfmerge(*sources, key=first, batch=batch)),
+                                 self.expected(sources))
+                rsources = [source[::-1] for source in sources]
+                self.assertEqual(list(pfmerge(*rsources, key=first, batch=batch,
+                                              reverse=True)),
+                                 self.expected(rsources, reverse=True))
+
+    def testMaxOpen(self):
+        opened = []
+
+        def opener(source):
+            def open_source():
+                opened.append(source)
+                return iter(source)
+            return open_source
+
+        sources = self.sources(30, 20, 50)
+        merged = pfmerge(*[opener(s) for s in sources], key=lambda t: t[0],
+                         max_open=4)
+        self.assertEqual(opened, [])
+        self.assertEqual(list(merged), self.expected(sources))
+        self.assertEqual(len(opened), 30)
+
+    def testEmpty(self):
+        self.assertEqual(list(pfmerge()), [])
+        self.assertEqual(list(pfmerge([], [], batch=3)), [])
+
+    def testEmptyWithOptions(self):
+        self.assertEqual(list(pfmerge(*[], key=len, reverse=True)), [])
+        self.assertEqual(list(pfmerge(*[], batch=4, max_open=2)), [])
+
+    def testBadArguments(self):
+        self.assertRaises(TypeError, lambda: pfmerge([1], size=3))
+        self.assertRaises(ValueError, lambda: pfmerge([1], max_open=1))
+
+class HelperPfsortCase(TestCase):
+    def items(self, n):
+        import random
+        rng = random.Random(n)
+        return [(rng.randrange(50), i) for i in range(n)]
+
+    def spilled(self, fn):
+        # Runs fn, returning its result and how many spill files it used.
+        real_spill = pointfree_module._spill
+        paths = []
+
+        def spill(iterable):
+            paths.append(real_spill(iterable))
+            return paths[-1]
+
+        pointfree_module._spill = spill
+        try:
+            result = fn()
+        finally:
+            pointfree_module._spill = real_spill
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+        return result, len(paths)
+
+    def testPfsort(self):
+        items = self.items(200)
+        fn = pfsort >> pfcollect
+        self.assertEqual(fn(items), sorted(items))
+
+    def testExternal(self):
+        items = self.items(5000)
+        first = lambda t: t[0]
+        for reverse in (False, True):
+            fn = pfsort(key=first, reverse=reverse, memory_limit=2000) >> pfcollect
+            result, spills = self.spilled(lambda: fn(items))
+            self.assertEqual(result, sorted(items, key=first, reverse=reverse))
+            self.assertTrue(spills > 10)
+
+    def testSingleRun(self):
+        items = self.items(100)
+        fn = pfsort(memory_limit=1 << 20) >> pfcollect
+        result, spills = self.spilled(lambda: fn(items))
+        self.assertEqual(result, sorted(items))
+        self.assertEqual(spills, 0)
+
+    def testManyRuns(self):
+        # More runs than can be merged at once
+        items = self.items(5000)
+        fn = pfsort(memory_limit=1) >> pfcollect
+        result, spills = self.spilled(lambda: fn(items))
+        self.assertEqual(result, sorted(items))
+        self.assertTrue(spills > pointfree_module._SORT_MAX_OPEN)
+
+    def testAbandoned(self):
+        items = self.items(1000)
+
+        def partial_read():
+            sorted_items = pfsort(items, memory_limit=500)
+            head = [next(sorted_items) for i in range(3)]
+            sorted_items.close()
+            return head
+
+        head, spills = self.spilled(partial_read)
+        self.assertEqual(head, sorted(items)[:3])
+        self.assertTrue(spills > 1)
+
+    def testEmpty(self):
+        self.assertEqual(list(pfsort([], memory_limit=100)), [])
+
+class HelperPfgroupbyCase(TestCase):
+    def testPfgroupby(self):
+        fn = pfgroupby(key=lambda n: n % 3) \
+            >> pfmap(lambda group: (group[0], list(group[1]))) \
+            >> pfcollect
+        expected = [(0, [0, 3, 6, 9]), (1, [1, 4, 7]), (2, [2, 5, 8])]
+        self.assertEqual(fn(range(10)), expected)
+        fn = pfgroupby(key=lambda n: n % 3, memory_limit=10) \
+            >> pfmap(lambda group: (group[0], list(group[1]))) \
+            >> pfcollect
+        self.assertEqual(fn(range(10)), expected)
+
+    def testNoKey(self):
+        fn = pfgroupby >> pfmap(lambda group: (group[0], len(list(group[1])))) >> pfcollect
+        self.assertEqual(fn("abracadabra"), [('a', 5), ('b', 2), ('c', 1), ('d', 1), ('r', 2)])
+
+class HelperPfjoinCase(TestCase):
+    def testInner(self):
+        right = [(1, 'a'), (2, 'b'), (2, 'c')]
+        fn = pfjoin(right, left_key=lambda n: n, right_key=lambda r: r[0]) >> pfcollect
+        self.assertEqual(fn([2, 3, 1]), [(2, (2, 'b')), (2, (2, 'c')), (1, (1, 'a'))])
+
+    def testLeft(self):
+        fn = pfjoin(['ab', 'cd'], left_key=lambda s: s[0], how='left') >> pfcollect
+        self.assertEqual(fn(['cx', 'zz', 'ay']),
+                         [('cx', 'cd'), ('zz', None), ('ay', 'ab')])
+
+    def testLazy(self):
+        consumed = []
+
+        def left():
+            for n in range(1000):
+                consumed.append(n)
+                yield n
+
+        joined = pfjoin(range(10), left(), left_key=lambda n: n)
+        self.assertEqual(consumed, [])
+        self.assertEqual(next(joined), (0, 0))
+        self.assertEqual(consumed, [0])
+
+    def testSpill(self):
+        import random
+        rng = random.Random(1)
+        right = [(rng.randrange(300), i) for i in range(2000)]
+        left = [(rng.randrange(400), i) for i in range(3000)]
+        first = lambda t: t[0]
+        for how in ('inner', 'left'):
+            expected = pfjoin(right, left, left_key=first, how=how)
+            fn = pfjoin(right, left_key=first, how=how, memory_limit=1000)
+            self.assertEqual(sorted(fn(left), key=repr), sorted(expected, key=repr))
+
+    def testSpillFilesRemoved(self):
+        import tempfile
+
+        def spill_files():
+            return set(name for name in os.listdir(tempfile.gettempdir())
+                       if name.startswith('pointfree-'))
+
+        before = spill_files()
+        fn = pfjoin(range(5000), left_key=lambda n: n, memory_limit=100) >> pfcount
+        self.assertEqual(fn(range(0, 10000, 2)), 2500)
+        joined = pfjoin(range(5000), range(100), left_key=lambda n: n, memory_limit=100)
+        next(joined)
+        joined.close()
+        self.assertEqual(spill_files(), before)
+
+    def testBadHow(self):
+        self.assertRaises(ValueError, lambda: pfjoin([], [], lambda n: n, how='outer'))
+
+class HelperPfchunkCase(TestCase):
+    def testPfchunk(self):
+        self.assertEqual(list(pfchunk(2, range(5))), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(pfchunk(5, range(5))), [[0, 1, 2, 3, 4]])
+        self.assertEqual(list(pfchunk(2, [])), [])
+
+    def testTuples(self):
+        fn = pfchunk(2, tuples=True) >> pfcollect
+        self.assertEqual(fn("abcde"), [('a', 'b'), ('c', 'd'), ('e',)])
+
+    def testBadSize(self):
+        self.assertRaises(ValueError, lambda: pfchunk(0, range(3)))
+
+class HelperPfwindowCase(TestCase):
+    def windows(self, n, items, step):
+        return [tuple(items[i:i+n]) for i in range(0, len(items) - n + 1, step)]
+
+    def testPfwindow(self):
+        items = list(range(12))
+        for n in (1, 2, 3, 5, 12, 13):
+            for step in (1, 2, 3, 7):
+                self.assertEqual(list(pfwindow(n, items, step=step)),
+                                 self.windows(n, items, step))
+
+    def testViews(self):
+        items = list(range(1000))
+        windows = list(pfwindow(50, items, step=3))
+        self.assertEqual(windows, self.windows(50, items, 3))
+        window = windows[-1]
+        self.assertEqual((len(window), window[0], window[-1]), (50, 948, 997))
+        self.assertEqual(window[1:3], (949, 950))
+        self.assertRaises(IndexError, lambda: window[50])
+        self.assertEqual(hash(window), hash(tuple(range(948, 998))))
+        self.assertEqual(repr(windows[0][:2]), '(0, 1)')
+        self.assertEqual(repr(list(pfwindow(1, [7]))), '[window(7,)]')
+
+    def testLargeWindows(self):
+        # Each window costs constant time however large it is
+        last = None
+        for window in pfwindow(20000, range(60000)):
+            last = window[-1]
+        self.assertEqual(last, 59999)
+
+    def testNoCopy(self):
+        windows = list(pfwindow(3, range(6), copy=False))
+        self.assertEqual(len(windows), 4)
+        self.assertTrue(all(window is windows[0] for window in windows))
+        fn = pfwindow(2, copy=False) >> pfmap(lambda w: w[1] - w[0]) >> pfcollect
+        self.assertEqual(fn([1, 4, 9, 16]), [3, 5, 7])
+
+    def testBadSize(self):
+        # Raised when called, not when first iterated over
+        self.assertRaises(ValueError, lambda: pfwindow(0, range(3)))
+        self.assertRaises(ValueError, lambda: pfwindow(2, range(3), step=0))
+
+class HelperPfpairwiseCase(TestCase):
+    def testPfpairwise(self):
+        self.assertEqual(list(pfpairwise("abc")), [('a', 'b'), ('b', 'c')])
+        self.assertEqual(list(pfpairwise("a")), [])
+        self.assertEqual(list(pfpairwise(iter([]))), [])
+
+class HelperPftumblingCase(TestCase):
+    def testPftumbling(self):
+        fn = pftumbling(10, timestamp=lambda t: t) >> pfcollect
+        self.assertEqual(fn([1, 2, 11, 35, 36]),
+                         [(0, 10, [1, 2]), (10, 20, [11]), (30, 40, [35, 36])])
+
+    def testEmittedOnWatermark(self):
+        emitted = []
+        fn = pftumbling(10, timestamp=lambda t: t, lateness=3)
+
+        def source():
+            for t in [1, 5, 12, 9, 13, 14, 2, 25]:
+                yield t
+                emitted.append((t, len(results)))
+
+        results = []
+        for window in fn(source()):
+            results.append(window)
+        # The first window closes at 13 (watermark 10); the late 2 is dropped
+        self.assertEqual(results, [(0, 10, [1, 5, 9]), (10, 20, [12, 13, 14]),
+                                   (20, 30, [25])])
+        self.assertEqual(emitted[4], (13, 1))
+        self.assertEqual(emitted[3], (9, 0))
+
+    def testUnboundedStream(self):
+        fn = pftumbling(10, timestamp=lambda t: t, aggregate='count') >> pfcollect(n=3)
+        self.assertEqual(fn(itertools.count()), [(0, 10, 10), (10, 20, 10), (20, 30, 10)])
+
+    def testFoldAggregate(self):
+        fn = pftumbling(4, timestamp=lambda e: e[0],
+                        aggregate=FoldAggregator(lambda acc, e: acc * e[1], 1)) >> pfcollect
+        self.assertEqual(fn([(0, 2), (1, 3), (5, 4), (6, 5)]), [(0, 4, 6), (4, 8, 20)])
+
+    def testFloatTimestamps(self):
+        fn = pftumbling(0.5, timestamp=lambda t: t, aggregate='count') >> pfcollect
+        self.assertEqual(fn([0.1, 0.2, 0.7, 1.6]),
+                         [(0.0, 0.5, 2), (0.5, 1.0, 1), (1.5, 2.0, 1)])
+
+    def testBadArguments(self):
+        self.assertRaises(ValueError, lambda: pftumbling(0, [], lambda t: t))
+        self.assertRaises(ValueError, lambda: pftumbling(1, [], lambda t: t, lateness=-1))
+        self.assertRaises(ValueError, lambda: pftumbling(1, [], lambda t: t, aggregate='nope'))
+
+class HelperPfslidingCase(TestCase):
+    def testPfsliding(self):
+        import random
+        rng = random.Random(3)
+        times = sorted(rng.randrange(100) for i in range(200))
+        fn = pfsliding(10, 3, timestamp=lambda t: t, aggregate='count') >> pfcollect
+        expected = []
+        for k in range(-3, 34):
+            count = len([t for t in times if 3 * k <= t < 3 * k + 10])
+            if count:
+                expected.append((3 * k, 3 * k + 10, count))
+        self.assertEqual(fn(times), expected)
+
+    def testGaps(self):
+        # A slide larger than the size leaves gaps between windows
+        fn = pfsliding(2, 5, timestamp=lambda t: t) >> pfcollect
+        self.assertEqual(fn([0, 1, 3, 5, 8]), [(0, 2, [0, 1]), (5, 7, [5])])
+
+class FoldAggregatorCase(TestCase):
+    def testFoldAggregator(self):
+        aggregator = FoldAggregator(operator.add)
+        self.assertIsNone(aggregator.result())
+        aggregator.update([1, 2])
+        other = FoldAggregator(operator.add)
+        other.update([3])
+        aggregator.merge(other)
+        aggregator.merge(FoldAggregator(operator.add))
+        self.assertEqual(aggregator.result(), 6)
+
+    def testInPfaggregate(self):
+        fn = pfaggregate(product=FoldAggregator(operator.mul, 1), items='list')
+        self.assertEqual(fn(range(1, 5)), {'product': 24, 'items': [1, 2, 3, 4]})
+
+    def testNoInitial(self):
+        # The prototype is deep-copied, which must keep it without a value
+        fn = pfaggregate(total=FoldAggregator(operator.add))
+        self.assertEqual(fn(range(1, 5)), {'total': 10})
+        self.assertEqual(fn([]), {'total': None})
+        fn = pftumbling(10, timestamp=lambda n: n,
+                        aggregate=FoldAggregator(operator.add)) >> pfcollect
+        self.assertEqual(fn(range(25)), [(0, 10, 45), (10, 20, 145), (20, 30, 110)])
+        import pickle
+        aggregator = pickle.loads(pickle.dumps(FoldAggregator(max)))
+        self.assertIsNone(aggregator.result())
+
+class HelperPfscanCase(TestCase):
+    def testPfscan(self):
+        fn = pfscan(operator.add) >> pfcollect
+        self.assertEqual(fn(range(5)), [0, 1, 3, 6, 10])
+        self.assertEqual(fn([]), [])
+
+    def testInitial(self):
+        fn = pfscan(operator.mul, initial=1) >> pfcollect
+        self.assertEqual(fn([2, 3, 4]), [1, 2, 6, 24])
+        self.assertEqual(fn([]), [1])
+
+    def testLazy(self):
+        fn = pfscan(operator.add) >> pfcollect(n=3)
+        self.assertEqual(fn(itertools.count()), [0, 1, 3])
+
+class StatsCase(TestCase):
+    def reference(self, items, ddof=0):
+        mean = math.fsum(items) / len(items)
+        variance = math.fsum((x - mean) ** 2 for x in items) / (len(items) - ddof)
+        return len(items), mean, variance, min(items), max(items)
+
+    def assertStats(self, stats, expected):
+        self.assertEqual(stats.count, expected[0])
+        self.assertAlmostEqual(stats.mean, expected[1], delta=abs(expected[1]) * 1e-12)
+        self.assertAlmostEqual(stats.variance, expected[2], delta=expected[2] * 1e-6)
+        self.assertEqual((stats.min, stats.max), expected[3:])
+
+    def items(self):
+        import random
+        rng = random.Random(4)
+        return [rng.gauss(1e9, 1.0) for i in range(5000)]
+
+    def testPfstats(self):
+        items = self.items()
+        self.assertStats(pfstats(items), self.reference(items))
+        self.assertStats(pfstats(items, ddof=1), self.reference(items, 1))
+
+    def testStable(self):
+        # A large offset ruins the naive sum-of-squares formula
+        stats = pfstats(self.items())
+        self.assertTrue(0.9 < stats.variance < 1.1)
+
+    def testEmpty(self):
+        self.assertEqual(pfstats([]), (0, None, None, None, None))
+        self.assertEqual(pfstats([3], ddof=1), (1, 3.0, None, 3, 3))
+
+    def testMerge(self):
+        items = self.items()
+        parts = [StatsAggregator() for i in range(4)]
+        for i, part in enumerate(parts):
+            part.update(items[i * 1000:(i + 1) * 1000 + (i == 3) * 1000])
+        merged = StatsAggregator()
+        for part in parts:
+            merged.merge(part)
+        merged.merge(StatsAggregator())
+        self.assertStats(merged.result(), self.reference(items))
+
+    def testAggregate(self):
+        fn = pfaggregate(stats='stats')
+        self.assertStats(fn([1, 2, 3, 4])['stats'], (4, 2.5, 1.25, 1, 4))
+
+    def testPfrunningStats(self):
+        items = self.items()[:200]
+        results = list(pfrunning_stats(items, ddof=1))
+        self.assertEqual(len(results), 200)
+        self.assertEqual(results[0], (1, items[0], None, items[0], items[0]))
+        for n in (2, 50, 200):
+            self.assertStats(results[n - 1], self.reference(items[:n], 1))
+
+class HelperPftopCase(TestCase):
+    def items(self):
+        import random
+        rng = random.Random(5)
+        return [(rng.randrange(100), i) for i in range(2000)]
+
+    def testPftop(self):
+        items = self.items()
+        first = lambda t: t[0]
+        self.assertEqual(pftop(10, items, key=first),
+                         sorted(items, key=first, reverse=True)[:10])
+        self.assertEqual(pftop(3, iter(items)), sorted(items, reverse=True)[:3])
+        self.assertEqual(pftop(5, [2, 1]), [2, 1])
+
+    def testPfbottom(self):
+        items = self.items()
+        first = lambda t: t[0]
+        self.assertEqual(pfbottom(10, items, key=first), sorted(items, key=first)[:10])
+        self.assertEqual(pfbottom(0, items), [])
+
+class TopKAggregatorCase(TestCase):
+    def testPartitions(self):
+        import random
+        rng = random.Random(6)
+        items = [(rng.randrange(50), i) for i in range(3000)]
+        first = lambda t: t[0]
+        for largest in (True, False):
+            merged = TopKAggregator(20, key=first, largest=largest)
+            for i in range(0, 3000, 700):
+                part = TopKAggregator(20, key=first, largest=largest)
+                for chunk in pfchunk(64, items[i:i+700]):
+                    part.update(chunk)
+                merged.merge(part)
+            self.assertEqual(merged.result(),
+                             sorted(items, key=first, reverse=largest)[:20])
+
+    def testAggregate(self):
+        fn = pfaggregate(top=TopKAggregator(2), bottom=TopKAggregator(2, largest=False))
+        self.assertEqual(fn([5, 1, 9, 3]), {'top': [9, 5], 'bottom': [1, 3]})
+
+class DistinctCountCase(TestCase):
+    def testPfcountDistinct(self):
+        items = ["item %d" % (n % 50000) for n in range(100000)]
+        self.assertTrue(abs(pfcount_distinct(items) - 50000) < 50000 * 0.03)
+
+    def testSmall(self):
+        self.assertEqual(pfcount_distinct([]), 0)
+        self.assertEqual(pfcount_distinct([1, 2, 2, b"1", "1", (1, 2)]), 5)
+
+    def testEqualItems(self):
+        # Equal tuples of distinct but equal strings, which pickle differently
+        s = "ab" * 3
+        items = [(s, s), ("".join(["ab"] * 3), "".join(["ab"] * 3)), (1, 2), (1.0, 2)]
+        self.assertEqual(pfcount_distinct(items), 2)
+
+    def testMerge(self):
+        a, b = DistinctCountAggregator(12), DistinctCountAggregator(12)
+        a.update(list(range(0, 30000)))
+        b.update(list(range(20000, 50000)))
+        union = DistinctCountAggregator(12)
+        union.update(list(range(50000)))
+        a.merge(b)
+        self.assertEqual(a.registers, union.registers)
+        self.assertRaises(ValueError, lambda: a.merge(DistinctCountAggregator(10)))
+
+    def testBadPrecision(self):
+        self.assertRaises(ValueError, lambda: pfcount_distinct([], precision=3))
+
+class QuantilesCase(TestCase):
+    def assertRankError(self, quantile, n, bound):
+        # Items are 0 to n - 1, so an item's value is its rank.
+        for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            self.assertTrue(abs(quantile(q) - q * n) <= bound * n,
+                            "quantile %s: %s" % (q, quantile(q)))
+
+    def testPfquantiles(self):
+        import random
+        items = list(range(20000))
+        random.Random(7).shuffle(items)
+        self.assertRankError(lambda q: pfquantiles([q], items, seed=1)[0], 20000, 0.03)
+
+    def testMerge(self):
+        import random
+        items = list(range(20000))
+        random.Random(8).shuffle(items)
+        merged = QuantilesAggregator(seed=2)
+        for i in range(0, 20000, 5000):
+            part = QuantilesAggregator(seed=i)
+            for chunk in pfchunk(1000, items[i:i+5000]):
+                part.update(chunk)
+            merged.merge(part)
+        self.assertEqual(merged.count, 20000)
+        self.assertTrue(sum(map(len, merged.levels)) < 1000)
+        self.assertRankError(merged.result(), 20000, 0.03)
+
+    def testSmall(self):
+        self.assertEqual(pfquantiles([0, 0.5, 1], [3, 1, 2]), [1, 2, 3])
+        self.assertEqual(pfquantiles([0.5], []), [None])
+
+class SampleCase(TestCase):
+    def testPrototypeCopies(self):
+        # Copies of an unseeded prototype make choices of their own;
+        # copies of a seeded one repeat them
+        import copy
+        for seed, distinct in ((None, True), (3, False)):
+            for prototype in (SampleAggregator(5, seed), QuantilesAggregator(8, seed)):
+                first, second = copy.deepcopy(prototype), copy.deepcopy(prototype)
+                self.assertEqual(first.random.getstate() != second.random.getstate(),
+                                 distinct)
+                self.assertEqual(first.seed, seed)
+
+    def testPfsample(self):
+        sample = pfsample(10, iter(range(100000)), seed=1)
+        self.assertEqual(len(set(sample)), 10)
+        self.assertTrue(all(0 <= n < 100000 for n in sample))
+        self.assertEqual(sorted(pfsample(10, range(5))), [0, 1, 2, 3, 4])
+        self.assertEqual(pfsample(0, range(5)), [])
+
+    def frequencies(self, draw, trials=3000):
+        counts = [0] * 10
+        for trial in range(trials):
+            for n in draw(trial):
+                counts[n] += 1
+        return counts
+
+    def testUniform(self):
+        def draw(trial):
+            aggregator = SampleAggregator(3, seed=trial)
+            for chunk in pfchunk(trial % 4 + 1, range(10)):
+                aggregator.update(chunk)
+            return aggregator.result()
+        # Each of 10 items is expected in 900 of 3000 samples of 3.
+        for count in self.frequencies(draw):
+            self.assertTrue(750 < count < 1050, count)
+
+    def testMergeUniform(self):
+        def draw(trial):
+            left, right = SampleAggregator(3, seed=trial), SampleAggregator(3, seed=-trial)
+            left.update([0, 1])
+            right.update(list(range(2, 10)))
+            left.merge(right)
+            self.assertEqual(left.count, 10)
+            return left.result()
+        for count in self.frequencies(draw):
+            self.assertTrue(750 < count < 1050, count)
+
+    def testUpdateAfterMerge(self):
+        def draw(trial):
+            left, right = SampleAggregator(3, seed=trial), SampleAggregator(3, seed=-trial)
+            left.update([0, 1, 2, 3])
+            right.update([4, 5, 6])
+            left.merge(right)
+            left.update([7, 8, 9])
+            return left.result()
+        for count in self.frequencies(draw):
+            self.assertTrue(750 < count < 1050, count)
+
+class FrequentCase(TestCase):
+    def items(self, n, seed):
+        import random
+        rng = random.Random(seed)
+        return [int(rng.paretovariate(1.2)) for i in range(n)]
+
+    def assertBounds(self, result, items, k):
+        import collections
+        true = collections.Counter(items)
+        slack = len(items) / float(k)
+        for item, count in result:
+            self.assertTrue(true[item] <= count <= true[item] + slack)
+        reported = set(item for item, count in result)
+        for item, count in true.items():
+            if count > slack:
+                self.assertTrue(item in reported)
+
+    def testPffrequent(self):
+        items = self.items(20000, 1)
+        result = pffrequent(20, items)
+        self.assertEqual(len(result), 20)
+        self.assertBounds(result, items, 20)
+        self.assertEqual(result[0][0], 1)
+
+    def testMerge(self):
+        parts = [self.items(5000, seed) for seed in range(4)]
+        merged = FrequentAggregator(10)
+        for part in parts:
+            aggregator = FrequentAggregator(10)
+            for chunk in pfchunk(300, part):
+                aggregator.update(chunk)
+            merged.merge(aggregator)
+        self.assertEqual(merged.total, 20000)
+        self.assertBounds(merged.result(), sum(parts, []), 10)
+
+    def testExact(self):
+        self.assertEqual(pffrequent(10, "hello"), [('l', 2), ('h', 1), ('e', 1), ('o', 1)])
+
+class HelperPfuniqueCase(TestCase):
+    def testExact(self):
+        fn = pfunique >> pfcollect
+        self.assertEqual(fn([3, 1, 3, 2, 1, 4]), [3, 1, 2, 4])
+        fn = pfunique(key=lambda t: t[0]) >> pfcollect
+        self.assertEqual(fn([(1, 'a'), (2, 'b'), (1, 'c')]), [(1, 'a'), (2, 'b')])
+
+    def testLru(self):
+        fn = pfunique(mode='lru', capacity=3) >> pfcollect
+        # Seeing a key again refreshes it
+        self.assertEqual(fn([1, 2, 3, 1, 4, 5, 1, 2]), [1, 2, 3, 4, 5, 2])
+
+    def testBloom(self):
+        fn = pfunique(mode='bloom', capacity=10000, error_rate=0.01) >> pfcollect
+        items = ["key %d" % (n % 10000) for n in range(30000)]
+        result = fn(items)
+        # Never any duplicates, and few keys lost to false positives.
+        self.assertEqual(len(result), len(set(result)))
+        self.assertTrue(len(result) > 10000 * 0.97)
+        self.assertEqual(result[:5], items[:5])
+
+    def testBloomEqualItems(self):
+        s = "ab" * 3
+        items = [(s, s), ("".join(["ab"] * 3), "".join(["ab"] * 3)), [s], ["ab" * 3]]
+        fn = pfunique(mode='bloom', capacity=100) >> pfcollect
+        self.assertEqual(fn(items), [(s, s), [s]])
+
+    def testBloomSize(self):
+        bloom = pointfree_module._BloomFilter(1000000, 0.01)
+        self.assertTrue(1150000 < len(bloom.bits) < 1250000)
+        self.assertEqual(bloom.hashes, 7)
+
+    def testLazy(self):
+        fn = pfunique(mode='bloom', capacity=100) >> pfcollect(n=3)
+        self.assertEqual(fn(itertools.count()), [0, 1, 2])
+
+    def testBadArguments(self):
+        self.assertRaises(ValueError, lambda: pfunique([], mode='fuzzy'))
+        self.assertRaises(ValueError, lambda: pfunique([], mode='lru'))
+        self.assertRaises(ValueError, lambda: pfunique([], mode='bloom', capacity=10,
+                                                       error_rate=0))
+
+class RecordingFile(object):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def writelines(self, lines):
+        self.writes.append(list(lines))
+
+class HelperPfprintAllCase(TestCase):
+    def testUnbuffered(self):
+        out = RecordingFile()
+        pfprint_all([1, "two"], file=out)
+        self.assertEqual(out.writes, ["1", "\n", "two", "\n"])
+
+    def testBuffered(self):
+        out = RecordingFile()
+        pfprint_all(range(10), end=",", file=out, buffer_size=8)
+        self.assertEqual(out.writes, ["0,1,2,3,", "4,5,6,7,", "8,9,"])
+
+    def testFlushOnError(self):
+        out = RecordingFile()
+        fn = pfmap(fail_on_three) >> pfprint_all(file=out, buffer_size=1000)
+        self.assertRaises(ValueError, lambda: fn(range(5)))
+        self.assertEqual(out.writes, ["0\n1\n2\n"])
+
+    def testFailedWrite(self):
+        # Text whose write failed isn't written again on the way out
+        class FailingFile(RecordingFile):
+            def write(self, text):
+                RecordingFile.write(self, text)
+                raise IOError("disk full")
+        out = FailingFile()
+        self.assertRaises(IOError, lambda: pfprint_all(range(10), file=out, buffer_size=4))
+        self.assertEqual(out.writes, ["0\n1\n"])
+
+    def testStdoutAtCallTime(self):
+        import io
+        fn = pfprint_all(buffer_size=100)
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            fn(["foo", "bar"])
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(printed, "foo\nbar\n")
+
+class HelperPfwriteLinesCase(TestCase):
+    def testText(self):
+        import io
+        out = io.StringIO()
+        pfwrite_lines(out, ["a", "b", "c"])
+        self.assertEqual(out.getvalue(), "a\nb\nc\n")
+
+    def testBinary(self):
+        import io
+        out = io.BytesIO()
+        fn = pfmap(lambda n: str(n).encode('ascii')) >> pfwrite_lines(out, end=b"\r\n")
+        fn(range(3))
+        self.assertEqual(out.getvalue(), b"0\r\n1\r\n2\r\n")
+
+    def testChunks(self):
+        out = RecordingFile()
+        pfwrite_lines(out, iter(["a", "b", "c"]), chunksize=2)
+        self.assertEqual(out.writes, [["a\nb", "\n"], ["c", "\n"]])
+        out = RecordingFile()
+        pfwrite_lines(out, [])
+        self.assertEqual(out.writes, [])
+
+class HelperPfreadLinesCase(TestCase):
+    def setUp(self):
+        import tempfile
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def read(self, **kargs):
+        return [bytes(line) if isinstance(line, memoryview) else line
+                for line in pfread_lines(self.path, **kargs)]
+
+    def testModes(self):
+        self.write(u"caf\u00e9\r\nbar\n\nbaz".encode('utf-8'))
+        for mmap in (True, False):
+            self.assertEqual(self.read(mmap=mmap), [u"caf\u00e9", "bar", "", "baz"])
+            self.assertEqual(self.read(mmap=mmap, mode='bytes'),
+                             [u"caf\u00e9".encode('utf-8'), b"bar", b"", b"baz"])
+            self.assertEqual(self.read(mmap=mmap, mode='view'),
+                             [u"caf\u00e9".encode('utf-8'), b"bar", b"", b"baz"])
+            self.assertEqual(self.read(mmap=mmap, mode='bytes', keepends=True),
+                             [u"caf\u00e9\r\n".encode('utf-8'), b"bar\n", b"\n", b"baz"])
+            self.assertEqual(self.read(mmap=mmap, mode='view', keepends=True),
+                             [u"caf\u00e9\r\n".encode('utf-8'), b"bar\n", b"\n", b"baz"])
+
+    def testBlocks(self):
+        # Lines straddling block boundaries, with and without mmap
+        import random
+        rng = random.Random(9)
+        lines = ["x" * rng.randrange(200) for i in range(3000)]
+        self.write(("\n".join(lines) + "\n").encode('ascii'))
+        block = pointfree_module._READ_BLOCK
+        pointfree_module._READ_BLOCK = 1000
+        try:
+            for mmap in (True, False):
+                for mode in ('text', 'bytes', 'view'):
+                    result = self.read(mmap=mmap, mode=mode)
+                    if mode != 'text':
+                        result = [line.decode('ascii') for line in result]
+                    self.assertEqual(result, lines)
+        finally:
+            pointfree_module._READ_BLOCK = block
+
+    def testBatch(self):
+        self.write(b"".join(b"%d\n" % n for n in range(10)))
+        fn = pfread_lines(batch=4) >> pfcollect
+        self.assertEqual(fn(self.path), [["0", "1", "2", "3"], ["4", "5", "6", "7"], ["8", "9"]])
+        rebatch = pointfree_module._rebatch
+        self.assertEqual(list(rebatch([[1, 2], [3], [4, 5, 6, 7, 8], []], 3)),
+                         [[1, 2, 3], [4, 5, 6], [7, 8]])
+
+    def testEmpty(self):
+        self.write(b"")
+        self.assertEqual(self.read(), [])
+        self.assertEqual(self.read(mmap=False), [])
+
+    def testPipeline(self):
+        self.write(b"a 1\nb 2\nc 3\n")
+        fn = pfread_lines >> pfmap(lambda line: int(line.split()[1])) >> pfsum
+        self.assertEqual(fn(self.path), 6)
+
+    def testBadMode(self):
+        self.assertRaises(ValueError, lambda: pfread_lines(self.path, mode='lines'))
+
+class HelperPfreadShardedCase(TestCase):
+    def setUp(self):
+        import tempfile
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, lines, trailing=True):
+        with open(self.path, 'w') as f:
+            f.write("\n".join(lines) + ("\n" if trailing else ""))
+
+    def testRanges(self):
+        self.write(["x" * (n % 37) for n in range(500)], trailing=False)
+        ranges = pointfree_module._shard_ranges(self.path, 7)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1:end], b"\n")
+        lines = []
+        for start, end in ranges:
+            lines.extend(pfread_lines(self.path, start=start, end=end))
+        self.assertEqual(lines, ["x" * (n % 37) for n in range(500)])
+
+    def testOrdered(self):
+        lines = [str(n) for n in range(5000)]
+        self.write(lines)
+        for executor in ('process', 'thread'):
+            fn = pfread_sharded(pipeline=pfmap(int), shards=4, executor=executor,
+                                batch=100) >> pfcollect
+            self.assertEqual(fn(self.path), list(range(5000)))
+
+    def testUnordered(self):
+        self.write([str(n) for n in range(5000)])
+        fn = pfread_sharded(pipeline=pfmap(int), shards=4, ordered=False, batch=100) \
+            >> pfcollect
+        self.assertEqual(sorted(fn(self.path)), list(range(5000)))
+
+    def testSinkPipeline(self):
+        self.write([str(n) for n in range(100)])
+        fn = pfread_sharded(pipeline=pfmap(int) >> pfcount, shards=3) >> pfcollect
+        counts = fn(self.path)
+        self.assertEqual(len(counts), 3)
+        self.assertEqual(sum(counts), 100)
+
+    def testSmallFile(self):
+        self.write(["only"])
+        fn = pfread_sharded(pipeline=pfmap(str.upper), shards=8) >> pfcollect
+        self.assertEqual(fn(self.path), ["ONLY"])
+        self.write([], trailing=False)
+        self.assertEqual(fn(self.path), [])
+
+    def testError(self):
+        self.write([str(n) for n in range(100)])
+        for executor in ('process', 'thread'):
+            fn = pfread_sharded(pipeline=pfmap(int) >> pfmap(fail_on_three),
+                                shards=2, executor=executor) >> pfcollect
+            self.assertRaises(ValueError, lambda: fn(self.path))
+
+    def testDeadWorker(self):
+        self.write([str(n) for n in range(100)])
+        for ordered in (True, False):
+            fn = pfread_sharded(pipeline=exit_stage, shards=2, ordered=ordered) >> pfcollect
+            self.assertRaises(RuntimeError, lambda: fn(self.path))
+
+    def testUnpicklableResults(self):
+        import pickle
+        self.write([str(n) for n in range(100)])
+        for ordered in (True, False):
+            fn = pfread_sharded(pipeline=pfmap(lambda line: (lambda: line)), shards=2,
+                                ordered=ordered) >> pfcollect
+            self.assertRaises((pickle.PicklingError, AttributeError, TypeError),
+                              lambda: fn(self.path))
+
+    def testEarlyClose(self):
+        import tempfile
+
+        def spill_files():
+            return set(name for name in os.listdir(tempfile.gettempdir())
+                       if name.startswith('pointfree-'))
+
+        self.write([str(n) for n in range(20000)])
+        before = spill_files()
+        for executor in ('process', 'thread'):
+            results = pfread_sharded(self.path, pfmap(int), shards=4, executor=executor,
+                                     batch=10)
+            self.assertEqual([next(results) for i in range(5)], list(range(5)))
+            results.close()
+        self.assertEqual(spill_files(), before)
+
+    def testBadArguments(self):
+        self.assertRaises(ValueError, lambda: pfread_sharded(self.path, pfcount,
+                                                             executor='fork'))
+        self.assertRaises(ValueError, lambda: pfread_sharded(self.path, pfcount,
+                                                             mode='view'))
+
+class HelperPfrecordsCase(TestCase):
+    def setUp(self):
+        import struct, tempfile
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b"HDR!")
+            for n in range(1000):
+                f.write(struct.pack("<iHd", -n, n % 7, n / 2.0))
+            f.write(b"partial")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def expected(self, start=0, stop=1000):
+        return [(-n, n % 7, n / 2.0) for n in range(start, stop)]
+
+    def testPfrecords(self):
+        fn = pfrecords(struct_format="<iHd", offset=4) >> pfcollect
+        self.assertEqual(fn(self.path), self.expected())
+
+    def testOffsetLimit(self):
+        # Shards by record ranges
+        records = []
+        for shard in range(3):
+            records.extend(pfrecords(self.path, "<iHd", offset=4 + shard * 400 * 14,
+                                     limit=400))
+        self.assertEqual(records, self.expected())
+        self.assertEqual(list(pfrecords(self.path, "<iHd", offset=1 << 20)), [])
+
+    def testMapClosed(self):
+        if not os.path.exists('/proc/self/maps'):
+            self.skipTest("needs /proc/self/maps")
+        def mapped():
+            with open('/proc/self/maps') as f:
+                return self.path in f.read()
+
+        for batch in (None, 10):
+            records = pfrecords(self.path, "<iHd", offset=4, batch=batch)
+            next(records)
+            self.assertTrue(mapped())
+            records.close()
+            self.assertFalse(mapped())
+            list(pfrecords(self.path, "<iHd", offset=4, batch=batch))
+            self.assertFalse(mapped())
+
+    def testBatch(self):
+        batches = list(pfrecords(self.path, "<iHd", offset=4, batch=300))
+        self.assertEqual([len(batch) for batch in batches], [300, 300, 300, 100])
+        self.assertEqual(sum(batches, []), self.expected())
+
+    def testArrayColumns(self):
+        import array
+        batches = list(pfrecords(self.path, "<iHd", offset=4, limit=10, output='array'))
+        self.assertEqual(len(batches), 1)
+        ints, shorts, doubles = batches[0]
+        self.assertIsInstance(doubles, array.array)
+        self.assertEqual(list(ints), [-n for n in range(10)])
+        self.assertEqual(list(shorts), [n % 7 for n in range(10)])
+        self.assertEqual(list(doubles), [n / 2.0 for n in range(10)])
+
+    def testDtype(self):
+        spec = pointfree_module._struct_dtype("<iHd")
+        self.assertEqual(spec, {'names': ['f0', 'f1', 'f2'],
+                                'formats': ['<i4', '<u2', '<f8'],
+                                'offsets': [0, 4, 6], 'itemsize': 14})
+        # Native alignment pads fields to their natural boundaries
+        spec = pointfree_module._struct_dtype("Hd")
+        self.assertEqual(spec['offsets'], [0, 8])
+        self.assertEqual(spec['itemsize'], 16)
+        spec = pointfree_module._struct_dtype(">3sx2h")
+        self.assertEqual(spec['formats'], ['S3', '>i2', '>i2'])
+        self.assertEqual(spec['offsets'], [0, 4, 6])
+        self.assertRaises(ValueError, lambda: pointfree_module._struct_dtype("P"))
+
+    def testNumpy(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        batches = list(pfrecords(self.path, "<iHd", offset=4, batch=400, output='numpy'))
+        self.assertEqual([len(batch) for batch in batches], [400, 400, 200])
+        self.assertEqual([tuple(record) for batch in batches for record in batch],
+                         self.expected())
+
+    def testBadOutput(self):
+        self.assertRaises(ValueError, lambda: pfrecords(self.path, "<i", output='pandas'))
+
+class BytesStagesCase(TestCase):
+    lines = [b"a,b,,c", b"", b"x", b",y,", b"  one  two\tthree\n"]
+
+    def views(self):
+        # memoryview lines, as read by pfread_lines in 'view' mode
+        buf = b"|".join(self.lines)
+        view = memoryview(buf)
+        lines, pos = [], 0
+        for line in self.lines:
+            lines.append(view[pos:pos + len(line)])
+            pos += len(line) + 1
+        return lines
+
+    def testPfsplitBytes(self):
+        for sep in (b",", b",,", None):
+            for maxsplit in (-1, 0, 1, 2):
+                expected = [line.split(sep, maxsplit) for line in self.lines]
+                self.assertEqual(list(pfsplit_bytes(self.lines, sep, maxsplit)), expected)
+                result = list(pfsplit_bytes(self.views(), sep, maxsplit))
+                self.assertTrue(all(isinstance(field, memoryview)
+                                    for fields in result for field in fields))
+                self.assertEqual([[bytes(field) for field in fields] for fields in result],
+                                 expected)
+        self.assertRaises(ValueError, lambda: list(pfsplit_bytes([b"a"], b"")))
+
+    def testPffields(self):
+        lines = [b"GET /a 200 12", b"POST /b 302 0 extra"]
+        fn = pffields(b" ", (2, 0)) >> pfcollect
+        self.assertEqual(fn(lines), [(b"200", b"GET"), (b"302", b"POST")])
+        views = [memoryview(line) for line in lines]
+        result = fn(views)
+        self.assertIsInstance(result[0][0], memoryview)
+        self.assertEqual([tuple(map(bytes, fields)) for fields in result],
+                         [(b"200", b"GET"), (b"302", b"POST")])
+        fn = pffields(None, 3) >> pfmap(bytes) >> pfcollect
+        self.assertEqual(fn(views), [b"12", b"0"])
+
+    def testPffieldsMissing(self):
+        self.assertRaises(IndexError, lambda: list(pffields(b",", 2, [b"a,b"])))
+        self.assertRaises(IndexError, lambda: list(pffields(b",", 2, [memoryview(b"a,b")])))
+        self.assertRaises(ValueError, lambda: pffields(b",", -1, []))
+        self.assertRaises(ValueError, lambda: pffields(b",", (), []))
+
+    def testPfstripBytes(self):
+        values = [b"  a ", b"", b"\t\n", b"xx-yx", memoryview(b" b\t"), memoryview(b"   ")]
+        result = [bytes(value) for value in pfstrip_bytes(values)]
+        self.assertEqual(result, [b"a", b"", b"", b"xx-yx", b"b", b""])
+        fn = pfstrip_bytes(chars=b"xy") >> pfmap(bytes) >> pfcollect
+        self.assertEqual(fn([b"xx-yx", memoryview(b"xx-yx")]), [b"-", b"-"])
+
+    def testPfdecode(self):
+        fn = pfdecode >> pfcollect
+        self.assertEqual(fn([b"caf\xc3\xa9", memoryview(b"ok"), [b"a", b"b"], (b"c",)]),
+                         [u"caf\u00e9", "ok", ["a", "b"], ("c",)])
+        fn = pfdecode(encoding='ascii', errors='replace') >> pfcollect
+        self.assertEqual(fn([b"caf\xc3"]), [u"caf\ufffd"])
+
+class CompressionCase(TestCase):
+    data = b"".join(b"%d,record number %d\n" % (i, i * i) for i in range(20000))
+
+    def chunks(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def testRoundTrip(self):
+        for format in ('gzip', 'zlib', 'bz2', 'xz', 'lzma'):
+            fn = pfcompress(format, block_size=4096) \
+                >> pfdecompress(format, block_size=1000) >> pfcollect
+            blocks = fn(self.chunks(self.data, 777))
+            self.assertTrue(all(0 < len(block) <= 1000 for block in blocks))
+            self.assertEqual(b"".join(blocks), self.data)
+
+    def testStdlibFormats(self):
+        import bz2, gzip, lzma, zlib
+        for format, compress, decompress in [
+                ('gzip', gzip.compress, gzip.decompress),
+                ('zlib', zlib.compress, zlib.decompress),
+                ('bz2', bz2.compress, bz2.decompress),
+                ('xz', lzma.compress, lzma.decompress)]:
+            compressed = b"".join(pfcompress(format, self.chunks(self.data, 5000)))
+            self.assertEqual(decompress(compressed), self.data)
+            blocks = pfdecompress(format, self.chunks(compress(self.data), 13))
+            self.assertEqual(b"".join(blocks), self.data)
+            if format != 'zlib':
+                blocks = pfdecompress('auto', [compress(self.data)])
+                self.assertEqual(b"".join(blocks), self.data)
+
+    def testSources(self):
+        import gzip, io, tempfile
+        compressed = gzip.compress(self.data)
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            self.assertEqual(b"".join(pfdecompress('gzip', path, block_size=512)), self.data)
+            with open(path, 'rb') as f:
+                self.assertEqual(b"".join(pfdecompress('auto', f)), self.data)
+        finally:
+            os.remove(path)
+        self.assertEqual(b"".join(pfdecompress('gzip', io.BytesIO(compressed))), self.data)
+
+    def testAutoSmallChunks(self):
+        import bz2, gzip, lzma
+        for compress in (gzip.compress, bz2.compress, lzma.compress):
+            data = self.data[:2000]
+            compressed = compress(data) + compress(b"tail")
+            for size in (1, 2, 5):
+                blocks = pfdecompress('auto', self.chunks(compressed, size))
+                self.assertEqual(b"".join(blocks), data + b"tail")
+        self.assertRaises(ValueError, lambda: list(pfdecompress('auto', [b"\x1f"])))
+
+    def testBytesSource(self):
+        import gzip
+        compressed = gzip.compress(self.data)
+        for source in (compressed, bytearray(compressed), memoryview(compressed)):
+            self.assertEqual(b"".join(pfdecompress('auto', source)), self.data)
+        self.assertEqual(list(pfdecompress('gzip', b"")), [])
+
+    def testMultipleMembers(self):
+        import gzip
+        compressed = gzip.compress(b"one\ntwo\n") + gzip.compress(b"three\n")
+        for size in (1, 7, len(compressed)):
+            fn = pfdecompress('gzip') >> pfsplit_lines >> pfcollect
+            self.assertEqual(fn(self.chunks(compressed, size)), [b"one", b"two", b"three"])
+
+    def testBoundedOutput(self):
+        compressed = b"".join(pfcompress('xz', [b"\0" * (1 << 22)]))
+        blocks = list(pfdecompress('xz', [compressed], block_size=1 << 16))
+        self.assertEqual(len(blocks), 64)
+        self.assertEqual(sum(map(len, blocks)), 1 << 22)
+
+    def testPrefetch(self):
+        compressed = b"".join(pfcompress('gzip', [self.data]))
+        blocks = pfdecompress('gzip', self.chunks(compressed, 1000), block_size=4096,
+                              prefetch=4)
+        self.assertEqual(b"".join(blocks), self.data)
+        blocks = pfdecompress('gzip', [compressed], block_size=4096, prefetch=2)
+        self.assertEqual(len(next(blocks)), 4096)
+        blocks.close()
+
+    def testErrors(self):
+        import gzip
+        compressed = gzip.compress(self.data)
+        for prefetch in (0, 2):
+            blocks = pfdecompress('gzip', [compressed[:-20]], prefetch=prefetch)
+            self.assertRaises(EOFError, lambda: list(blocks))
+        self.assertRaises(ValueError, lambda: list(pfdecompress('auto', [b"plain text"])))
+        self.assertRaises(ValueError, lambda: pfdecompress('rar', []))
+        self.assertRaises(ValueError, lambda: pfcompress('auto', []))
+
+class PfsplitLinesCase(TestCase):
+    def testPfsplitLines(self):
+        data = b"a\r\nbb\n\nccc\r\ndddd"
+        expected = [b"a", b"bb", b"", b"ccc", b"dddd"]
+        for size in range(1, len(data) + 1):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(list(pfsplit_lines(chunks)), expected)
+            self.assertEqual(list(pfsplit_lines(chunks, keepends=True)),
+                             data.splitlines(True))
+        self.assertEqual(list(pfsplit_lines(["x\ny", "\n"])), ["x", "y"])
+        self.assertEqual(list(pfsplit_lines([b"", b"x\n", b""])), [b"x"])
+
+    def testBytesLike(self):
+        blocks = [bytearray(b"a\r\nb"), memoryview(b"b\nc"), b"\r\n"]
+        self.assertEqual(list(pfsplit_lines(blocks)), [b"a", b"bb", b"c"])
+        self.assertEqual(list(pfsplit_lines(blocks, keepends=True)),
+                         [b"a\r\n", b"bb\n", b"c\r\n"])
 
 ### PYTHON 3 KEYWORD-ONLY ARGS TESTS ######################################
 
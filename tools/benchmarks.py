@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# Rough wall-clock benchmarks for pointfree's parallel and streaming
+# helpers.  Run with the names of the benchmarks to run as arguments, or
+# with no arguments to run them all:
+#
+#     python tools/benchmarks.py staged
+#
+# The numbers are only meaningful relative to each other on the same
+# machine; parallel helpers can't beat the baselines on a single core.
+
+from __future__ import print_function
+
+import os, sys, tempfile, time
+from os.path import realpath, join, dirname
+
+project_path = realpath(join(dirname(__file__), '..'))
+
+sys.path = [project_path] + sys.path
+from pointfree import *
+
+def timed(label, fn, *args):
+    start = time.time()
+    result = fn(*args)
+    elapsed = time.time() - start
+    print("  %-40s %8.3f s" % (label, elapsed))
+    return result
+
+def spin(n, rounds=200):
+    """A CPU-bound stage body: some pointless integer arithmetic."""
+
+    for i in range(rounds):
+        n = (n * 1103515245 + 12345) & 0x7fffffff
+    return n
+
+def bench_staged():
+    """Four CPU-bound pfmap stages, in one process and split into one
+    worker process per stage with pfstaged."""
+
+    print("staged: 4 CPU-bound stages over 20000 items")
+    stages = [pfmap(spin) for i in range(4)]
+
+    single = stages[0] >> stages[1] >> stages[2] >> stages[3] >> pfsum
+    multi = pfstaged(stages) >> pfsum
+
+    expected = timed("single process", single, range(20000))
+    result = timed("pfstaged, 4 processes", multi, range(20000))
+    assert result == expected
+
+def bench_threads():
+    """A CPU-bound pfmap with 1 to 16 threads.  Only free-threaded builds
+    of CPython can be expected to scale."""
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print("threads: CPU-bound pfmap over 20000 items (GIL %s)"
+          % ("enabled" if gil else "disabled"))
+
+    baseline = timed("pfmap, no threads", pfmap(spin) >> pfsum, range(20000))
+    for workers in (1, 2, 4, 8, 16):
+        fn = pfmap(spin, workers=workers) >> pfsum
+        result = timed("pfmap, %d threads" % workers, fn, range(20000))
+        assert result == baseline
+
+def bench_incremental():
+    """Re-running a pipeline over a dataset with a few changed records,
+    from scratch and with IncrementalPipeline."""
+
+    n = 20000
+    print("incremental: pfmap/pffilter/sum over %d records" % n)
+    pipeline = pfmap(lambda r: spin(r[1], 20)) >> pffilter(lambda v: v % 2)
+    records = [(k, k) for k in range(n)]
+
+    inc = IncrementalPipeline(pipeline, key=lambda r: r[0],
+                              aggregates={'total': 'sum'})
+    timed("initial load", inc.upsert, records)
+    full = timed("full recompute", pipeline >> pfsum, records)
+    assert inc.aggregates()['total'] == full
+
+    for changes in (10, 100, 1000):
+        changed = [(k, k + 1) for k in range(0, n, n // changes)]
+        timed("upsert of %d changed records" % changes, inc.upsert, changed)
+        for k, v in changed:
+            records[k] = (k, v)
+    timed("snapshot update, no changes", inc.update, records)
+    assert inc.aggregates()['total'] == (pipeline >> pfsum)(records)
+
+def bench_sharded():
+    """Lines per second through a CPU-bound pipeline over a file, read by a
+    single pfread_lines and by pfread_sharded with 1 to 8 shards."""
+
+    n = 400000
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'w') as f:
+        for i in range(n):
+            f.write("2011-11-14 00:19:27 GET /item/%d 200\n" % i)
+
+    print("sharded: %d lines through a CPU-bound pfmap" % n)
+    pipeline = pfmap(lambda line: spin(len(line), 20)) >> pfsum
+    try:
+        start = time.time()
+        expected = (pfread_lines >> pipeline)(path)
+        elapsed = time.time() - start
+        print("  %-40s %8.0f lines/s" % ("pfread_lines, one reader", n / elapsed))
+        for shards in (1, 2, 4, 8):
+            fn = pfread_sharded(pipeline=pipeline, shards=shards) >> pfsum
+            start = time.time()
+            result = fn(path)
+            elapsed = time.time() - start
+            print("  %-40s %8.0f lines/s" % ("pfread_sharded, %d shards" % shards,
+                                             n / elapsed))
+            assert result == expected
+    finally:
+        os.remove(path)
+
+BENCHMARKS = [
+    ('staged', bench_staged),
+    ('threads', bench_threads),
+    ('incremental', bench_incremental),
+    ('sharded', bench_sharded),
+    ]
+
+if __name__ == '__main__':
+    selected = set(sys.argv[1:])
+    for name, bench in BENCHMARKS:
+        if not selected or name in selected:
+            bench()